@@ -0,0 +1,209 @@
+"""Generate and serve a synthetic package index for benchmarking the canary.
+
+The index is a static tree that answers both the simple repository API pip
+uses and the JSON API the canary uses to look up versions:
+
+    simple/<name>/index.html
+    pypi/<name>/json
+    pypi/<name>/<version>/json
+    files/<distribution files>
+
+Top level packages cycle through four kinds: pure python wheels, binary
+manylinux wheels, sdists only, and pure python wheels that depend on a chain
+of libraries.  The libraries are shared between packages so that caching
+across checks has something to find.
+"""
+import io
+import os
+import json
+import base64
+import hashlib
+import tarfile
+import zipfile
+import threading
+from socketserver import ThreadingMixIn
+from http.server import HTTPServer
+from http.server import SimpleHTTPRequestHandler
+
+
+PURE, BINARY, SDIST, DEEP = 'pure', 'binary', 'sdist', 'deep'
+KINDS = [PURE, BINARY, SDIST, DEEP]
+VERSION = '1.0.0'
+# Fixed so the generated index is reproducible, zip files cannot represent
+# anything before 1980.
+_MTIME = 1577836800
+
+
+class FakeIndex(object):
+    """A generated index under ``root`` for ``count`` top level packages.
+
+    ``python_tag`` and ``abi`` are the tags of the binary wheels, they have
+    to match the runtime chalice packages for.  ``chalice_version`` is what
+    the JSON API reports as the latest chalice release, so the canary uses
+    an environment that already exists instead of trying to install chalice
+    from this index.
+    """
+    def __init__(self, root, count, python_tag, abi, chalice_version,
+                 libraries=25, depth=5):
+        self.root = root
+        self.count = count
+        self._python_tag = python_tag
+        self._abi = abi
+        self._chalice_version = chalice_version
+        self._libraries = libraries
+        self._depth = depth
+
+    def package_names(self):
+        return ['benchpkg%s' % i for i in range(self.count)]
+
+    def generate(self):
+        for i in range(self._libraries):
+            requires = []
+            if (i + 1) % self._depth:
+                requires = [_library_name(i + 1)]
+            self._add_wheel(_library_name(i), requires)
+        for i, name in enumerate(self.package_names()):
+            kind = KINDS[i % len(KINDS)]
+            if kind == PURE:
+                self._add_wheel(name)
+            elif kind == BINARY:
+                self._add_wheel(name, binary=True)
+            elif kind == SDIST:
+                self._add_sdist(name)
+            else:
+                head = (i * self._depth) % self._libraries
+                head -= head % self._depth
+                self._add_wheel(name, [_library_name(head)])
+        self._add_project('chalice', self._chalice_version, [], [])
+
+    def _add_wheel(self, name, requires=(), binary=False):
+        if binary:
+            tag = '%s-%s-manylinux1_x86_64' % (self._python_tag, self._abi)
+        else:
+            tag = 'py2.py3-none-any'
+        filename = '%s-%s-%s.whl' % (name, VERSION, tag)
+        dist_info = '%s-%s.dist-info' % (name, VERSION)
+        files = [('%s/__init__.py' % name, b'VERSION = %r\n' % VERSION)]
+        if binary:
+            payload = hashlib.sha256(name.encode('utf-8')).digest() * 2048
+            files.append(('%s/_speedups.so' % name, payload))
+        metadata = ['Metadata-Version: 2.1', 'Name: %s' % name,
+                    'Version: %s' % VERSION]
+        metadata.extend('Requires-Dist: %s' % r for r in requires)
+        files.append(('%s/METADATA' % dist_info,
+                      ('\n'.join(metadata) + '\n').encode('utf-8')))
+        files.append(('%s/WHEEL' % dist_info, (
+            'Wheel-Version: 1.0\nGenerator: fakeindex\n'
+            'Root-Is-Purelib: %s\nTag: %s\n'
+            % ('false' if binary else 'true', tag)).encode('utf-8')))
+        record = ['%s,%s,%s' % (path, _record_hash(content), len(content))
+                  for path, content in files]
+        record.append('%s/RECORD,,' % dist_info)
+        files.append(('%s/RECORD' % dist_info,
+                      ('\n'.join(record) + '\n').encode('utf-8')))
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+            for path, content in files:
+                z.writestr(path, content)
+        self._add_file(filename, buf.getvalue())
+        self._add_project(name, VERSION, [filename], requires)
+
+    def _add_sdist(self, name):
+        base = '%s-%s' % (name, VERSION)
+        setup_py = (
+            'from setuptools import setup\n'
+            'setup(name=%r, version=%r, packages=[%r])\n'
+            % (name, VERSION, name)).encode('utf-8')
+        pkg_info = ('Metadata-Version: 1.1\nName: %s\nVersion: %s\n'
+                    % (name, VERSION)).encode('utf-8')
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w:gz') as tar:
+            for path, content in [('setup.py', setup_py),
+                                  ('PKG-INFO', pkg_info),
+                                  ('%s/__init__.py' % name, b'')]:
+                info = tarfile.TarInfo('%s/%s' % (base, path))
+                info.size = len(content)
+                info.mtime = _MTIME
+                tar.addfile(info, io.BytesIO(content))
+        filename = '%s.tar.gz' % base
+        self._add_file(filename, buf.getvalue())
+        self._add_project(name, VERSION, [filename], [])
+
+    def _add_file(self, filename, content):
+        files_dir = os.path.join(self.root, 'files')
+        os.makedirs(files_dir, exist_ok=True)
+        with open(os.path.join(files_dir, filename), 'wb') as f:
+            f.write(content)
+
+    def _add_project(self, name, version, filenames, requires):
+        simple_dir = os.path.join(self.root, 'simple', name)
+        os.makedirs(simple_dir, exist_ok=True)
+        links = ''.join(
+            '<a href="../../files/%s#sha256=%s">%s</a>\n'
+            % (filename, self._sha256(filename), filename)
+            for filename in filenames)
+        with open(os.path.join(simple_dir, 'index.html'), 'w') as f:
+            f.write('<html><body>\n%s</body></html>\n' % links)
+        document = {
+            'info': {'name': name, 'version': version,
+                     'requires_dist': list(requires)},
+            'releases': {version: [{'filename': filename}
+                                   for filename in filenames]},
+        }
+        for json_dir in [os.path.join(self.root, 'pypi', name),
+                         os.path.join(self.root, 'pypi', name, version)]:
+            os.makedirs(json_dir, exist_ok=True)
+            with open(os.path.join(json_dir, 'json'), 'w') as f:
+                json.dump(document, f)
+
+    def _sha256(self, filename):
+        with open(os.path.join(self.root, 'files', filename), 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+
+class IndexServer(object):
+    """Serve a generated index over HTTP on a free local port."""
+    def __init__(self, root):
+        handler = _handler_for(root)
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%s' % self._server.server_address[1]
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _handler_for(root):
+    class Handler(SimpleHTTPRequestHandler):
+        def translate_path(self, path):
+            path = path.split('?', 1)[0].split('#', 1)[0]
+            parts = [part for part in path.split('/')
+                     if part and part not in ('.', '..')]
+            return os.path.join(root, *parts)
+
+        def log_message(self, format, *args):
+            pass
+    return Handler
+
+
+def _library_name(i):
+    return 'benchlib%s' % i
+
+
+def _record_hash(content):
+    digest = hashlib.sha256(content).digest()
+    return 'sha256=%s' % base64.urlsafe_b64encode(digest).rstrip(
+        b'=').decode('ascii')
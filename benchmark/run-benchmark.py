@@ -0,0 +1,206 @@
+"""Measure how the canary scales with the size of the package list.
+
+Every run checks a package list generated by ``fakeindex.py`` and served
+from a local index, so the numbers do not depend on PyPI.  Only the chalice
+environment is built from the real index, once, before anything is measured.
+Each size runs in its own process, with a fresh results file so nothing is
+skipped, and reports:
+
+* wall time of the whole run,
+* peak RSS of the canary or any process it waited on,
+* peak disk usage of its temp directory, sampled while it runs,
+* number of processes started while it runs (counted from the PID
+  namespace, so anything else starting processes at the same time is
+  included).
+
+The canary's own environment variables, such as ``CANARY_ENGINE``,
+``CANARY_MAX_WORKERS`` or ``CANARY_SHARD_SIZE``, are passed through.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+from subprocess import PIPE
+
+from fakeindex import FakeIndex
+from fakeindex import IndexServer
+
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_CANARY_DIR = os.path.join(_ROOT, 'canary')
+sys.path.insert(0, _CANARY_DIR)
+
+from chalicelib import proc  # noqa: E402
+from chalicelib.matrix import runtime_abi  # noqa: E402
+from chalicelib.matrix import runtime_python_tag  # noqa: E402
+
+_LAST_PID = '/proc/sys/kernel/ns_last_pid'
+_SAMPLE_INTERVAL = 0.25
+
+
+def run_benchmark(args):
+    workdir = tempfile.mkdtemp(prefix='canary-benchmark-')
+    try:
+        env_dir = args.env_dir or os.path.join(workdir, 'env')
+        chalice_version = _prepare_environment(env_dir, args.chalice_version)
+        runtime = 'python%s.%s' % sys.version_info[:2]
+        reports = []
+        for size in args.sizes:
+            index = FakeIndex(os.path.join(workdir, 'index-%s' % size), size,
+                              runtime_python_tag(runtime),
+                              runtime_abi(runtime), chalice_version)
+            index.generate()
+            with IndexServer(index.root) as server:
+                report = _run_size(os.path.join(workdir, 'run-%s' % size),
+                                   index, server.url, env_dir)
+            reports.append(report)
+            _print_report(report)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(reports, f, indent=2)
+    finally:
+        if args.keep:
+            print('Kept %s' % workdir)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _prepare_environment(env_dir, chalice_version):
+    env = dict(os.environ, CANARY_ENV_DIR=env_dir)
+    command = [sys.executable, os.path.abspath(__file__), '--child',
+               'prepare']
+    if chalice_version:
+        command.append(chalice_version)
+    p, _ = proc.run(command, env=env, stdout=PIPE)
+    if p.returncode != 0:
+        raise RuntimeError('Unable to prepare the chalice environment')
+    return p.stdout.decode('utf-8').strip().splitlines()[-1]
+
+
+def _run_size(run_dir, index, index_url, env_dir):
+    tmp_dir = os.path.join(run_dir, 'tmp')
+    os.makedirs(tmp_dir)
+    package_file = os.path.join(run_dir, 'packages.json')
+    with open(package_file, 'w') as f:
+        json.dump(index.package_names(), f)
+    results_file = os.path.join(run_dir, 'results.json')
+    env = dict(
+        os.environ,
+        TMPDIR=tmp_dir,
+        CANARY_ENV_DIR=env_dir,
+        CANARY_PACKAGE_FILE=package_file,
+        CANARY_RESULTS_FILE=results_file,
+        CANARY_METRICS_SINK='file:%s' % os.path.join(run_dir, 'metrics'),
+        CANARY_PYPI_URL='%s/pypi' % index_url,
+        CANARY_TIMEOUT_SECONDS='86400',
+        PIP_INDEX_URL='%s/simple' % index_url,
+        PIP_DISABLE_PIP_VERSION_CHECK='1',
+    )
+    env.pop('CANARY_STATE_BUCKET', None)
+    env.pop('CANARY_WORKER_FUNCTION', None)
+    sampler = _DiskSampler(tmp_dir)
+    last_pid = _read_last_pid()
+    start = time.time()
+    with sampler:
+        _, rusage = proc.run(
+            [sys.executable, os.path.abspath(__file__), '--child', 'check'],
+            env=env)
+    wall_time = time.time() - start
+    processes = None
+    if last_pid is not None:
+        processes = _read_last_pid() - last_pid
+    with open(results_file, 'r') as f:
+        results = json.load(f)['results'].values()
+    return {
+        'packages': index.count,
+        'wall_time': wall_time,
+        'peak_rss_kb': rusage.ru_maxrss,
+        'peak_disk_bytes': sampler.peak,
+        'processes': processes,
+        'succeeded': sum(1 for result in results if result['success']),
+        'failed': sum(1 for result in results if not result['success']),
+    }
+
+
+class _DiskSampler(object):
+    def __init__(self, path):
+        self.peak = 0
+        self._path = path
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample)
+        self._thread.daemon = True
+
+    def _sample(self):
+        while True:
+            self.peak = max(self.peak, proc.directory_size(self._path))
+            if self._stop.wait(_SAMPLE_INTERVAL):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def _read_last_pid():
+    try:
+        with open(_LAST_PID, 'r') as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _print_report(report):
+    print('%(packages)5s packages: %(wall_time)8.1fs wall, '
+          '%(peak_rss_kb)8s KiB peak RSS, %(peak_disk_bytes)11s bytes peak '
+          'disk, %(processes)5s processes, %(succeeded)s ok, '
+          '%(failed)s failed' % report)
+    sys.stdout.flush()
+
+
+def _child(mode, argv):
+    if mode == 'prepare':
+        from chalicelib.environment import CanaryEnvironment
+        from chalicelib.wheelcache import WheelCache
+        environment = CanaryEnvironment(os.environ['CANARY_ENV_DIR'])
+        version = argv[0] if argv else environment.resolve_chalice_version()
+        with tempfile.TemporaryDirectory() as tempdir:
+            environment.prepare(WheelCache(tempdir), version)
+        print(version)
+    else:
+        import app
+        from chalicelib.deadline import Deadline
+        app._check_installability(Deadline.for_invocation())
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == '--child':
+        _child(sys.argv[2], sys.argv[3:])
+        return
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='5,50,500',
+                        type=lambda value: [int(v) for v in value.split(',')],
+                        help='Comma separated package list sizes to run.')
+    parser.add_argument('--chalice-version',
+                        help='Chalice version to benchmark, defaults to the '
+                             'latest release.')
+    parser.add_argument('--env-dir',
+                        help='Directory to build the chalice environment '
+                             'in, reuse it to skip the build next time.')
+    parser.add_argument('--output',
+                        help='Write the reports as JSON to this file.')
+    parser.add_argument('--keep', action='store_true',
+                        help='Keep the generated indexes and run '
+                             'directories.')
+    run_benchmark(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
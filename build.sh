@@ -1,21 +1,50 @@
 #!/bin/bash
-pip install --upgrade awscli
+# The virtualenv is cached between builds and only rebuilt when one of the
+# requirements files changes, see the cache paths in buildspec.yml.
+CACHE_DIR="${CANARY_BUILD_CACHE:-/root/.cache/canary-build}"
+export PIP_CACHE_DIR="${CACHE_DIR}/pip"
+REQUIREMENTS_HASH=$(cat requirements.txt canary/requirements.txt | sha256sum | cut -c1-16)
+VENV="${CACHE_DIR}/venv-${REQUIREMENTS_HASH}"
+
+if [ ! -f "${VENV}/.complete" ]; then
+    rm -rf "${CACHE_DIR}"/venv-*
+    pip install virtualenv
+    virtualenv "${VENV}" || exit 1
+    . "${VENV}/bin/activate"
+    pip install --upgrade awscli || exit 1
+    pip install -r requirements.txt || exit 1
+    pip install -r canary/requirements.txt || exit 1
+    touch "${VENV}/.complete"
+else
+    . "${VENV}/bin/activate"
+fi
 aws --version
-pip install virtualenv
-virtualenv /tmp/venv
-. /tmp/venv/bin/activate
-pip install -r requirements.txt
 
 cd canary
-pip install -r requirements.txt
 chalice package /tmp/packaged || exit 1
 cd ..
 
 python pipeline/inject-dashboard.py /tmp/packaged/sam.json \
        --packages canary/chalicelib/packages.json || exit 1
 
-cat /tmp/packaged/sam.json
-aws cloudformation package \
-    --template-file /tmp/packaged/sam.json \
-    --s3-bucket "${APP_S3_BUCKET}" \
-    --output-template-file /tmp/packaged/transformed.yaml
+CONTENT_HASH=$(python pipeline/content-hash.py /tmp/packaged/sam.json) || exit 1
+DEPLOYED_HASH=$(aws cloudformation describe-stacks \
+    --stack-name "${APP_STACK_NAME}" \
+    --query "Stacks[0].Outputs[?OutputKey=='ContentHash'].OutputValue" \
+    --output text 2>/dev/null)
+
+if [ -n "${APP_STACK_NAME}" ] && [ "${CONTENT_HASH}" = "${DEPLOYED_HASH}" ]; then
+    # Nothing changed since the last deployment, hand the deployed template
+    # back so nothing is uploaded and the change set is empty.
+    echo "Content hash ${CONTENT_HASH} is already deployed to ${APP_STACK_NAME}"
+    aws cloudformation get-template \
+        --stack-name "${APP_STACK_NAME}" \
+        --template-stage Original \
+        --query TemplateBody \
+        --output text > /tmp/packaged/transformed.yaml || exit 1
+else
+    aws cloudformation package \
+        --template-file /tmp/packaged/sam.json \
+        --s3-bucket "${APP_S3_BUCKET}" \
+        --output-template-file /tmp/packaged/transformed.yaml
+fi
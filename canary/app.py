@@ -1,16 +1,68 @@
 import os
-import json
-import codecs
+import sys
+import asyncio
+import time
 import logging
 import tempfile
-from subprocess import run
-from subprocess import PIPE
-from threading import Thread
-
-import boto3
-import virtualenv
+import zipfile
+import traceback
+from collections import OrderedDict
 
 from chalice import Chalice
+from packaging.requirements import Requirement
+
+from chalicelib import pypi
+from chalicelib import trace
+from chalicelib.artifact import LAMBDA_UNZIPPED_LIMIT
+from chalicelib.artifact import find_deployment_zip
+from chalicelib.artifact import import_time
+from chalicelib.artifact import inspect as inspect_artifact
+from chalicelib.artifact import top_level_modules
+from chalicelib.buildstore import FileBuildStore
+from chalicelib.buildstore import S3BuildStore
+from chalicelib.classify import DEPENDENCY_FAILED
+from chalicelib.classify import MISSING_WHEEL
+from chalicelib.classify import SDIST_BUILD
+from chalicelib.classify import UNKNOWN
+from chalicelib.dispatch import shard_groups
+from chalicelib.dispatch import LocalDispatcher
+from chalicelib.dispatch import LambdaDispatcher
+from chalicelib.deadline import Deadline
+from chalicelib.dependencies import DependencyGraph
+from chalicelib.environment import CanaryEnvironment
+from chalicelib.environment import S3SnapshotStore
+from chalicelib.history import FileHistoryStore
+from chalicelib.history import S3HistoryStore
+from chalicelib.instrument import CheckRecord
+from chalicelib.matrix import CRITICAL
+from chalicelib.matrix import LATEST
+from chalicelib.matrix import LONG_TAIL
+from chalicelib.matrix import FileMatrixSource
+from chalicelib.matrix import MatrixProvider
+from chalicelib.matrix import S3MatrixSource
+from chalicelib.matrix import pinned_requirement
+from chalicelib.metrics import create_sink
+from chalicelib.packaging import AsyncCliPackager
+from chalicelib.packaging import CliPackager
+from chalicelib.packaging import InProcessPackager
+from chalicelib.packaging import PackageResult
+from chalicelib.packaging import UnsupportedRuntimeError
+from chalicelib.planner import CHANGED
+from chalicelib.planner import SCHEDULED
+from chalicelib.planner import STALE
+from chalicelib.planner import Candidate
+from chalicelib.planner import plan
+from chalicelib.results import ResultKey
+from chalicelib.results import FileResultStore
+from chalicelib.results import S3ResultStore
+from chalicelib.scheduler import Scheduler
+from chalicelib.trace import FileTraceStore
+from chalicelib.trace import S3TraceStore
+from chalicelib.trace import trace_name
+from chalicelib.wheelcache import WheelCache
+from chalicelib.wheelindex import WheelIndex
+from chalicelib.workspace import AdmissionTimeout
+from chalicelib.workspace import Workspace
 
 app = Chalice(app_name='canary')
 app.debug = True
@@ -18,73 +70,717 @@ app.log.setLevel(logging.INFO)
 
 
 _ROOT = os.path.dirname(os.path.abspath(__file__))
-_PACKAGE_FILE = os.path.join(_ROOT, 'chalicelib', 'packages.json')
-_PACKAGE_LIST = json.loads(codecs.open(_PACKAGE_FILE, 'r',
-                                       encoding='utf-8').read())
+_PACKAGE_FILE = os.environ.get(
+    'CANARY_PACKAGE_FILE', os.path.join(_ROOT, 'chalicelib', 'packages.json'))
+_RUNTIME = 'python%s.%s' % sys.version_info[:2]
+_FULL_SWEEP_INTERVAL = 3600 * int(
+    os.environ.get('CANARY_FULL_SWEEP_HOURS', '24'))
+_SHARD_SIZE = int(os.environ.get('CANARY_SHARD_SIZE', '0'))
+_ENGINE = os.environ.get('CANARY_ENGINE', 'cli')
+_PACKAGE_TIMEOUT = float(os.environ.get('CANARY_PACKAGE_TIMEOUT', '180'))
+_INDEX_SCAN = os.environ.get('CANARY_INDEX_SCAN', '1') == '1'
+_RUN_BUDGET = os.environ.get('CANARY_RUN_BUDGET_SECONDS')
+_BUILD_RETENTION = 24 * 3600 * float(
+    os.environ.get('CANARY_BUILD_RETENTION_DAYS', '14'))
+_TRACE = os.environ.get('CANARY_TRACE', '0') == '1'
+_IMPORT_TIME = os.environ.get('CANARY_IMPORT_TIME', '1') == '1'
+# At most this long is spent importing a bundle.
+_IMPORT_TIMEOUT = 30
+# Share of the time left that planned checks may fill, the rest goes to
+# preparing environments and reporting.
+_PLAN_SHARE = 0.75
+# Seconds a check is assumed to take before one has been timed.
+_DEFAULT_EXPECTED_COST = 60
+# Long tail packages are checked again after this many full sweep
+# intervals unless they set their own.
+_LONG_TAIL_SWEEPS = 7
+# Share of the time left that priming the wheel cache may use.
+_PRIME_SHARE = 0.25
+# Time a shard keeps back from the coordinator's deadline, to report its
+# checks, store their outputs and flush, and for the invoke round trip.
+# Results arriving after the coordinator stopped waiting are lost.
+_SHARD_MARGIN = 20
+# Share of the time left the index scan may take before dispatch.
+_SCAN_SHARE = 0.1
+_UNSUPPORTED = 'unsupported'
+# Pending metrics that make the async engine publish before the run ends.
+_ASYNC_FLUSH_SIZE = 200
+# Module level so that expected durations learned by one invocation are used
+# to order the work of the next one on a warm container.
+_SCHEDULER = Scheduler()
+# Disk usage of the last check of each package, for the same reason.
+_DISK_USAGE = {}
+# Requirements declared by each package release, which never change.
+_DECLARED_REQUIREMENTS = {}
+
+
+def _create_environment():
+    snapshots = None
+    if os.environ.get('CANARY_STATE_BUCKET'):
+        snapshots = S3SnapshotStore(os.environ['CANARY_STATE_BUCKET'])
+    return CanaryEnvironment(
+        os.environ.get('CANARY_ENV_DIR',
+                       os.path.join(tempfile.gettempdir(), 'canary-env')),
+        snapshots=snapshots)
+
+
+def _create_result_store():
+    if os.environ.get('CANARY_STATE_BUCKET'):
+        return S3ResultStore(os.environ['CANARY_STATE_BUCKET'])
+    return FileResultStore(
+        os.environ.get('CANARY_RESULTS_FILE',
+                       os.path.join(tempfile.gettempdir(),
+                                    'canary-results.json')))
+
+
+def _create_history_store():
+    if os.environ.get('CANARY_STATE_BUCKET'):
+        return S3HistoryStore(os.environ['CANARY_STATE_BUCKET'])
+    return FileHistoryStore(
+        os.environ.get('CANARY_HISTORY_DIR',
+                       os.path.join(tempfile.gettempdir(),
+                                    'canary-history')))
+
+
+def _create_build_store():
+    if os.environ.get('CANARY_STATE_BUCKET'):
+        return S3BuildStore(os.environ['CANARY_STATE_BUCKET'])
+    return FileBuildStore(
+        os.environ.get('CANARY_BUILD_DIR',
+                       os.path.join(tempfile.gettempdir(), 'canary-builds')))
+
+
+def _create_trace_store():
+    if os.environ.get('CANARY_STATE_BUCKET'):
+        return S3TraceStore(os.environ['CANARY_STATE_BUCKET'])
+    return FileTraceStore(
+        os.environ.get('CANARY_TRACE_DIR',
+                       os.path.join(tempfile.gettempdir(), 'canary-traces')))
+
+
+def _create_matrix_provider():
+    source = FileMatrixSource(_PACKAGE_FILE)
+    if (os.environ.get('CANARY_STATE_BUCKET') and
+            os.environ.get('CANARY_PACKAGE_LIST_KEY')):
+        source = S3MatrixSource(os.environ['CANARY_STATE_BUCKET'],
+                                os.environ['CANARY_PACKAGE_LIST_KEY'],
+                                fallback=source)
+    return MatrixProvider(source, _RUNTIME)
+
+
+def _create_dispatcher():
+    if os.environ.get('CANARY_WORKER_FUNCTION'):
+        return LambdaDispatcher(os.environ['CANARY_WORKER_FUNCTION'])
+    return LocalDispatcher(_check_local_shard)
+
+
+_ENVIRONMENT = _create_environment()
+_RESULTS = _create_result_store()
+_HISTORY = _create_history_store()
+_BUILDS = _create_build_store()
+_TRACES = _create_trace_store()
+# Loaded by the first invocation rather than at import, and kept across
+# warm invocations until its source changes.
+_MATRIX = _create_matrix_provider()
+_METRICS = create_sink(os.environ.get('CANARY_METRICS_SINK', 'cloudwatch'))
 
 
 @app.schedule('rate(1 hour)')
 def canary(event):
-    _check_installability()
+    _check_installability(
+        Deadline.for_invocation(getattr(event, 'context', None)))
+
+
+@app.lambda_function(name='worker')
+def worker(event, context):
+    deadline = Deadline.for_invocation(context).earliest(event['deadline'])
+    if _TRACE:
+        trace.start('worker')
+    try:
+        return _check_shard(event, deadline)
+    finally:
+        _save_trace('worker')
+
+
+def _check_installability(deadline):
+    if _TRACE:
+        trace.start('canary')
+    try:
+        with trace.span('select_checks'):
+            _RESULTS.load()
+            matrix = _MATRIX.get()
+            keys = _result_keys(matrix.cells())
+            candidates = _select_checks(matrix, keys)
+        scanned = {}
+        if _INDEX_SCAN:
+            # Only new releases of packages that passed with the same
+            # chalice version and runtime are scanned.  A new chalice
+            # release, stale and critical checks are packaged for real,
+            # which also catches anything the index scan got wrong.
+            with trace.span('scan_index'):
+                scanned = _scan_index(matrix, OrderedDict(
+                    (key, candidate.cells)
+                    for key, candidate in candidates.items()
+                    if candidate.reason == CHANGED and
+                    _RESULTS.is_new_release_of_success(key)), deadline)
+        dispatcher = _create_dispatcher()
+        unscanned = [candidate for key, candidate in candidates.items()
+                     if key not in scanned]
+        planned, deferred = plan(unscanned,
+                                 _budget(deadline, dispatcher, unscanned))
+        for candidate in deferred:
+            _report_deferred(matrix, candidate)
+        checks = OrderedDict((candidate.key, candidate.cells)
+                             for candidate in planned)
+        with trace.span('resolve_dependencies'):
+            graph = DependencyGraph.resolve(
+                {key.package: key.version for key in checks},
+                cache=_DECLARED_REQUIREMENTS)
+        chalice_versions = sorted({key.chalice_version
+                                   for key in keys.values()})
+        with trace.span('dispatch', checks=len(checks)):
+            results = _dispatch(dispatcher, matrix, checks, graph,
+                                chalice_versions, deadline)
+        results.update((key, (True, None)) for key in scanned)
+        with trace.span('save_results'):
+            for key, (success, duration) in results.items():
+                _RESULTS.record(key, success, duration)
+            _RESULTS.retain(keys.values())
+            _RESULTS.save()
+        _METRICS.add('deferred_checks', len(deferred))
+        _METRICS.add('coverage', _coverage(keys.values()), unit='Percent')
+        if _RESULTS.full_sweep_due(_FULL_SWEEP_INTERVAL):
+            # Once per full sweep interval is enough to keep the history to
+            # one chunk per day.
+            with trace.span('compact'):
+                _HISTORY.compact()
+                _BUILDS.prune(time.time() - _BUILD_RETENTION,
+                              timeout=deadline.remaining())
+            _RESULTS.mark_full_sweep()
+    finally:
+        with trace.span('flush'):
+            _flush(_METRICS, _HISTORY)
+        _save_trace('canary')
+
+
+def _flush(*stores):
+    """Flush every store, logging failures instead of raising them.
+
+    What a store could not send stays pending for its next flush, and one
+    that fails keeps neither the others nor the trace from being written.
+    """
+    for store in stores:
+        try:
+            store.flush()
+        except Exception:
+            app.log.exception('Could not flush %s', type(store).__name__)
+
+
+def _save_trace(run):
+    recorded = trace.stop()
+    if recorded is None:
+        return
+    try:
+        app.log.info('Wrote the trace of this run to %s',
+                     _TRACES.put(trace_name(run), recorded))
+    except Exception as e:
+        app.log.warning('Could not write the trace of this run: %s', e)
+
+
+def _scan_index(matrix, checks, deadline):
+    """Pass the checks the package index alone shows would package."""
+    index = WheelIndex(requires=_DECLARED_REQUIREMENTS)
+    keys = list(checks)
+    verdicts = index.verdicts(
+        [(key.package, key.version, key.runtime) for key in keys],
+        timeout=deadline.remaining() * _SCAN_SHARE)
+    scanned = OrderedDict()
+    for key, verdict in zip(keys, verdicts):
+        if verdict:
+            app.log.info('Packaged %s, every distribution it needs has a '
+                         'wheel on the index', _describe(key))
+            for cell in checks[key]:
+                _send_metric(matrix.dimensions(cell), 1)
+            _HISTORY.add(key, success=True, index_scan=True)
+            scanned[key] = True
+    _METRICS.add('index_scan_verdicts', len(scanned))
+    return scanned
+
+
+def _budget(deadline, dispatcher, candidates):
+    """Seconds of check time this run can fill, across all workers."""
+    if _RUN_BUDGET:
+        return float(_RUN_BUDGET)
+    return (deadline.remaining() * _PLAN_SHARE * _SCHEDULER.max_workers *
+            _parallel_shards(dispatcher, candidates))
+
+
+def _parallel_shards(dispatcher, candidates):
+    # Without a shard size everything is one shard, however many workers
+    # the dispatcher could run.  Otherwise there are at least as many
+    # shards as the packages fill, dependencies can only add more.
+    if not _SHARD_SIZE:
+        return 1
+    packages = len({candidate.key.package for candidate in candidates})
+    shards = -(-packages // _SHARD_SIZE)
+    return max(1, min(dispatcher.concurrency, shards))
+
+
+def _report_deferred(matrix, candidate):
+    app.log.info('No time left this run for %s (%s)',
+                 _describe(candidate.key), candidate.reason)
+    if _RESULTS.is_unchanged_success(candidate.key):
+        # Same as a skipped check, the last result still stands.
+        for cell in candidate.cells:
+            _send_metric(matrix.dimensions(cell), 1)
+
+
+def _coverage(keys):
+    """Percent of checks with a result of the full sweep interval."""
+    keys = set(keys)
+    if not keys:
+        return 100.0
+    oldest = time.time() - _FULL_SWEEP_INTERVAL
+    fresh = sum(1 for key in keys
+                if (_RESULTS.checked_at(key) or 0) >= oldest)
+    return 100.0 * fresh / len(keys)
+
+
+def _dispatch(dispatcher, matrix, checks, graph, chalice_versions,
+              deadline):
+    # Every cell of a package goes to the same shard so that its chalice
+    # versions and runtimes share the downloads and sdist builds, and so
+    # do packages that depend on each other, so that a shard can check
+    # the shared ones first.
+    by_package = OrderedDict()
+    for key, cells in checks.items():
+        by_package.setdefault(key.package, []).append({
+            'key': list(key),
+            'dimensions': [matrix.dimensions(cell) for cell in cells],
+            'dependencies': sorted(graph.dependencies(key.package)),
+        })
+    payloads = [{'checks': [check for package in packages_shard
+                            for check in by_package[package]],
+                 'chalice_versions': chalice_versions,
+                 'deadline': deadline.expires_at - _SHARD_MARGIN}
+                for packages_shard in shard_groups(
+                    graph.components(by_package), _SHARD_SIZE)]
+    if len(payloads) == 1:
+        # A worker invocation would only add a cold start while the
+        # canary waits for its single shard.
+        dispatcher = LocalDispatcher(_check_local_shard)
+    shard_results, failures = dispatcher.dispatch(
+        payloads, timeout=deadline.remaining())
+    for failure in failures:
+        app.log.error('Could not check shard %s: %s',
+                      [check['key'] for check in failure.payload['checks']],
+                      failure.error)
+    _METRICS.add('shard_failures', len(failures))
+    results = {}
+    for shard_result in shard_results:
+        for key, success, duration in shard_result['results']:
+            results[ResultKey(*key)] = (success, duration)
+        for key in shard_result['unsupported']:
+            app.log.info('Skipped %s', _describe(ResultKey(*key)))
+    return results
+
+
+def _check_local_shard(payload):
+    return _check_shard(payload, Deadline(payload['deadline']))
 
 
-def _check_installability():
-    with tempfile.TemporaryDirectory() as tempdir:
-        venv_dir = _create_and_activate_venv(tempdir)
-        py_exe = os.path.join(venv_dir, 'bin', 'python')
-        chalice_exe = _install_chalice(py_exe)
-        threads = [Thread(target=_check_can_package,
-                          args=(chalice_exe, package, tempdir))
-                   for package in _PACKAGE_LIST]
-        for thread in threads:
-            thread.start()
-        for thread in threads:
-            thread.join()
+def _check_shard(payload, deadline):
+    checks = payload['checks']
+    by_chalice_version = OrderedDict()
+    for check in checks:
+        by_chalice_version.setdefault(
+            ResultKey(*check['key']).chalice_version, []).append(check)
+    try:
+        with tempfile.TemporaryDirectory() as tempdir:
+            # A single wheel cache serves every chalice version and runtime
+            # in the shard, so a distribution is downloaded or built once.
+            wheel_cache = WheelCache(os.path.join(tempdir, 'wheels'),
+                                     builds=_BUILDS)
+            py_exes = OrderedDict(
+                (version, _ENVIRONMENT.prepare(
+                    wheel_cache, version, timeout=deadline.remaining(),
+                    keep=payload['chalice_versions']))
+                for version in by_chalice_version)
+            if py_exes:
+                with trace.span('prime_wheel_cache', checks=len(checks)):
+                    wheel_cache.prime(
+                        next(iter(py_exes.values())),
+                        sorted({_requirement(check) for check in checks}),
+                        timeout=deadline.remaining() * _PRIME_SHARE)
+            workspace = Workspace(os.path.join(tempdir, 'projects'),
+                                  usage=_DISK_USAGE)
+            results = []
+            for version, version_checks in by_chalice_version.items():
+                packagers = _create_packagers(py_exes[version], wheel_cache)
+                try:
+                    results.extend(zip(version_checks, _run_checks(
+                        packagers, version_checks, workspace, deadline)))
+                finally:
+                    for packager in packagers:
+                        packager.close()
+        # Checks that were never started for lack of time have no result
+        # and are picked up again by the next run.
+        return {
+            'results': [[check['key'], result, check.get('duration')]
+                        for check, result in results
+                        if isinstance(result, bool)],
+            'unsupported': [check['key'] for check, result in results
+                            if result == _UNSUPPORTED],
+        }
+    finally:
+        with trace.span('flush'):
+            _flush(_METRICS, _HISTORY)
 
 
-def _create_and_activate_venv(tempdir):
-    venv_dir = os.path.join(tempdir, 'venv')
-    virtualenv.create_environment(venv_dir)
-    exec(open(os.path.join(venv_dir, "bin", "activate_this.py")).read())
-    return venv_dir
+def _result_keys(cells):
+    # Every distinct requirement and chalice version is resolved once, no
+    # matter how many cells of the matrix share it.
+    versions = pypi.latest_versions({cell.requirement for cell in cells})
+    chalice_versions = {}
+    for chalice in {cell.chalice for cell in cells}:
+        if chalice == LATEST:
+            chalice_versions[chalice] = (
+                _ENVIRONMENT.resolve_chalice_version())
+        else:
+            chalice_versions[chalice] = chalice
+    return OrderedDict(
+        (cell, ResultKey(cell.requirement, versions[cell.requirement],
+                         chalice_versions[cell.chalice], cell.runtime))
+        for cell in cells)
 
 
-def _install_chalice(py_exe):
-    run([py_exe, '-m', 'pip', 'install', '--upgrade', 'chalice', '--no-cache'])
+def _select_checks(matrix, keys):
+    """Return a ``Candidate`` for every check that is due.
+
+    Critical packages are due every run, others when there is a new
+    release, their last check failed or it is older than their interval.
+    """
+    # Cells that resolve to the same key, like a pinned chalice version
+    # that is also the latest one, are checked once.
+    now = time.time()
+    candidates = OrderedDict()
+    for cell, key in keys.items():
+        settings = matrix.settings(cell.requirement)
+        checked_at = _RESULTS.checked_at(key)
+        if key in candidates:
+            reason = candidates[key].reason
+        elif settings.tier == CRITICAL:
+            reason = SCHEDULED
+        elif not _RESULTS.is_unchanged_success(key):
+            reason = CHANGED
+        elif now - checked_at >= _interval(settings):
+            reason = STALE
+        else:
+            # Nothing changed since the last green check, report the same
+            # result again so the dashboard and alarms keep their data.
+            app.log.info('Skipping unchanged %s', _describe(key))
+            _send_metric(matrix.dimensions(cell), 1)
+            continue
+        if key in candidates:
+            candidates[key].cells.append(cell)
+            continue
+        cost = (settings.expected_seconds or _RESULTS.expected_cost(key) or
+                _DEFAULT_EXPECTED_COST)
+        candidates[key] = Candidate(key, [cell], settings.tier, reason, cost,
+                                    checked_at)
+    return candidates
+
+
+def _interval(settings):
+    if settings.every_hours is not None:
+        return settings.every_hours * 3600
+    if settings.tier == LONG_TAIL:
+        return _FULL_SWEEP_INTERVAL * _LONG_TAIL_SWEEPS
+    return _FULL_SWEEP_INTERVAL
+
+
+def _create_packagers(py_exe, wheel_cache):
+    """Return the packagers for the canary's own runtime and for others.
+
+    The chalice CLI always packages for the interpreter it is installed in,
+    so other runtimes go through the in-process engine.
+    """
+    inprocess = InProcessPackager(py_exe, wheel_cache,
+                                  max_servers=_SCHEDULER.max_workers)
+    if _ENGINE == 'inprocess':
+        return inprocess, inprocess
     chalice_exe = os.path.join(os.path.dirname(py_exe), 'chalice')
-    return chalice_exe
+    if _ENGINE == 'async':
+        return AsyncCliPackager(chalice_exe, wheel_cache), inprocess
+    return CliPackager(chalice_exe, wheel_cache), inprocess
+
+
+def _run_checks(packagers, checks, workspace, deadline):
+    """Check packages as soon as the packages they depend on are checked.
+
+    A check whose dependency could not be packaged for the same runtime, for
+    lack of a wheel or because its sdist does not build, fails right away
+    instead of building the same failure again.  Other failures of a
+    dependency, like a timeout, say nothing about the packages that depend
+    on it.
+    """
+    keys = [ResultKey(*check['key']) for check in checks]
+    graph = DependencyGraph({
+        key.package: check.get('dependencies', [])
+        for key, check in zip(keys, checks)})
+    # Packages in a dependency cycle share a level and do not wait for each
+    # other.
+    levels = {}
+    for i, level in enumerate(graph.levels(
+            OrderedDict.fromkeys(key.package for key in keys))):
+        levels.update((package, i) for package in level)
+    by_package = {}
+    for i, key in enumerate(keys):
+        by_package.setdefault((key.package, key.runtime), []).append(i)
+    after = [[j for dependency in check.get('dependencies', [])
+              if levels.get(dependency, -1) < levels[key.package]
+              for j in by_package.get((dependency, key.runtime), ())]
+             for key, check in zip(keys, checks)]
+    return _check_concurrently(packagers, checks, workspace, deadline,
+                               after)
+
+
+def _check_concurrently(packagers, checks, workspace, deadline, after):
+    if not checks:
+        return []
+    failed = set()
+    if _ENGINE != 'async':
+        def check_after_dependencies(check):
+            failed_dependencies = _failed_dependencies(check, failed)
+            if failed_dependencies:
+                return _report_failed_dependencies(check,
+                                                   failed_dependencies)
+            result = _check_can_package(packagers, check, workspace,
+                                        deadline)
+            _note_failure(check, failed)
+            return result
+        return _SCHEDULER.map(check_after_dependencies, checks,
+                              key=_requirement, after=after)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(
+            _check_all_async(packagers, checks, workspace, deadline, after,
+                             failed))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+async def _check_all_async(packagers, checks, workspace, deadline, after,
+                           failed):
+    loop = asyncio.get_event_loop()
+    flushes = []
+
+    async def check_and_publish(check):
+        failed_dependencies = _failed_dependencies(check, failed)
+        if failed_dependencies:
+            return _report_failed_dependencies(check, failed_dependencies)
+        result = await _check_can_package_async(packagers, check, workspace,
+                                                deadline)
+        _note_failure(check, failed)
+        if _METRICS.pending() >= _ASYNC_FLUSH_SIZE:
+            # Publish in the background while the checks go on.
+            flushes.append(loop.run_in_executor(None, _flush, _METRICS))
+        return result
+    results = await _SCHEDULER.map_async(check_and_publish, checks,
+                                         key=_requirement, after=after)
+    await asyncio.gather(*flushes)
+    return results
+
+
+def _failed_dependencies(check, failed):
+    runtime = ResultKey(*check['key']).runtime
+    return [dependency for dependency in check.get('dependencies', [])
+            if (dependency, runtime) in failed]
+
+
+def _note_failure(check, failed):
+    # A missing wheel or an sdist that does not build fails every package
+    # that bundles the same release, other failures say nothing about them.
+    if check.get('failure_class') in (MISSING_WHEEL, SDIST_BUILD):
+        key = ResultKey(*check['key'])
+        failed.add((key.package, key.runtime))
+
+
+def _check_can_package(packagers, check, workspace, deadline):
+    key = ResultKey(*check['key'])
+    if deadline.expired():
+        app.log.warning('Out of time, not checking %s', _describe(key))
+        return None
+    packager = _packager_for(packagers, key)
+    record = CheckRecord(key.package, check['dimensions'][0])
+    try:
+        # The project directory is gone as soon as the packager is done
+        # with it, only its size is kept.
+        with trace.span('check', **_span_args(key)), workspace.project(
+                key.package, timeout=deadline.remaining()) as workdir:
+            result = packager.package(
+                _requirement(check), workdir, record,
+                timeout=deadline.timeout(_PACKAGE_TIMEOUT),
+                runtime=key.runtime)
+            if result.success:
+                _inspect_artifact(key, record, workdir, deadline)
+            _store_build(key, record, result, workdir)
+    except AdmissionTimeout:
+        app.log.warning('Out of time waiting for disk space, not checking '
+                        '%s', _describe(key))
+        return None
+    except UnsupportedRuntimeError:
+        app.log.warning('Not checking %s, this chalice version cannot '
+                        'package for that runtime', _describe(key))
+        return _UNSUPPORTED
+    except Exception:
+        result = _unexpected_error(key)
+    return _report(check, record, result, workspace)
 
 
-def _check_can_package(chalice_exe, package_name, tempdir):
-    project_name = 'package-%s' % package_name
-    run([chalice_exe, 'new-project', project_name], cwd=tempdir)
-    project_dir = os.path.join(tempdir, project_name)
-    requirements_file = os.path.join(project_dir, 'requirements.txt')
-    open(requirements_file, 'w').write('%s\n' % package_name)
-    p = run([chalice_exe, 'package', 'out'], cwd=project_dir, encoding='utf-8',
-            stdout=PIPE)
+async def _check_can_package_async(packagers, check, workspace, deadline):
+    key = ResultKey(*check['key'])
+    packager = _packager_for(packagers, key)
+    loop = asyncio.get_event_loop()
+    if not asyncio.iscoroutinefunction(packager.package):
+        # Runtimes other than the canary's own go through the in-process
+        # engine, which blocks.
+        return await loop.run_in_executor(
+            None, _check_can_package, packagers, check, workspace, deadline)
+    if deadline.expired():
+        app.log.warning('Out of time, not checking %s', _describe(key))
+        return None
+    record = CheckRecord(key.package, check['dimensions'][0])
+    with trace.lane() as lane:
+        record.lane = lane
+        with trace.span('check', lane=lane, **_span_args(key)):
+            try:
+                workdir = await loop.run_in_executor(
+                    None, workspace.acquire, key.package,
+                    deadline.remaining())
+            except AdmissionTimeout:
+                app.log.warning('Out of time waiting for disk space, not '
+                                'checking %s', _describe(key))
+                return None
+            try:
+                result = await packager.package(
+                    _requirement(check), workdir, record,
+                    timeout=deadline.timeout(_PACKAGE_TIMEOUT),
+                    runtime=key.runtime)
+                if result.success:
+                    await loop.run_in_executor(None, _inspect_artifact, key,
+                                               record, workdir, deadline)
+                await loop.run_in_executor(None, _store_build, key, record,
+                                           result, workdir)
+            except Exception:
+                result = _unexpected_error(key)
+            finally:
+                await loop.run_in_executor(None, workspace.release,
+                                           key.package, workdir)
+        return _report(check, record, result, workspace)
 
-    if 'Could not install dependencies:' in p.stdout:
-        app.log.error('Could not package %s', package_name)
-        _send_metric(package_name, 0)
+
+def _inspect_artifact(key, record, workdir, deadline):
+    """Record the size of the deployment package and its import time.
+
+    Import time is only measured for the canary's own runtime, with the
+    interpreter the canary runs on, which is the one the bundle was built
+    for.
+    """
+    zip_path = find_deployment_zip(workdir)
+    if zip_path is None:
+        return
+    with record.phase('inspect'):
+        try:
+            record.artifact = inspect_artifact(zip_path)
+            if record.artifact.uncompressed_bytes > LAMBDA_UNZIPPED_LIMIT:
+                app.log.warning('The deployment package of %s is larger '
+                                'than Lambda allows unzipped',
+                                _describe(key))
+            if _IMPORT_TIME and key.runtime == _RUNTIME:
+                modules = top_level_modules(
+                    zip_path, Requirement(key.package).name)
+                record.import_seconds = import_time(
+                    sys.executable, zip_path, modules, workdir,
+                    timeout=deadline.timeout(_IMPORT_TIMEOUT))
+        except (OSError, zipfile.BadZipFile) as e:
+            app.log.warning('Could not inspect the deployment package of '
+                            '%s: %s', _describe(key), e)
+
+
+def _store_build(key, record, result, workdir):
+    """Keep the outputs of a check in the build store."""
+    with record.phase('store'):
+        try:
+            _BUILDS.add(key, workdir, result.success, result.failure_class,
+                        result.tail)
+        except Exception as e:
+            # The check's result stands without its outputs.
+            app.log.warning('Could not store the outputs of %s: %s',
+                            _describe(key), e)
+
+
+def _unexpected_error(key):
+    # A bug or an unexpected environment fails this check only, the other
+    # checks of the shard go on.
+    app.log.exception('Error checking %s', _describe(key))
+    return PackageResult(UNKNOWN, traceback.format_exc().splitlines()[-20:])
+
+
+def _report_failed_dependencies(check, dependencies):
+    key = ResultKey(*check['key'])
+    record = CheckRecord(key.package, check['dimensions'][0])
+    record.finish(False, DEPENDENCY_FAILED)
+    record.emit(app.log, _METRICS)
+    _HISTORY.add(key, record)
+    app.log.error('Not checking %s, it depends on %s which could not be '
+                  'packaged', _describe(key), ', '.join(dependencies))
+    for dimensions in check['dimensions']:
+        _send_metric(dimensions, 0)
+    return False
+
+
+def _packager_for(packagers, key):
+    native, other = packagers
+    return native if key.runtime == _RUNTIME else other
+
+
+def _report(check, record, result, workspace):
+    key = ResultKey(*check['key'])
+    record.disk_usage = workspace.expected_usage(key.package)
+    record.finish(result.success, result.failure_class)
+    with trace.span('report', lane=record.lane, **_span_args(key)):
+        record.emit(app.log, _METRICS)
+        _HISTORY.add(key, record)
+    # Returned to the coordinator, which plans the next runs with it.
+    check['duration'] = record.duration
+    check['failure_class'] = result.failure_class
+    if result.success:
+        app.log.info('Packaged %s', _describe(key))
     else:
-        app.log.info('Packaged %s', package_name)
-        _send_metric(package_name, 1)
-
-
-def _send_metric(package_name, success):
-    boto3.client('cloudwatch').put_metric_data(
-        Namespace='ChalicePackageCanary',
-        MetricData=[
-            {
-                'MetricName': 'package',
-                'Dimensions': [
-                    {
-                        'Name': 'Name',
-                        'Value': package_name
-                    },
-                ],
-                'Value': success,
-            }
-        ]
-    )
+        app.log.error('Could not package %s (%s):\n%s', _describe(key),
+                      result.failure_class, '\n'.join(result.tail))
+    for dimensions in check['dimensions']:
+        _send_metric(dimensions, int(result.success))
+    return result.success
+
+
+def _requirement(check):
+    key = ResultKey(*check['key'])
+    return pinned_requirement(key.package, key.version)
+
+
+def _span_args(key):
+    return {'package': key.package, 'version': key.version,
+            'chalice': key.chalice_version, 'runtime': key.runtime}
+
+
+def _describe(key):
+    return '%s with chalice %s on %s' % (key.package, key.chalice_version,
+                                         key.runtime)
+
+
+def _send_metric(dimensions, success):
+    _METRICS.add('package', success, dimensions)
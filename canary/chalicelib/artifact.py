@@ -0,0 +1,98 @@
+import os
+import re
+import shutil
+import zipfile
+from collections import namedtuple
+from subprocess import PIPE
+from subprocess import DEVNULL
+from subprocess import TimeoutExpired
+
+from chalicelib import proc
+from chalicelib.classify import normalize_name
+
+
+# What Lambda allows for a function and its layers once unzipped.
+LAMBDA_UNZIPPED_LIMIT = 250 * 1024 * 1024
+_DEPLOYMENT_ZIP = 'deployment.zip'
+_NATIVE_LIBRARY = re.compile(r'\.so(\.[\d.]+)?$')
+# Imports the package's top level modules and prints how long that took.
+# The bundle is first on the path and nothing but the standard library
+# follows, like in the Lambda runtime.
+_IMPORT_SCRIPT = '''
+import sys, time, importlib
+start = time.perf_counter()
+for name in sys.argv[1:]:
+    importlib.import_module(name)
+print(time.perf_counter() - start)
+'''
+
+ArtifactStats = namedtuple('ArtifactStats', [
+    'compressed_bytes', 'uncompressed_bytes', 'files', 'native_libraries'])
+
+
+def find_deployment_zip(root):
+    """Return the deployment package chalice wrote under ``root``."""
+    for dirpath, _, filenames in os.walk(root):
+        if _DEPLOYMENT_ZIP in filenames:
+            return os.path.join(dirpath, _DEPLOYMENT_ZIP)
+    return None
+
+
+def inspect(zip_path):
+    """Sizes and file counts of a deployment package.
+
+    Only the zip's central directory is read, nothing is extracted.
+    """
+    with zipfile.ZipFile(zip_path) as z:
+        infos = [info for info in z.infolist() if not info.is_dir()]
+    return ArtifactStats(
+        compressed_bytes=os.path.getsize(zip_path),
+        uncompressed_bytes=sum(info.file_size for info in infos),
+        files=len(infos),
+        native_libraries=sum(1 for info in infos
+                             if _NATIVE_LIBRARY.search(info.filename)))
+
+
+def top_level_modules(zip_path, requirement_name):
+    """Modules importing ``requirement_name`` from the bundle starts with."""
+    name = normalize_name(requirement_name)
+    with zipfile.ZipFile(zip_path) as z:
+        for filename in z.namelist():
+            parts = filename.split('/')
+            if (len(parts) == 2 and parts[1] == 'top_level.txt' and
+                    parts[0].endswith('.dist-info') and
+                    normalize_name(parts[0].rsplit('-', 1)[0]) == name):
+                modules = z.read(filename).decode('utf-8').split()
+                return [module for module in modules
+                        if not module.startswith('_')] or modules
+    return [name.replace('-', '_')]
+
+
+def import_time(py_exe, zip_path, modules, workdir, timeout=None):
+    """Seconds it takes to import ``modules`` from the unzipped bundle.
+
+    Extension modules cannot be imported from a zip, so the bundle is
+    unzipped to ``workdir`` first, and removed again afterwards.  Returns
+    None when the modules do not import, for example because they need a
+    package the Lambda runtime provides.
+    """
+    bundle_dir = os.path.join(workdir, 'import-check')
+    with zipfile.ZipFile(zip_path) as z:
+        z.extractall(bundle_dir)
+    # -I and -S leave out the environment's own site-packages.
+    args = [py_exe, '-I', '-S', '-c',
+            'import sys; sys.path.insert(0, %r); exec(%r)'
+            % (bundle_dir, _IMPORT_SCRIPT)] + list(modules)
+    try:
+        p, _ = proc.run(args, timeout=timeout, stdout=PIPE, stderr=DEVNULL,
+                        cwd=bundle_dir)
+    except TimeoutExpired:
+        return None
+    finally:
+        shutil.rmtree(bundle_dir, ignore_errors=True)
+    if p.returncode != 0:
+        return None
+    try:
+        return float(p.stdout.decode('utf-8').strip().splitlines()[-1])
+    except (ValueError, IndexError):
+        return None
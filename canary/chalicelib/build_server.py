@@ -0,0 +1,173 @@
+"""Long lived packaging process for the in-process engine.
+
+This script runs inside the canary virtualenv so it exercises the chalice
+release under test.  It imports chalice's dependency builder once and then
+reads one JSON request per line from stdin, building the site-packages for
+a requirements-only project and zipping it like ``chalice package`` would.
+One JSON response per line is written back.  It only depends on the
+standard library and chalice, it must not import anything from chalicelib.
+"""
+import os
+import sys
+import json
+import time
+import inspect
+import resource
+import traceback
+import zipfile
+
+from chalice.utils import OSUtils
+from chalice.deploy.packager import DependencyBuilder
+from chalice.deploy.packager import MissingDependencyError
+
+
+class _TimedPip(object):
+    """Wrap the pip runner of a dependency builder to time its phases."""
+    _PHASES = {
+        'download_all_dependencies': 'download',
+        'download_manylinux_wheels': 'download',
+        'build_wheel': 'build',
+    }
+
+    def __init__(self, builder):
+        self.phases = {}
+        self.bytes_downloaded = 0
+        pip = builder._pip
+        for method_name, phase in self._PHASES.items():
+            setattr(pip, method_name,
+                    self._wrap(getattr(pip, method_name), phase))
+
+    def reset(self):
+        self.phases = {}
+        self.bytes_downloaded = 0
+
+    def _wrap(self, method, phase):
+        def timed(*args, **kwargs):
+            directory = _find_directory(list(args) + list(kwargs.values()))
+            size = _directory_size(directory)
+            start = time.time()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.phases[phase] = (self.phases.get(phase, 0) +
+                                      time.time() - start)
+                if phase == 'download':
+                    self.bytes_downloaded += max(
+                        0, _directory_size(directory) - size)
+        return timed
+
+
+def _find_directory(arguments):
+    # The position of the target directory argument differs between chalice
+    # versions, but it is the only argument that is an existing directory.
+    for argument in arguments:
+        if isinstance(argument, str) and os.path.isdir(argument):
+            return argument
+    return None
+
+
+def _directory_size(path):
+    if path is None:
+        return 0
+    total = 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(root, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _default_abi():
+    major, minor = sys.version_info[:2]
+    if (major, minor) < (3, 8):
+        return 'cp%s%sm' % (major, minor)
+    return 'cp%s%s' % (major, minor)
+
+
+class UnsupportedAbiError(Exception):
+    pass
+
+
+def _build_site_packages(builder, abi, requirements_file, target_dir):
+    params = inspect.signature(builder.build_site_packages).parameters
+    if 'abi' in params:
+        builder.build_site_packages(abi, requirements_file, target_dir)
+    elif abi == _default_abi():
+        builder.build_site_packages(requirements_file, target_dir)
+    else:
+        # Older chalice releases always package for the interpreter they
+        # run on.
+        raise UnsupportedAbiError(abi)
+
+
+def _zip_directory(source_dir, zip_filename):
+    with zipfile.ZipFile(zip_filename, 'w',
+                         compression=zipfile.ZIP_DEFLATED) as z:
+        for root, dirnames, filenames in os.walk(source_dir):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                full_path = os.path.join(root, filename)
+                z.write(full_path, os.path.relpath(full_path, source_dir))
+
+
+def _peak_rss_kb():
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def handle(builder, pip, request):
+    pip.reset()
+    project_dir = request['project_dir']
+    os.makedirs(project_dir, exist_ok=True)
+    requirements_file = os.path.join(project_dir, 'requirements.txt')
+    with open(requirements_file, 'w') as f:
+        f.write('%s\n' % request['requirement'])
+    site_packages = os.path.join(project_dir, 'site-packages')
+    response = {'success': True, 'missing': [], 'missing_sdists': [],
+                'error': None, 'unsupported': False}
+    try:
+        _build_site_packages(builder, request.get('abi') or _default_abi(),
+                             requirements_file, site_packages)
+    except UnsupportedAbiError:
+        response['success'] = False
+        response['unsupported'] = True
+    except MissingDependencyError as e:
+        response['success'] = False
+        response['missing'] = sorted(
+            package.identifier for package in e.missing)
+        response['missing_sdists'] = sorted(
+            package.identifier for package in e.missing
+            if package.dist_type == 'sdist')
+    except Exception:
+        response['success'] = False
+        response['error'] = traceback.format_exc()
+    if response['success']:
+        start = time.time()
+        _zip_directory(site_packages,
+                       os.path.join(project_dir, 'deployment.zip'))
+        pip.phases['zip'] = time.time() - start
+    response['phases'] = pip.phases
+    response['bytes_downloaded'] = pip.bytes_downloaded
+    response['peak_rss_kb'] = _peak_rss_kb()
+    response['site_packages'] = site_packages
+    return response
+
+
+def main():
+    # Anything chalice, pip or a build prints must not end up in the
+    # response stream, so keep a private copy of stdout and point the real
+    # one at stderr.
+    responses = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    builder = DependencyBuilder(OSUtils())
+    pip = _TimedPip(builder)
+    for line in sys.stdin:
+        response = handle(builder, pip, json.loads(line))
+        responses.write('%s\n' % json.dumps(response))
+        responses.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,345 @@
+import io
+import os
+import re
+import csv
+import json
+import time
+import hashlib
+import zipfile
+import threading
+from collections import OrderedDict
+
+from chalicelib.artifact import find_deployment_zip
+from chalicelib.classify import normalize_name
+from chalicelib.s3objects import S3Objects
+from chalicelib.s3objects import utc_day
+
+
+# Parts every manifest may have besides the distributions.  The project is
+# what the check packaged, the deployment part whatever the deployment
+# package holds that no RECORD lists.
+PROJECT = 'project'
+DEPLOYMENT = 'deployment'
+# Directories a packager builds the deployment package from, their contents
+# are stored from the deployment package instead.
+_BUILD_DIRS = {'site-packages'}
+# The same files always make the same zip.
+_ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+_DEFAULT_MODE = 0o644
+
+
+class BuildStore(object):
+    """Content addressed store of the outputs of package checks.
+
+    The outputs of a check are split into parts: every distribution in its
+    deployment package, as listed by the RECORD of its dist-info, the files
+    in the package no RECORD lists, and the project chalice packaged.  Each
+    part is stored once under ``objects/``, as a zip named after the SHA-256
+    of its files.
+
+    Distributions that are complete wheels are indexed under ``wheels/`` by
+    name, version, digest and the day a check last bundled them, so
+    ``export_wheels`` can hand a later run a wheel instead of it building
+    the same sdist again.  That is all that is kept of a green check.  A
+    failed check keeps every part, and a manifest under ``manifests/``
+    lists them with its result, so ``restore`` can bring back its outputs
+    to debug it.  Subclasses implement ``_list``, ``_exists``, ``_get``,
+    ``_put`` and ``_delete`` for names relative to the store.
+    """
+    def add(self, key, workdir, success, failure_class=None, tail=()):
+        """Store the outputs of the check of ``key`` found in ``workdir``.
+
+        Returns the name of the manifest of a failed check, None for a green
+        one.
+        """
+        parts = OrderedDict()
+        if not success:
+            parts[PROJECT] = self._store_part(_project_files(workdir))
+        zip_path = find_deployment_zip(workdir)
+        if zip_path is not None:
+            with zipfile.ZipFile(zip_path) as z:
+                distributions, unrecorded = _split(z)
+                for dist, (files, wheel) in distributions.items():
+                    if wheel is not None:
+                        parts[dist] = self._store_part(files)
+                        self._index_wheel(dist, wheel, parts[dist])
+                    elif not success:
+                        parts[dist] = self._store_part(files)
+                if unrecorded and not success:
+                    parts[DEPLOYMENT] = self._store_part(unrecorded)
+        if success:
+            return None
+        now = time.time()
+        name = 'manifests/%s/%s-%s.json' % (
+            utc_day(now), time.strftime('%H%M%S', time.gmtime(now)),
+            _check_id(key))
+        self._put(name, json.dumps(OrderedDict([
+            ('key', key._asdict()),
+            ('stored_at', now),
+            ('failure_class', failure_class),
+            ('tail', list(tail)),
+            ('parts', parts),
+        ]), indent=2).encode('utf-8'))
+        return name
+
+    def manifests(self, since=None):
+        """Yield the name and content of every manifest from ``since`` on."""
+        since_day = None if since is None else utc_day(since)
+        for name in sorted(self._list('manifests/')):
+            if since_day is not None and name.split('/')[1] < since_day:
+                continue
+            manifest = json.loads(self._get(name).decode('utf-8'))
+            if since is None or manifest['stored_at'] >= since:
+                yield name, manifest
+
+    def restore(self, name, target_dir):
+        """Unpack the outputs a manifest lists into ``target_dir``.
+
+        The project lands in ``target_dir`` itself, the deployment package
+        unzipped in its ``deployment`` directory.
+        """
+        manifest = json.loads(self._get(name).decode('utf-8'))
+        for part, digest in manifest['parts'].items():
+            part_dir = target_dir
+            if part != PROJECT:
+                part_dir = os.path.join(target_dir, DEPLOYMENT)
+            with zipfile.ZipFile(io.BytesIO(self._get(_object(digest)))) as z:
+                z.extractall(part_dir)
+        return manifest
+
+    def export_wheels(self, name, version, wheelhouse):
+        """Write the stored wheels of a release to ``wheelhouse``.
+
+        Returns the number of wheels written.
+        """
+        prefix = 'wheels/%s/%s/' % (normalize_name(name), version)
+        wheels = set()
+        for index_name in self._list(prefix):
+            digest, _, filename = index_name[len(prefix):].split('/')
+            wheels.add((digest, filename))
+        for digest, filename in sorted(wheels):
+            with open(os.path.join(wheelhouse, filename), 'wb') as f:
+                f.write(self._get(_object(digest)))
+        return len(wheels)
+
+    def prune(self, before, timeout=None):
+        """Drop what was last stored before ``before`` and unused parts.
+
+        Expired manifests and wheels no check bundled since are found by
+        the day in their name.  Parts are only removed when every remaining
+        manifest could be read within ``timeout`` seconds, otherwise that is
+        left to the next prune.
+        """
+        expires_at = None if timeout is None else time.time() + timeout
+        cutoff = utc_day(before)
+        manifests = self._list('manifests/')
+        self._delete([name for name in manifests
+                      if name.split('/')[1] < cutoff])
+        wheels = self._list('wheels/')
+        self._delete([name for name in wheels
+                      if name.split('/')[4] < cutoff])
+        used = set()
+        for name in manifests:
+            if expires_at is not None and time.time() >= expires_at:
+                return
+            if name.split('/')[1] >= cutoff:
+                manifest = json.loads(self._get(name).decode('utf-8'))
+                used.update(_object(digest)
+                            for digest in manifest['parts'].values())
+        used.update(_object(name.split('/')[3]) for name in wheels
+                    if name.split('/')[4] >= cutoff)
+        self._delete([name for name in self._list('objects/')
+                      if name not in used])
+
+    def _store_part(self, files):
+        # Parts are looked up every time rather than remembered, a prune in
+        # another invocation may have removed them since.
+        digest = _digest(files)
+        if not self._exists(_object(digest)):
+            self._put(_object(digest), _zip(files))
+        return digest
+
+    def _index_wheel(self, dist, wheel, digest):
+        # The digest and the day are part of the name, so neither exporting
+        # nor pruning has to read the index.  A wheel bundled again gets an
+        # entry for the new day and outlives its older entries.
+        name, version = dist.rsplit('-', 1)
+        index_name = 'wheels/%s/%s/%s/%s/%s' % (
+            normalize_name(name), version, digest, utc_day(time.time()),
+            wheel)
+        if not self._exists(index_name):
+            self._put(index_name, b'')
+
+    def _list(self, prefix):
+        raise NotImplementedError('_list')
+
+    def _exists(self, name):
+        raise NotImplementedError('_exists')
+
+    def _get(self, name):
+        raise NotImplementedError('_get')
+
+    def _put(self, name, data):
+        raise NotImplementedError('_put')
+
+    def _delete(self, names):
+        raise NotImplementedError('_delete')
+
+
+class FileBuildStore(BuildStore):
+    def __init__(self, root):
+        self._root = root
+
+    def _list(self, prefix):
+        names = []
+        for dirpath, _, filenames in os.walk(os.path.join(self._root,
+                                                          prefix)):
+            relpath = os.path.relpath(dirpath, self._root)
+            names.extend('%s/%s' % (relpath.replace(os.sep, '/'), filename)
+                         for filename in filenames
+                         if not filename.endswith('.tmp'))
+        return names
+
+    def _exists(self, name):
+        return os.path.exists(os.path.join(self._root, name))
+
+    def _get(self, name):
+        with open(os.path.join(self._root, name), 'rb') as f:
+            return f.read()
+
+    def _put(self, name, data):
+        path = os.path.join(self._root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '%s.%s.tmp' % (path, threading.get_ident())
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _delete(self, names):
+        for name in names:
+            os.remove(os.path.join(self._root, name))
+
+
+class S3BuildStore(BuildStore):
+    def __init__(self, bucket, prefix='builds/', client=None):
+        self._objects = S3Objects(bucket, prefix, client)
+
+    def _list(self, prefix):
+        return self._objects.list(prefix)
+
+    def _exists(self, name):
+        return self._objects.exists(name)
+
+    def _get(self, name):
+        return self._objects.get(name)
+
+    def _put(self, name, data):
+        self._objects.put(name, data)
+
+    def _delete(self, names):
+        self._objects.delete(names)
+
+
+def _project_files(workdir):
+    files = []
+    for dirpath, dirnames, filenames in os.walk(workdir):
+        dirnames[:] = [dirname for dirname in dirnames
+                       if dirname not in _BUILD_DIRS]
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            # The deployment package, and chalice's cached copy of it
+            # under .chalice/deployments, are stored by their contents.
+            if filename.endswith('.zip') or not os.path.isfile(path):
+                continue
+            arcname = os.path.relpath(path, workdir).replace(os.sep, '/')
+            files.append((arcname, os.stat(path).st_mode & 0o777,
+                          _file_reader(path)))
+    return files
+
+
+def _file_reader(path):
+    def read():
+        with open(path, 'rb') as f:
+            return f.read()
+    return read
+
+
+def _split(z):
+    """Split a deployment package into its distributions.
+
+    Returns the files of every distribution, with the wheel filename it can
+    be exported as when the package holds all of it, and the files no
+    RECORD lists.
+    """
+    infos = OrderedDict((info.filename, info) for info in z.infolist()
+                        if not info.is_dir())
+    claimed = set()
+    distributions = OrderedDict()
+    for name in sorted(infos):
+        match = re.match(r'([^/]+)\.dist-info/RECORD$', name)
+        if not match:
+            continue
+        record = z.read(name).decode('utf-8')
+        # Paths outside the package, such as scripts, were never in it.
+        paths = [row[0] for row in csv.reader(io.StringIO(record))
+                 if row and not row[0].startswith('../')]
+        present = [path for path in paths
+                   if path in infos and path not in claimed]
+        claimed.update(present)
+        wheel = None
+        if len(present) == len(paths):
+            wheel = _wheel_filename(z, match.group(1), infos)
+        distributions[match.group(1)] = (
+            [_member(z, infos[path]) for path in present], wheel)
+    unrecorded = [_member(z, info) for name, info in infos.items()
+                  if name not in claimed]
+    return distributions, unrecorded
+
+
+def _member(z, info):
+    mode = (info.external_attr >> 16) & 0o777 or _DEFAULT_MODE
+    return info.filename, mode, lambda: z.read(info)
+
+
+def _wheel_filename(z, dist, infos):
+    wheel_file = '%s.dist-info/WHEEL' % dist
+    if wheel_file not in infos:
+        return None
+    tags = [line.split(':', 1)[1].strip().split('-')
+            for line in z.read(wheel_file).decode('utf-8').splitlines()
+            if line.startswith('Tag:')]
+    if not tags:
+        return None
+    # Tags like py2-none-any and py3-none-any make py2.py3-none-any.
+    return '%s-%s.whl' % (dist, '-'.join(
+        '.'.join(sorted(set(tag[i] for tag in tags))) for i in range(3)))
+
+
+def _digest(files):
+    digest = hashlib.sha256()
+    for arcname, mode, read in sorted(files, key=lambda f: f[0]):
+        digest.update(('%s\0%o\0%s\n' % (
+            arcname, mode, hashlib.sha256(read()).hexdigest())).encode(
+                'utf-8'))
+    return digest.hexdigest()
+
+
+def _zip(files):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+        for arcname, mode, read in sorted(files, key=lambda f: f[0]):
+            info = zipfile.ZipInfo(arcname, date_time=_ZIP_DATE)
+            info.external_attr = mode << 16
+            info.compress_type = zipfile.ZIP_DEFLATED
+            z.writestr(info, read())
+    return buf.getvalue()
+
+
+def _object(digest):
+    return 'objects/%s/%s.zip' % (digest[:2], digest)
+
+
+def _check_id(key):
+    return '%s-chalice-%s-%s' % (
+        re.sub(r'[^A-Za-z0-9.]+', '-', key.package), key.chalice_version,
+        key.runtime)
@@ -0,0 +1,87 @@
+import re
+from collections import deque
+
+
+MISSING_WHEEL = 'missing_wheel'
+SDIST_BUILD = 'sdist_build'
+NO_SUCH_PACKAGE = 'no_such_package'
+NETWORK = 'network'
+TIMEOUT = 'timeout'
+UNKNOWN = 'unknown'
+# Not checked because a package it depends on could not be packaged.
+DEPENDENCY_FAILED = 'dependency_failed'
+
+_MISSING_DEPENDENCIES = 'Could not install dependencies:'
+_NETWORK_PATTERN = re.compile(
+    r'Max retries exceeded|ConnectionError|ConnectTimeoutError|'
+    r'ReadTimeoutError|Temporary failure in name resolution|'
+    r'Connection reset by peer|Connection refused|SSLError')
+_NO_SUCH_PACKAGE_PATTERN = re.compile(
+    r'Could not find a version that satisfies the requirement|'
+    r'Could not satisfy the requirement|NoSuchPackageError')
+# Once the missing dependencies line is seen chalice only lists the missing
+# packages followed by a hint on how to vendor them.
+_MISSING_LIST_END = 'You will have to build these yourself'
+_MAX_MISSING_LINES = 100
+
+
+class OutputClassifier(object):
+    """Classify the outcome of a packaging run from its output, line by line.
+
+    Only the last ``tail_size`` lines are kept for logging.  ``feed`` returns
+    True once the outcome is definitive and the rest of the output can be
+    skipped.  ``sdist_only`` is the set of normalized names of packages that
+    are only distributed as an sdist, used to tell a failed sdist build from
+    a missing manylinux wheel.
+    """
+    def __init__(self, sdist_only=(), tail_size=20):
+        self.tail = deque(maxlen=tail_size)
+        self._sdist_only = set(sdist_only)
+        self._failure_class = None
+        self._missing = []
+
+    def feed(self, line):
+        line = line.rstrip('\n')
+        self.tail.append(line)
+        if self._failure_class == MISSING_WHEEL:
+            if (not line.strip() or line.startswith(_MISSING_LIST_END) or
+                    len(self._missing) >= _MAX_MISSING_LINES):
+                return True
+            self._missing.append(line.strip())
+            return False
+        if _MISSING_DEPENDENCIES in line:
+            self._failure_class = MISSING_WHEEL
+        elif self._failure_class is None:
+            if _NO_SUCH_PACKAGE_PATTERN.search(line):
+                self._failure_class = NO_SUCH_PACKAGE
+                return True
+            elif _NETWORK_PATTERN.search(line):
+                self._failure_class = NETWORK
+        return False
+
+    def add_missing(self, identifiers, sdists=()):
+        if identifiers:
+            self._failure_class = MISSING_WHEEL
+            self._missing.extend(identifiers)
+            self._sdist_only.update(_package_name(sdist) for sdist in sdists)
+
+    def finish(self, returncode):
+        """Return the failure class, or None if packaging succeeded."""
+        if self._failure_class == MISSING_WHEEL:
+            if any(_package_name(missing) in self._sdist_only
+                   for missing in self._missing):
+                return SDIST_BUILD
+            return MISSING_WHEEL
+        # Network errors pip retried past, or a lookup it recovered from,
+        # do not fail a run that packaged.
+        if not returncode:
+            return None
+        return self._failure_class or UNKNOWN
+
+
+def normalize_name(name):
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def _package_name(identifier):
+    return normalize_name(re.split(r'[=<>!~;\[\s]', identifier, 1)[0])
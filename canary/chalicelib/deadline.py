@@ -0,0 +1,41 @@
+import os
+import time
+
+
+# Time kept back from the invocation timeout to flush metrics and save
+# results after the last check was cancelled.
+_RESERVE_SECONDS = 15
+
+
+class Deadline(object):
+    def __init__(self, expires_at):
+        self.expires_at = expires_at
+
+    @classmethod
+    def for_invocation(cls, context=None, reserve=_RESERVE_SECONDS):
+        if context is not None:
+            remaining = context.get_remaining_time_in_millis() / 1000.0
+        else:
+            # Scheduled events do not carry the lambda context in every
+            # chalice version, fall back to the configured function timeout
+            # counted from the start of the handler.
+            remaining = float(os.environ.get('CANARY_TIMEOUT_SECONDS', '300'))
+        return cls(time.time() + remaining - reserve)
+
+    def earliest(self, expires_at):
+        if expires_at is None:
+            return self
+        return Deadline(min(self.expires_at, expires_at))
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.time())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, limit=None):
+        """Seconds a single operation may take, at most ``limit``."""
+        remaining = self.remaining()
+        if limit is None:
+            return remaining
+        return min(limit, remaining)
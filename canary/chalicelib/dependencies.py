@@ -0,0 +1,174 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from packaging.requirements import Requirement
+
+from chalicelib import pypi
+from chalicelib.classify import normalize_name
+
+
+LOG = logging.getLogger(__name__)
+
+
+class DependencyGraph(object):
+    """Which requirements of the package list depend on which others.
+
+    ``edges`` maps every requirement to the requirements it depends on.
+    Only dependencies that are themselves in the list are kept, packages
+    outside of it are not followed, so a dependency through a package that
+    is not checked is not seen.
+    """
+    def __init__(self, edges):
+        self._edges = {requirement: set(dependencies)
+                       for requirement, dependencies in edges.items()}
+
+    @classmethod
+    def resolve(cls, versions, cache=None, max_workers=16):
+        """Build the graph from what PyPI lists for each checked release.
+
+        ``versions`` maps requirements to the release they resolved to.
+        ``cache`` maps ``(name, version)`` to the release's requirements and
+        can be shared between calls, a release never changes them.  Releases
+        that cannot be looked up are treated as having no dependencies.  A
+        requirement only depends on an entry of the list when it installs
+        the same release, ``Jinja2`` does not depend on ``MarkupSafe<2``
+        when it pulls in MarkupSafe 2.
+        """
+        if cache is None:
+            cache = {}
+        by_name = {}
+        for requirement in versions:
+            by_name.setdefault(_name(requirement), []).append(requirement)
+
+        def lookup(item):
+            name, version = item
+            if version is None:
+                return []
+            if (name, version) not in cache:
+                try:
+                    cache[(name, version)] = pypi.requires(name, version)
+                except Exception as e:
+                    LOG.warning('Could not look up the dependencies of '
+                                '%s %s: %s', name, version, e)
+                    return []
+            return cache[(name, version)]
+        items = [(Requirement(requirement).name, version)
+                 for requirement, version in versions.items()]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            declared = [list(_required(requires))
+                        for requires in executor.map(lookup, items)]
+            # Which release a specifier picks for an entry that is not the
+            # latest release takes the entry's other releases to tell.
+            names = sorted({
+                name for requires in declared for name, _ in requires
+                if any(Requirement(entry).specifier
+                       for entry in by_name.get(name, ()))})
+            releases = dict(zip(names, executor.map(_project_info, names)))
+        edges = {}
+        for requirement, requires in zip(versions, declared):
+            edges[requirement] = {
+                dependency
+                for name, specifier in requires
+                for dependency in by_name.get(name, [])
+                if dependency != requirement and _installs(
+                    specifier, dependency, versions[dependency],
+                    releases.get(name))}
+        return cls(edges)
+
+    def dependencies(self, requirement):
+        """Every requirement ``requirement`` depends on, directly or not."""
+        seen = set()
+        pending = list(self._edges.get(requirement, ()))
+        while pending:
+            dependency = pending.pop()
+            if dependency not in seen and dependency != requirement:
+                seen.add(dependency)
+                pending.extend(self._edges.get(dependency, ()))
+        return seen
+
+    def levels(self, requirements):
+        """Split ``requirements`` into levels in dependency order.
+
+        Nothing depends on a requirement of the same or a later level.
+        Requirements in a dependency cycle share the last level with
+        everything that depends on them.
+        """
+        remaining = list(requirements)
+        levels = []
+        while remaining:
+            level = [requirement for requirement in remaining
+                     if not self._edges.get(requirement, set()) &
+                     set(remaining)]
+            if not level:
+                level = remaining
+            levels.append(level)
+            remaining = [requirement for requirement in remaining
+                         if requirement not in level]
+        return levels
+
+    def components(self, requirements):
+        """Group ``requirements`` connected by dependencies, in order."""
+        requirements = list(requirements)
+        neighbours = {requirement: set() for requirement in requirements}
+        for requirement in requirements:
+            for dependency in self._edges.get(requirement, ()):
+                if dependency in neighbours:
+                    neighbours[requirement].add(dependency)
+                    neighbours[dependency].add(requirement)
+        components, seen = [], set()
+        for requirement in requirements:
+            if requirement in seen:
+                continue
+            component, pending = set(), [requirement]
+            while pending:
+                current = pending.pop()
+                if current not in component:
+                    component.add(current)
+                    pending.extend(neighbours[current])
+            seen.update(component)
+            components.append([r for r in requirements if r in component])
+        return components
+
+
+def _name(requirement):
+    return normalize_name(Requirement(requirement).name)
+
+
+def _required(requires):
+    """Yield the name and specifier of every requirement installed."""
+    for declared in requires:
+        try:
+            parsed = Requirement(declared)
+            # Optional extras are not installed when checking the package.
+            if parsed.marker and not parsed.marker.evaluate({'extra': ''}):
+                continue
+        except Exception:
+            continue
+        yield normalize_name(parsed.name), parsed.specifier
+
+
+def _installs(specifier, entry, version, info):
+    """Whether ``specifier`` installs the release ``entry`` resolved to.
+
+    An entry without a specifier is the latest release, which every
+    specifier that allows it picks.  Otherwise it takes the releases in
+    ``info`` to tell, without them the entry is assumed not to be the one.
+    """
+    if version is None or not specifier.contains(version, prereleases=True):
+        return False
+    if not Requirement(entry).specifier:
+        return True
+    if info is None:
+        return False
+    try:
+        return pypi.newest_release(info, specifier) == version
+    except ValueError:
+        return False
+
+
+def _project_info(name):
+    try:
+        return pypi.project_info(name)
+    except Exception as e:
+        LOG.warning('Could not look up the releases of %s: %s', name, e)
+        return None
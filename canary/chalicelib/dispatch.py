@@ -0,0 +1,115 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError
+
+import boto3
+from botocore.config import Config
+
+
+def shard(items, shard_size):
+    items = list(items)
+    if not shard_size:
+        return [items]
+    return [items[i:i + shard_size]
+            for i in range(0, len(items), shard_size)]
+
+
+def shard_groups(groups, shard_size):
+    """Like ``shard`` for lists of items that must share a shard.
+
+    A group larger than ``shard_size`` gets a shard of its own.
+    """
+    groups = list(groups)
+    if not shard_size:
+        return [[item for group in groups for item in group]]
+    shards = []
+    for group in groups:
+        if not shards or len(shards[-1]) + len(group) > shard_size:
+            shards.append([])
+        shards[-1].extend(group)
+    return shards
+
+
+class ShardFailedError(Exception):
+    def __init__(self, payload, error):
+        super(ShardFailedError, self).__init__(
+            'Shard %s failed: %s' % (payload, error))
+        self.payload = payload
+        self.error = error
+
+
+class LocalDispatcher(object):
+    """Run every shard in process, one after another."""
+    # Number of shards checked at the same time.
+    concurrency = 1
+
+    def __init__(self, handler):
+        self._handler = handler
+
+    def dispatch(self, payloads, timeout=None):
+        results, failures = [], []
+        for payload in payloads:
+            try:
+                results.append(self._handler(payload))
+            except Exception as e:
+                failures.append(ShardFailedError(payload, e))
+        return results, failures
+
+
+class LambdaDispatcher(object):
+    """Run every shard as a synchronous invocation of a worker function.
+
+    The invocations happen concurrently so the total wall clock time is that
+    of the slowest shard rather than the sum of all of them.
+    """
+    def __init__(self, function_name, client=None, max_workers=32,
+                 read_timeout=330):
+        if client is None:
+            client = boto3.client(
+                'lambda', config=Config(read_timeout=read_timeout,
+                                        retries={'max_attempts': 0}))
+        self._function_name = function_name
+        self._client = client
+        self._max_workers = max_workers
+        self.concurrency = max_workers
+
+    def dispatch(self, payloads, timeout=None):
+        results, failures = [], []
+        if not payloads:
+            return results, failures
+        expires_at = None if timeout is None else time.time() + timeout
+        max_workers = min(self._max_workers, len(payloads))
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        futures = [(payload, executor.submit(self._invoke, payload))
+                   for payload in payloads]
+        # Do not wait for shards still running past the timeout, the
+        # coordinator needs the time left to aggregate what did finish.
+        executor.shutdown(wait=False)
+        for payload, future in futures:
+            try:
+                results.append(future.result(timeout=_remaining(expires_at)))
+            except TimeoutError:
+                failures.append(ShardFailedError(payload, 'timed out'))
+            except ShardFailedError as e:
+                failures.append(e)
+            except Exception as e:
+                failures.append(ShardFailedError(payload, e))
+        return results, failures
+
+    def _invoke(self, payload):
+        response = self._client.invoke(
+            FunctionName=self._function_name,
+            InvocationType='RequestResponse',
+            Payload=json.dumps(payload).encode('utf-8'),
+        )
+        body = json.loads(response['Payload'].read().decode('utf-8'))
+        if 'FunctionError' in response:
+            raise ShardFailedError(payload, body)
+        return body
+
+
+def _remaining(expires_at):
+    if expires_at is None:
+        return None
+    return max(0, expires_at - time.time())
@@ -0,0 +1,152 @@
+import os
+import sys
+import shutil
+import logging
+import tarfile
+from subprocess import CalledProcessError
+
+import virtualenv
+
+from chalicelib import proc
+from chalicelib import pypi
+from chalicelib import trace
+from chalicelib.s3objects import S3Objects
+
+
+LOG = logging.getLogger(__name__)
+
+_COMPLETE_MARKER = '.canary-complete'
+
+
+class CanaryEnvironment(object):
+    """A virtualenv with chalice installed that outlives a single run.
+
+    Environments are built under ``root`` in a directory named after the
+    chalice version they contain, so on a warm container the environment
+    from the previous invocation is reused as is and a new one is only
+    built when a new chalice release shows up.  Since a virtualenv is not
+    relocatable the snapshots always unpack to the same absolute path they
+    were built at.  Environments for the chalice versions in ``keep`` are
+    left alone when another one is built, so a version matrix does not
+    rebuild them on every run.
+    """
+    def __init__(self, root, snapshots=None):
+        self._root = root
+        self._snapshots = snapshots
+
+    def prepare(self, wheel_cache, version, timeout=None, keep=()):
+        venv_dir = os.path.join(self._root, 'chalice-%s' % version)
+        if not self._is_complete(venv_dir):
+            # An incomplete environment for this version is removed too.
+            self._remove_stale_environments(set(keep) - {version})
+            with trace.span('restore_snapshot', version=version):
+                restored = self._restore_snapshot(venv_dir)
+            if not restored:
+                self._build(venv_dir, version, wheel_cache, timeout)
+                with trace.span('save_snapshot', version=version):
+                    self._save_snapshot(venv_dir)
+        # Chalice only ever runs as a subprocess of the environment's
+        # python, activating it here would only grow sys.path with every
+        # version and warm invocation.
+        return os.path.join(venv_dir, 'bin', 'python')
+
+    def resolve_chalice_version(self):
+        try:
+            return pypi.latest_version('chalice')
+        except Exception:
+            LOG.warning('Unable to look up the latest chalice version, '
+                        'reusing the newest local environment.',
+                        exc_info=True)
+            existing = self._existing_versions()
+            if not existing:
+                raise
+            return existing[-1]
+
+    def _existing_versions(self):
+        if not os.path.isdir(self._root):
+            return []
+        return sorted(
+            (name[len('chalice-'):] for name in os.listdir(self._root)
+             if name.startswith('chalice-') and
+             self._is_complete(os.path.join(self._root, name))),
+            key=_version_key)
+
+    def _is_complete(self, venv_dir):
+        return os.path.isfile(os.path.join(venv_dir, _COMPLETE_MARKER))
+
+    def _remove_stale_environments(self, keep):
+        if not os.path.isdir(self._root):
+            return
+        keep_names = {'chalice-%s' % version for version in keep}
+        for name in os.listdir(self._root):
+            if name not in keep_names:
+                shutil.rmtree(os.path.join(self._root, name),
+                              ignore_errors=True)
+
+    def _build(self, venv_dir, version, wheel_cache, timeout):
+        with trace.span('create_venv', version=version):
+            virtualenv.create_environment(venv_dir)
+        py_exe = os.path.join(venv_dir, 'bin', 'python')
+        args = [py_exe, '-m', 'pip', 'install', 'chalice==%s' % version]
+        with trace.span('install_chalice', version=version):
+            p, _ = proc.run(args, env=wheel_cache.environ(), timeout=timeout)
+        if p.returncode != 0:
+            raise CalledProcessError(p.returncode, args)
+        open(os.path.join(venv_dir, _COMPLETE_MARKER), 'w').close()
+
+    def _restore_snapshot(self, venv_dir):
+        if self._snapshots is None:
+            return False
+        name = os.path.basename(venv_dir)
+        archive = os.path.join(self._root, '%s.tar.gz' % name)
+        os.makedirs(self._root, exist_ok=True)
+        try:
+            if not self._snapshots.download(_snapshot_key(name), archive):
+                return False
+            with tarfile.open(archive, 'r:gz') as tar:
+                tar.extractall(self._root)
+        finally:
+            if os.path.exists(archive):
+                os.remove(archive)
+        return self._is_complete(venv_dir)
+
+    def _save_snapshot(self, venv_dir):
+        if self._snapshots is None:
+            return
+        name = os.path.basename(venv_dir)
+        archive = os.path.join(self._root, '%s.tar.gz' % name)
+        try:
+            with tarfile.open(archive, 'w:gz') as tar:
+                tar.add(venv_dir, arcname=name)
+            self._snapshots.upload(archive, _snapshot_key(name))
+        except Exception:
+            # The environment itself is usable, failing to share it only
+            # costs the next cold start a rebuild.
+            LOG.warning('Unable to save environment snapshot %s', name,
+                        exc_info=True)
+        finally:
+            if os.path.exists(archive):
+                os.remove(archive)
+
+
+class S3SnapshotStore(object):
+    def __init__(self, bucket, prefix='environments/', client=None):
+        self._objects = S3Objects(bucket, prefix, client)
+
+    def download(self, key, filename):
+        return self._objects.download(key, filename)
+
+    def upload(self, filename, key):
+        self._objects.upload(filename, key)
+
+
+def _snapshot_key(name):
+    # Compiled wheels inside the environment are specific to the
+    # interpreter, so the snapshot is keyed on it as well.
+    return '%s-py%s%s.tar.gz' % (name, sys.version_info[0],
+                                 sys.version_info[1])
+
+
+def _version_key(version):
+    return [int(part) if part.isdigit() else 0
+            for part in version.split('.')]
@@ -0,0 +1,158 @@
+import os
+import gzip
+import json
+import time
+import uuid
+import threading
+
+from chalicelib.s3objects import S3Objects
+from chalicelib.s3objects import utc_day
+
+
+# Name of the chunk a day's chunks are merged into by ``compact``.
+_DAY_CHUNK = 'day.jsonl.gz'
+
+
+class HistoryStore(object):
+    """Append only history of every check result.
+
+    ``add`` is safe to call from any worker thread and never does I/O, the
+    collected records are written when ``flush`` is called, as one gzipped
+    JSON lines chunk per flush under a directory for the UTC day.  Chunks are
+    never rewritten, except by ``compact`` merging the chunks of past days
+    into one, so that reading months of history does not take a request per
+    run.  Subclasses implement ``_list``, ``_get``, ``_put`` and ``_delete``
+    for chunk names relative to the store.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+
+    def add(self, key, record=None, **fields):
+        """Add the result of the check of ``key``.
+
+        ``record`` is the ``CheckRecord`` of the check, when it ran.
+        """
+        row = dict(key._asdict(), checked_at=time.time())
+        if record is not None:
+            row.update((name, value)
+                       for name, value in record.to_dict().items()
+                       if name not in ('package', 'dimensions'))
+        row.update(fields)
+        with self._lock:
+            self._pending.append(row)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if pending:
+            name = '%s/%s-%s.jsonl.gz' % (
+                utc_day(time.time()), time.strftime('%H%M%S', time.gmtime()),
+                uuid.uuid4().hex[:12])
+            try:
+                self._put(name, _encode(pending))
+            except Exception:
+                with self._lock:
+                    self._pending[:0] = pending
+                raise
+
+    def read(self, since=None):
+        """Yield every record of the days from ``since`` on."""
+        since_day = None if since is None else utc_day(since)
+        for name in sorted(self._list()):
+            if since_day is not None and name.split('/')[0] < since_day:
+                continue
+            for row in _decode(self._get(name)):
+                if since is None or row['checked_at'] >= since:
+                    yield row
+
+    def compact(self, before=None):
+        """Merge the chunks of every day before ``before`` into one."""
+        if before is None:
+            before = time.time()
+        by_day = {}
+        for name in self._list():
+            day = name.split('/')[0]
+            if day < utc_day(before):
+                by_day.setdefault(day, []).append(name)
+        for day, names in sorted(by_day.items()):
+            if names == ['%s/%s' % (day, _DAY_CHUNK)]:
+                continue
+            rows = [row for name in sorted(names)
+                    for row in _decode(self._get(name))]
+            rows.sort(key=lambda row: row['checked_at'])
+            self._put('%s/%s' % (day, _DAY_CHUNK), _encode(rows))
+            self._delete([name for name in names
+                          if not name.endswith('/' + _DAY_CHUNK)])
+
+    def _list(self):
+        raise NotImplementedError('_list')
+
+    def _get(self, name):
+        raise NotImplementedError('_get')
+
+    def _put(self, name, data):
+        raise NotImplementedError('_put')
+
+    def _delete(self, names):
+        raise NotImplementedError('_delete')
+
+
+class FileHistoryStore(HistoryStore):
+    def __init__(self, root):
+        super(FileHistoryStore, self).__init__()
+        self._root = root
+
+    def _list(self):
+        if not os.path.isdir(self._root):
+            return []
+        return ['%s/%s' % (day, name)
+                for day in os.listdir(self._root)
+                for name in os.listdir(os.path.join(self._root, day))
+                if name.endswith('.jsonl.gz')]
+
+    def _get(self, name):
+        with open(os.path.join(self._root, name), 'rb') as f:
+            return f.read()
+
+    def _put(self, name, data):
+        path = os.path.join(self._root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '%s.tmp' % path
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _delete(self, names):
+        for name in names:
+            os.remove(os.path.join(self._root, name))
+
+
+class S3HistoryStore(HistoryStore):
+    def __init__(self, bucket, prefix='history/', client=None):
+        super(S3HistoryStore, self).__init__()
+        self._objects = S3Objects(bucket, prefix, client)
+
+    def _list(self):
+        return self._objects.list()
+
+    def _get(self, name):
+        return self._objects.get(name)
+
+    def _put(self, name, data):
+        self._objects.put(name, data)
+
+    def _delete(self, names):
+        self._objects.delete(names)
+
+
+def _encode(rows):
+    return gzip.compress(''.join(
+        '%s\n' % json.dumps(row, sort_keys=True, separators=(',', ':'))
+        for row in rows).encode('utf-8'))
+
+
+def _decode(data):
+    for line in gzip.decompress(data).decode('utf-8').splitlines():
+        if line:
+            yield json.loads(line)
@@ -0,0 +1,105 @@
+import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from chalicelib import trace
+
+
+class CheckRecord(object):
+    """Timings and resource usage of a single package check.
+
+    ``dimensions`` identify the check in the published metrics and default
+    to the package name.
+    """
+    def __init__(self, package, dimensions=None):
+        self.package = package
+        if dimensions is None:
+            dimensions = {'Name': package}
+        self.dimensions = dict(dimensions)
+        self.success = None
+        self.failure_class = None
+        self.phases = OrderedDict()
+        self.peak_rss_kb = 0
+        self.bytes_downloaded = 0
+        self.disk_usage = 0
+        # Set from the deployment package when packaging succeeded.
+        self.artifact = None
+        self.import_seconds = None
+        # Trace lane of a check run by the async engine.
+        self.lane = None
+        self._start = time.time()
+        self._duration = None
+
+    @property
+    def duration(self):
+        return self._duration
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            with trace.span(name, lane=self.lane):
+                yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.time() - start
+
+    def add_usage(self, rusage):
+        # ru_maxrss is reported in kilobytes on Linux.
+        self.peak_rss_kb = max(self.peak_rss_kb, rusage.ru_maxrss)
+
+    def finish(self, success, failure_class=None):
+        self.success = success
+        self.failure_class = failure_class
+        self._duration = time.time() - self._start
+
+    def to_dict(self):
+        return {
+            'package': self.package,
+            'dimensions': self.dimensions,
+            'success': self.success,
+            'failure_class': self.failure_class,
+            'duration': self._duration,
+            'phases': dict(self.phases),
+            'peak_rss_kb': self.peak_rss_kb,
+            'bytes_downloaded': self.bytes_downloaded,
+            'disk_usage': self.disk_usage,
+            'artifact': (None if self.artifact is None
+                         else dict(self.artifact._asdict())),
+            'import_seconds': self.import_seconds,
+        }
+
+    def emit(self, log, sink):
+        log.info('Check record: %s', json.dumps(self.to_dict()))
+        dimensions = self.dimensions
+        sink.add('duration', self._duration,
+                 dict(dimensions, Phase='total'), unit='Seconds')
+        for name, seconds in self.phases.items():
+            sink.add('duration', seconds, dict(dimensions, Phase=name),
+                     unit='Seconds')
+        if self.peak_rss_kb:
+            # Zero means the engine could not measure it.
+            sink.add('peak_rss', self.peak_rss_kb, dimensions,
+                     unit='Kilobytes')
+        sink.add('bytes_downloaded', self.bytes_downloaded, dimensions,
+                 unit='Bytes')
+        sink.add('disk_usage', self.disk_usage, dimensions, unit='Bytes')
+        if self.artifact is not None:
+            sink.add('artifact_bytes', self.artifact.compressed_bytes,
+                     dimensions, unit='Bytes')
+            sink.add('artifact_files', self.artifact.files, dimensions,
+                     unit='Count')
+            sink.add('native_libraries', self.artifact.native_libraries,
+                     dimensions, unit='Count')
+            for metric_dimensions in [dimensions, {}]:
+                # The aggregate is what the bundle size alarm watches.
+                sink.add('artifact_unzipped_bytes',
+                         self.artifact.uncompressed_bytes, metric_dimensions,
+                         unit='Bytes')
+        if self.import_seconds is not None:
+            sink.add('import_time', self.import_seconds, dimensions,
+                     unit='Seconds')
+        if self.failure_class is not None:
+            sink.add('failure', 1,
+                     dict(Name=self.package, FailureClass=self.failure_class))
+            sink.add('failure', 1, {'FailureClass': self.failure_class})
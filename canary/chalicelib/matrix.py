@@ -0,0 +1,279 @@
+import os
+import re
+import json
+import codecs
+import logging
+from collections import namedtuple
+from collections import OrderedDict
+
+from packaging.version import Version
+from packaging.requirements import Requirement
+
+from chalicelib.classify import normalize_name
+from chalicelib.s3objects import S3Objects
+
+
+LOG = logging.getLogger(__name__)
+
+
+LATEST = 'latest'
+CRITICAL, STANDARD, LONG_TAIL = 'critical', 'standard', 'long_tail'
+TIERS = [CRITICAL, STANDARD, LONG_TAIL]
+
+Cell = namedtuple('Cell', ['requirement', 'chalice', 'runtime'])
+# How a package is scheduled.  ``every_hours`` is how old its last result
+# may get before it is checked again and ``expected_seconds`` what a check
+# costs before one has been timed, None for the canary's defaults.
+PackageSettings = namedtuple('PackageSettings',
+                             ['tier', 'every_hours', 'expected_seconds'])
+DEFAULT_SETTINGS = PackageSettings(STANDARD, None, None)
+
+
+class Matrix(object):
+    """The package checks described by ``packages.json``.
+
+    The file is either a list of requirements, checked against the latest
+    chalice release on the runtime the canary runs on, or an object with a
+    ``packages`` list of requirements and optional ``chalice_versions`` and
+    ``runtimes`` lists that are checked in every combination.  Chalice
+    versions are ``latest`` or a released version, runtimes are Lambda
+    runtime names such as ``python3.6``.  A package is either a requirement
+    or an object with a ``requirement`` and any of ``tier``,
+    ``every_hours`` and ``expected_seconds``, see ``PackageSettings``.
+    """
+    def __init__(self, requirements, chalice_versions, runtimes,
+                 default_runtime, settings=None):
+        # Fail on the whole list rather than on one cell at check time, and
+        # check entries that only differ in spelling once.
+        self.requirements = _unique(requirements, _requirement_id)
+        self.chalice_versions = _unique(chalice_versions, _chalice_version)
+        self.runtimes = _unique(runtimes, _runtime)
+        self.default_runtime = default_runtime
+        self._settings = dict(settings or {})
+
+    @classmethod
+    def load(cls, filename, default_runtime):
+        document = json.loads(codecs.open(filename, 'r',
+                                          encoding='utf-8').read())
+        return cls.from_document(document, default_runtime)
+
+    @classmethod
+    def from_document(cls, document, default_runtime):
+        if isinstance(document, list):
+            document = {'packages': document}
+        if not isinstance(document, dict) or 'packages' not in document:
+            raise ValueError('A package list is a list of requirements or '
+                             'an object with a "packages" list')
+        packages = document['packages']
+        if not isinstance(packages, list) or not packages:
+            raise ValueError('"packages" must be a non-empty list')
+        requirements, settings = [], {}
+        for package in packages:
+            requirement, package_settings = _package(package)
+            requirements.append(requirement)
+            settings.setdefault(requirement.strip(), package_settings)
+        return cls(requirements,
+                   _strings(document, 'chalice_versions', [LATEST]),
+                   _strings(document, 'runtimes', [default_runtime]),
+                   default_runtime, settings)
+
+    def settings(self, requirement):
+        return self._settings.get(requirement, DEFAULT_SETTINGS)
+
+    def cells(self):
+        return [Cell(requirement, chalice, runtime)
+                for requirement in self.requirements
+                for chalice in self.chalice_versions
+                for runtime in self.runtimes]
+
+    def dimensions(self, cell):
+        # The cell every canary checked before the matrix existed keeps its
+        # original dimensions so existing dashboards and alarms still apply.
+        dimensions = OrderedDict([('Name', cell.requirement)])
+        if cell.chalice != LATEST or cell.runtime != self.default_runtime:
+            dimensions['ChaliceVersion'] = cell.chalice
+            dimensions['Runtime'] = cell.runtime
+        return dimensions
+
+
+class MatrixProvider(object):
+    """Load the matrix on first use and reload it when its source changes.
+
+    ``get`` asks the source whether the document changed since the last
+    load, which for S3 is a conditional request that transfers nothing
+    when it did not.  A changed document that is not a valid package list,
+    or a source that cannot be read at all, is logged and the last valid
+    matrix is kept, so neither a bad edit nor an S3 outage stops the
+    canary.
+    """
+    def __init__(self, source, default_runtime):
+        self._source = source
+        self._default_runtime = default_runtime
+        self._matrix = None
+        self._version = None
+
+    def get(self):
+        try:
+            changed = self._source.fetch(self._version)
+            if changed is not None:
+                document, version = changed
+                self._matrix = Matrix.from_document(document,
+                                                    self._default_runtime)
+                self._version = version
+        except ValueError as e:
+            if self._matrix is None:
+                raise
+            LOG.error('Keeping the previous package list, the new one is '
+                      'not valid: %s', e)
+        except Exception as e:
+            if self._matrix is None:
+                raise
+            LOG.error('Keeping the previous package list, could not fetch '
+                      'the current one: %s', e)
+        return self._matrix
+
+
+class FileMatrixSource(object):
+    def __init__(self, filename):
+        self._filename = filename
+
+    def fetch(self, version=None):
+        """Return the document and its version, None if unchanged."""
+        stat = os.stat(self._filename)
+        current = '%s-%s' % (stat.st_mtime_ns, stat.st_size)
+        if current == version:
+            return None
+        with codecs.open(self._filename, 'r', encoding='utf-8') as f:
+            return json.loads(f.read()), current
+
+
+class S3MatrixSource(object):
+    """A package list in S3, versioned by the object's ETag.
+
+    Until the object exists the list comes from ``fallback``, another
+    source such as the file deployed with the canary.
+    """
+    def __init__(self, bucket, key, fallback=None, client=None):
+        self._objects = S3Objects(bucket, '', client)
+        self._key = key
+        self._fallback = fallback
+
+    def fetch(self, version=None):
+        etag = None
+        if version is not None and not version.startswith('fallback:'):
+            etag = version
+        try:
+            changed = self._objects.fetch(self._key, etag)
+        except KeyError:
+            if self._fallback is None:
+                raise
+            return self._fetch_fallback(version)
+        if changed is None:
+            return None
+        data, etag = changed
+        try:
+            document = json.loads(data.decode('utf-8'))
+        except ValueError as e:
+            raise ValueError('%s is not valid JSON: %s'
+                             % (self._objects.url(self._key), e))
+        return document, etag
+
+    def _fetch_fallback(self, version):
+        if version is not None and version.startswith('fallback:'):
+            version = version[len('fallback:'):]
+        else:
+            version = None
+        changed = self._fallback.fetch(version)
+        if changed is None:
+            return None
+        document, version = changed
+        return document, 'fallback:%s' % version
+
+
+def pinned_requirement(requirement, version):
+    """Pin ``requirement`` to the ``version`` it was resolved to."""
+    if version is None:
+        return requirement
+    parsed = Requirement(requirement)
+    extras = ''
+    if parsed.extras:
+        extras = '[%s]' % ','.join(sorted(parsed.extras))
+    return '%s%s==%s' % (parsed.name, extras, version)
+
+
+def _strings(document, name, default=None):
+    values = document.get(name, default)
+    if (not isinstance(values, list) or not values or
+            not all(isinstance(value, str) for value in values)):
+        raise ValueError('"%s" must be a non-empty list of strings' % name)
+    return values
+
+
+def _package(package):
+    if isinstance(package, str):
+        return package, DEFAULT_SETTINGS
+    if not isinstance(package, dict) or not isinstance(
+            package.get('requirement'), str):
+        raise ValueError('Invalid package %r, expected a requirement or an '
+                         'object with a "requirement"' % (package,))
+    unknown = set(package) - {'requirement'} - set(PackageSettings._fields)
+    if unknown:
+        raise ValueError('Unknown package settings %s for %s'
+                         % (sorted(unknown), package['requirement']))
+    tier = package.get('tier', STANDARD)
+    if tier not in TIERS:
+        raise ValueError('Invalid tier %r, expected one of %s'
+                         % (tier, ', '.join(TIERS)))
+    numbers = [package.get(name) for name in ('every_hours',
+                                              'expected_seconds')]
+    for number in numbers:
+        if number is not None and (not isinstance(number, (int, float)) or
+                                   number < 0):
+            raise ValueError('Invalid package settings for %s'
+                             % package['requirement'])
+    return package['requirement'], PackageSettings(tier, *numbers)
+
+
+def _unique(values, identity):
+    unique = OrderedDict()
+    for value in values:
+        unique.setdefault(identity(value), value.strip())
+    return list(unique.values())
+
+
+def _requirement_id(requirement):
+    try:
+        parsed = Requirement(requirement)
+    except Exception as e:
+        raise ValueError('Invalid requirement %r: %s' % (requirement, e))
+    return (normalize_name(parsed.name), tuple(sorted(parsed.extras)),
+            str(parsed.specifier), str(parsed.marker))
+
+
+def _chalice_version(version):
+    if version == LATEST:
+        return version
+    try:
+        return str(Version(version))
+    except Exception:
+        raise ValueError('Invalid chalice version %r' % version)
+
+
+def _runtime(runtime):
+    if not re.match(r'python\d\.\d+$', runtime):
+        raise ValueError('Invalid runtime %r' % runtime)
+    return runtime
+
+
+def runtime_python_tag(runtime):
+    major, minor = re.match(r'python(\d)\.(\d+)$', runtime).groups()
+    return 'cp%s%s' % (major, minor)
+
+
+def runtime_abi(runtime):
+    major, minor = re.match(r'python(\d)\.(\d+)$', runtime).groups()
+    if major == '2':
+        return 'cp27mu'
+    if (int(major), int(minor)) < (3, 8):
+        return 'cp%s%sm' % (major, minor)
+    return 'cp%s%s' % (major, minor)
@@ -0,0 +1,117 @@
+import json
+import time
+import random
+import threading
+import datetime
+
+import boto3
+from botocore.exceptions import ClientError
+
+
+NAMESPACE = 'ChalicePackageCanary'
+# Maximum number of datums PutMetricData accepts in a single call.
+_MAX_BATCH_SIZE = 20
+_THROTTLING_ERRORS = ('Throttling', 'ThrottlingException',
+                      'RequestLimitExceeded')
+
+
+class MetricsSink(object):
+    """Collect metrics during a run and publish them in batches.
+
+    ``add`` is safe to call from any worker thread and never does I/O, the
+    collected datums are only sent when ``flush`` is called.  Subclasses
+    implement ``_publish`` for a single batch.
+    """
+    def __init__(self, batch_size=_MAX_BATCH_SIZE):
+        self._batch_size = batch_size
+        self._lock = threading.Lock()
+        self._pending = []
+
+    def add(self, metric_name, value, dimensions=None, unit=None):
+        datum = {
+            'MetricName': metric_name,
+            'Dimensions': [{'Name': name, 'Value': dimension_value}
+                           for name, dimension_value
+                           in sorted((dimensions or {}).items())],
+            'Timestamp': datetime.datetime.utcnow(),
+            'Value': value,
+        }
+        if unit is not None:
+            datum['Unit'] = unit
+        with self._lock:
+            self._pending.append(datum)
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for i in range(0, len(pending), self._batch_size):
+            try:
+                self._publish(pending[i:i + self._batch_size])
+            except Exception:
+                # The batch that failed and those after it are sent by the
+                # next flush.
+                with self._lock:
+                    self._pending[:0] = pending[i:]
+                raise
+
+    def _publish(self, batch):
+        raise NotImplementedError('_publish')
+
+
+class CloudWatchSink(MetricsSink):
+    def __init__(self, namespace=NAMESPACE, client=None, max_attempts=5,
+                 batch_size=_MAX_BATCH_SIZE):
+        super(CloudWatchSink, self).__init__(batch_size)
+        self._namespace = namespace
+        self._client = client
+        self._max_attempts = max_attempts
+
+    def _publish(self, batch):
+        if self._client is None:
+            self._client = boto3.client('cloudwatch')
+        for attempt in range(self._max_attempts):
+            try:
+                self._client.put_metric_data(Namespace=self._namespace,
+                                             MetricData=batch)
+                return
+            except ClientError as e:
+                code = e.response['Error']['Code']
+                if (code not in _THROTTLING_ERRORS or
+                        attempt == self._max_attempts - 1):
+                    raise
+            time.sleep(random.uniform(0, 0.2 * 2 ** attempt))
+
+
+class MemorySink(MetricsSink):
+    def __init__(self, batch_size=_MAX_BATCH_SIZE):
+        super(MemorySink, self).__init__(batch_size)
+        self.published = []
+
+    def _publish(self, batch):
+        self.published.extend(batch)
+
+
+class FileSink(MetricsSink):
+    def __init__(self, path, batch_size=_MAX_BATCH_SIZE):
+        super(FileSink, self).__init__(batch_size)
+        self._path = path
+
+    def _publish(self, batch):
+        with open(self._path, 'a') as f:
+            for datum in batch:
+                datum = dict(datum, Timestamp=datum['Timestamp'].isoformat())
+                f.write('%s\n' % json.dumps(datum))
+
+
+def create_sink(spec):
+    if spec == 'cloudwatch':
+        return CloudWatchSink()
+    elif spec == 'memory':
+        return MemorySink()
+    elif spec.startswith('file:'):
+        return FileSink(spec[len('file:'):])
+    raise ValueError('Unknown metrics sink: %s' % spec)
@@ -0,0 +1,275 @@
+import os
+import re
+import json
+import time
+import queue
+import asyncio
+import threading
+from subprocess import Popen
+from subprocess import PIPE
+from subprocess import TimeoutExpired
+
+from chalicelib import proc
+from chalicelib.classify import OutputClassifier
+from chalicelib.classify import TIMEOUT
+from chalicelib.matrix import runtime_abi
+
+
+_BUILD_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'build_server.py')
+# How often a check waiting for a build server looks for one that died.
+_IDLE_POLL_SECONDS = 1
+
+
+class UnsupportedRuntimeError(Exception):
+    """The chalice release under test cannot package for a runtime."""
+    def __init__(self, runtime):
+        super(UnsupportedRuntimeError, self).__init__(
+            'Cannot package for %s' % runtime)
+        self.runtime = runtime
+
+
+class PackageResult(object):
+    def __init__(self, failure_class=None, tail=()):
+        self.failure_class = failure_class
+        self.success = failure_class is None
+        self.tail = list(tail)
+
+
+class CliPackager(object):
+    """Package a project by running the chalice CLI, like a user would.
+
+    The CLI always packages for the runtime of the interpreter chalice is
+    installed in, ``runtime`` is only accepted for interface parity with
+    ``InProcessPackager``.
+    """
+    def __init__(self, chalice_exe, wheel_cache):
+        self._chalice_exe = chalice_exe
+        self._wheel_cache = wheel_cache
+
+    def package(self, requirement, workdir, record, timeout=None,
+                runtime=None):
+        expires_at = None if timeout is None else time.time() + timeout
+        project_name = _project_name(requirement)
+        try:
+            with record.phase('new_project'):
+                _, usage = proc.run(
+                    [self._chalice_exe, 'new-project', project_name],
+                    cwd=workdir, timeout=_remaining(expires_at))
+        except TimeoutExpired:
+            return PackageResult(TIMEOUT)
+        record.add_usage(usage)
+        project_dir = os.path.join(workdir, project_name)
+        requirements_file = os.path.join(project_dir, 'requirements.txt')
+        open(requirements_file, 'w').write('%s\n' % requirement)
+        # The shared pip cache is where every download ends up, its growth
+        # is what this check fetched on top of what the wheel cache already
+        # had.  Downloads of checks running at the same time can be
+        # attributed to either of them.
+        cache_dir = self._wheel_cache.cache_dir
+        cache_size = proc.directory_size(cache_dir)
+        classifier = OutputClassifier(self._wheel_cache.sdist_only_names())
+        try:
+            with record.phase('package'):
+                returncode, usage = proc.stream(
+                    [self._chalice_exe, 'package', 'out'], classifier.feed,
+                    timeout=_remaining(expires_at), cwd=project_dir,
+                    env=self._wheel_cache.environ())
+        except TimeoutExpired:
+            return PackageResult(TIMEOUT, classifier.tail)
+        record.add_usage(usage)
+        record.bytes_downloaded = max(
+            0, proc.directory_size(cache_dir) - cache_size)
+        return PackageResult(classifier.finish(returncode), classifier.tail)
+
+    def close(self):
+        pass
+
+
+class AsyncCliPackager(object):
+    """``CliPackager`` for an event loop.
+
+    A check waiting on chalice holds a coroutine instead of a thread.  The
+    resource usage of the chalice processes is not available, so no peak
+    RSS is recorded.
+    """
+    def __init__(self, chalice_exe, wheel_cache):
+        self._chalice_exe = chalice_exe
+        self._wheel_cache = wheel_cache
+
+    async def package(self, requirement, workdir, record, timeout=None,
+                      runtime=None):
+        loop = asyncio.get_event_loop()
+        expires_at = None if timeout is None else time.time() + timeout
+        project_name = _project_name(requirement)
+        try:
+            with record.phase('new_project'):
+                await proc.stream_async(
+                    [self._chalice_exe, 'new-project', project_name],
+                    _ignore_line, timeout=_remaining(expires_at),
+                    cwd=workdir)
+        except TimeoutExpired:
+            return PackageResult(TIMEOUT)
+        project_dir = os.path.join(workdir, project_name)
+        requirements_file = os.path.join(project_dir, 'requirements.txt')
+        open(requirements_file, 'w').write('%s\n' % requirement)
+        cache_dir = self._wheel_cache.cache_dir
+        # Walking the cache is the only blocking work left, keep it off the
+        # loop.
+        cache_size = await loop.run_in_executor(
+            None, proc.directory_size, cache_dir)
+        classifier = OutputClassifier(self._wheel_cache.sdist_only_names())
+        try:
+            with record.phase('package'):
+                returncode = await proc.stream_async(
+                    [self._chalice_exe, 'package', 'out'], classifier.feed,
+                    timeout=_remaining(expires_at), cwd=project_dir,
+                    env=self._wheel_cache.environ())
+        except TimeoutExpired:
+            return PackageResult(TIMEOUT, classifier.tail)
+        record.bytes_downloaded = max(0, await loop.run_in_executor(
+            None, proc.directory_size, cache_dir) - cache_size)
+        return PackageResult(classifier.finish(returncode), classifier.tail)
+
+    def close(self):
+        pass
+
+
+class InProcessPackager(object):
+    """Package requirements-only projects through long lived build servers.
+
+    Each build server is a python process in the canary environment that
+    imports chalice's dependency builder once and then handles one package
+    after another, so a check does not pay for interpreter start up, the
+    chalice imports or a ``new-project`` scaffold.  Up to ``max_servers``
+    are started on demand, one per concurrently running check.
+    """
+    def __init__(self, py_exe, wheel_cache, max_servers):
+        self._py_exe = py_exe
+        self._wheel_cache = wheel_cache
+        self._max_servers = max_servers
+        self._idle = queue.Queue()
+        self._servers = []
+        self._lock = threading.Lock()
+
+    def package(self, requirement, workdir, record, timeout=None,
+                runtime=None):
+        expires_at = None if timeout is None else time.time() + timeout
+        server = self._acquire(expires_at)
+        if server is None:
+            return PackageResult(TIMEOUT)
+        try:
+            response = server.request({
+                'requirement': requirement,
+                'project_dir': os.path.join(workdir,
+                                            _project_name(requirement)),
+                'abi': runtime_abi(runtime) if runtime else None,
+            }, _remaining(expires_at))
+        except TimeoutExpired:
+            server.close()
+            server = None
+            return PackageResult(TIMEOUT)
+        except Exception:
+            server.close()
+            server = None
+            raise
+        finally:
+            if server is not None:
+                self._idle.put(server)
+        if response['unsupported']:
+            raise UnsupportedRuntimeError(runtime)
+        for name, seconds in response['phases'].items():
+            record.phases[name] = record.phases.get(name, 0) + seconds
+        record.peak_rss_kb = max(record.peak_rss_kb, response['peak_rss_kb'])
+        record.bytes_downloaded = response['bytes_downloaded']
+        classifier = OutputClassifier(self._wheel_cache.sdist_only_names())
+        classifier.add_missing(response['missing'],
+                               response['missing_sdists'])
+        for line in (response['error'] or '').splitlines():
+            classifier.feed(line)
+        returncode = 0 if response['success'] else 1
+        return PackageResult(classifier.finish(returncode), classifier.tail)
+
+    def close(self):
+        with self._lock:
+            servers, self._servers = self._servers, []
+        for server in servers:
+            server.close()
+
+    def _acquire(self, expires_at=None):
+        """Return an idle or a new server, None if ``expires_at`` passes.
+
+        Waiting for an idle server polls, a server that died frees its slot
+        for a new one rather than ever being put back.
+        """
+        wait = 0
+        while True:
+            try:
+                if wait:
+                    server = self._idle.get(timeout=wait)
+                else:
+                    server = self._idle.get_nowait()
+                if server.is_alive():
+                    return server
+                server.close()
+            except queue.Empty:
+                pass
+            with self._lock:
+                self._servers = [s for s in self._servers if s.is_alive()]
+                if len(self._servers) < self._max_servers:
+                    server = _BuildServer(self._py_exe,
+                                          self._wheel_cache.environ())
+                    self._servers.append(server)
+                    return server
+            wait = _IDLE_POLL_SECONDS
+            if expires_at is not None:
+                wait = min(wait, _remaining(expires_at))
+                if not wait:
+                    return None
+
+
+class _BuildServer(object):
+    def __init__(self, py_exe, env):
+        self._process = Popen([py_exe, _BUILD_SERVER], stdin=PIPE,
+                              stdout=PIPE, encoding='utf-8', env=env,
+                              start_new_session=True)
+
+    def is_alive(self):
+        return self._process.poll() is None
+
+    def request(self, payload, timeout=None):
+        self._process.stdin.write('%s\n' % json.dumps(payload))
+        self._process.stdin.flush()
+        # A build that hangs can only be interrupted by killing the server
+        # and everything it started, the next request gets a new server.
+        with proc.Watchdog(self._process, timeout) as watchdog:
+            line = self._process.stdout.readline()
+        if not line:
+            returncode = self._process.wait()
+            if watchdog.fired:
+                raise TimeoutExpired(payload['requirement'], timeout)
+            raise RuntimeError('Build server exited with %s' % returncode)
+        return json.loads(line)
+
+    def close(self):
+        if self.is_alive():
+            self._process.stdin.close()
+            try:
+                self._process.wait(timeout=5)
+            except TimeoutExpired:
+                proc.kill_group(self._process)
+                self._process.wait()
+
+
+def _ignore_line(line):
+    return False
+
+
+def _project_name(requirement):
+    return 'package-%s' % re.sub(r'[^A-Za-z0-9]+', '-', requirement)
+
+
+def _remaining(expires_at):
+    if expires_at is None:
+        return None
+    return max(0, expires_at - time.time())
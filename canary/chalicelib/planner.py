@@ -0,0 +1,42 @@
+from collections import namedtuple
+
+from chalicelib.matrix import TIERS
+from chalicelib.matrix import CRITICAL
+
+
+# Why a check is due, in the order they are worth the time within a tier.
+CHANGED = 'changed'
+STALE = 'stale'
+SCHEDULED = 'scheduled'
+_REASONS = [CHANGED, STALE, SCHEDULED]
+
+# A check that is due.  ``cost`` is the seconds it is expected to take and
+# ``checked_at`` when its key was last checked, None if it never was.
+Candidate = namedtuple('Candidate', ['key', 'cells', 'tier', 'reason',
+                                     'cost', 'checked_at'])
+
+
+def plan(candidates, budget):
+    """Pick the candidates to check in ``budget`` seconds of check time.
+
+    Critical candidates are always picked.  The others are picked by tier,
+    then by reason, then least recently checked first, for as long as their
+    expected cost fits in what is left of the budget.  Returns the picked
+    and the deferred candidates.  A deferred candidate keeps its old check
+    time, which moves it up on the next run, so a long tail larger than a
+    single run's budget is checked in rotation.
+    """
+    planned, deferred = [], []
+    used = 0
+    for candidate in sorted(candidates, key=_priority):
+        if candidate.tier == CRITICAL or used + candidate.cost <= budget:
+            planned.append(candidate)
+            used += candidate.cost
+        else:
+            deferred.append(candidate)
+    return planned, deferred
+
+
+def _priority(candidate):
+    return (TIERS.index(candidate.tier), _REASONS.index(candidate.reason),
+            candidate.checked_at or 0)
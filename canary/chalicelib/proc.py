@@ -0,0 +1,158 @@
+import os
+import signal
+import asyncio
+import threading
+from subprocess import Popen
+from subprocess import PIPE
+from subprocess import STDOUT
+from subprocess import CompletedProcess
+from subprocess import TimeoutExpired
+
+
+def child_environ():
+    """The environment for commands, without the function's AWS settings.
+
+    Package builds run arbitrary ``setup.py`` code, which must not get hold
+    of the credentials of the function's role.
+    """
+    return {name: value for name, value in os.environ.items()
+            if not name.startswith('AWS_')}
+
+
+def run(args, timeout=None, **kwargs):
+    """Like ``subprocess.run`` but also return the child's resource usage.
+
+    The child is reaped with ``os.wait4`` so the returned ``rusage`` belongs
+    to this child (and the descendants it waited on) alone, which is not the
+    case for ``resource.getrusage(RUSAGE_CHILDREN)`` when several checks run
+    in parallel.  Only ``stdout`` may be a pipe.  The child runs in its own
+    process group, when ``timeout`` expires the whole group is killed and
+    ``TimeoutExpired`` is raised.  Without an ``env`` the child gets
+    ``child_environ``.
+    """
+    kwargs.setdefault('env', child_environ())
+    with Popen(args, start_new_session=True, **kwargs) as process:
+        with Watchdog(process, timeout) as watchdog:
+            stdout = None
+            if process.stdout is not None:
+                stdout = process.stdout.read()
+            rusage = _reap(process)
+    if watchdog.fired:
+        raise TimeoutExpired(args, timeout, stdout)
+    return CompletedProcess(args, process.returncode, stdout), rusage
+
+
+def stream(args, on_line, timeout=None, **kwargs):
+    """Run a command and pass each line of its combined output to ``on_line``.
+
+    Nothing is buffered beyond the current line.  When ``on_line`` returns
+    True the rest of the output is not needed and the command is stopped.
+    Returns the return code and the resource usage of the command, timeouts
+    are handled like in ``run``.
+    """
+    kwargs.setdefault('env', child_environ())
+    with Popen(args, stdout=PIPE, stderr=STDOUT, universal_newlines=True,
+               start_new_session=True, **kwargs) as process:
+        with Watchdog(process, timeout) as watchdog:
+            for line in process.stdout:
+                if on_line(line):
+                    kill_group(process)
+                    break
+            process.stdout.close()
+            rusage = _reap(process)
+    if watchdog.fired:
+        raise TimeoutExpired(args, timeout)
+    return process.returncode, rusage
+
+
+async def stream_async(args, on_line, timeout=None, **kwargs):
+    """Like ``stream`` for an event loop, without a thread per command.
+
+    Returns the return code only, asyncio reaps the command itself so its
+    resource usage is not available.
+    """
+    kwargs.setdefault('env', child_environ())
+    process = await asyncio.create_subprocess_exec(
+        *args, stdout=PIPE, stderr=STDOUT, start_new_session=True, **kwargs)
+    try:
+        await asyncio.wait_for(_feed_lines(process, on_line), timeout)
+    except asyncio.TimeoutError:
+        kill_group(process)
+        await process.wait()
+        raise TimeoutExpired(args, timeout)
+    except BaseException:
+        # Cancelled along with the rest of the run.
+        kill_group(process)
+        raise
+    return await process.wait()
+
+
+async def _feed_lines(process, on_line):
+    stopped = False
+    while True:
+        line = await process.stdout.readline()
+        if not line:
+            return
+        if not stopped and on_line(line.decode('utf-8', 'replace')):
+            kill_group(process)
+            # Keep draining what was already written, the pipe only reports
+            # EOF once it has been read.
+            stopped = True
+
+
+def kill_group(process):
+    # Builds spawn pip, which spawns compilers, killing only the direct
+    # child would leave those running and holding the output pipe open.
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+class Watchdog(object):
+    """Kill the process group of ``process`` if ``timeout`` expires."""
+    def __init__(self, process, timeout):
+        self.fired = False
+        self._process = process
+        self._timer = None
+        if timeout is not None:
+            self._timer = threading.Timer(timeout, self._fire)
+            self._timer.daemon = True
+
+    def _fire(self):
+        self.fired = True
+        kill_group(self._process)
+
+    def __enter__(self):
+        if self._timer is not None:
+            self._timer.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._timer is not None:
+            self._timer.cancel()
+
+
+def _reap(process):
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = _returncode(status)
+    return rusage
+
+
+def _returncode(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def directory_size(path):
+    total = 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(root, filename)).st_size
+            except OSError:
+                # Files can disappear while a concurrent pip run is
+                # rotating its cache entries.
+                pass
+    return total
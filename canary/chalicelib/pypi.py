@@ -0,0 +1,60 @@
+import os
+import json
+from urllib.request import urlopen
+from concurrent.futures import ThreadPoolExecutor
+
+from packaging.version import parse as parse_version
+from packaging.requirements import Requirement
+
+
+_PYPI_URL = os.environ.get('CANARY_PYPI_URL', 'https://pypi.org/pypi')
+_TIMEOUT = 10
+
+
+def project_info(name, version=None):
+    if version is None:
+        url = '%s/%s/json' % (_PYPI_URL, name)
+    else:
+        url = '%s/%s/%s/json' % (_PYPI_URL, name, version)
+    with urlopen(url, timeout=_TIMEOUT) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def latest_version(requirement):
+    """Newest release matching ``requirement``, a name or a specifier."""
+    parsed = Requirement(requirement)
+    return newest_release(project_info(parsed.name), parsed.specifier)
+
+
+def newest_release(info, specifier):
+    """Newest release in ``project_info`` output matching ``specifier``."""
+    if not specifier:
+        return info['info']['version']
+    # Releases without files were deleted or never uploaded.
+    releases = [version for version, files in info['releases'].items()
+                if files]
+    matching = list(specifier.filter(releases))
+    if not matching:
+        raise ValueError('No release of %s matches %s'
+                         % (info['info']['name'], specifier))
+    return max(matching, key=parse_version)
+
+
+def latest_versions(requirements, max_workers=16):
+    # Lookups that fail map to None so that callers treat the package as
+    # changed rather than skipping it.
+    def lookup(requirement):
+        try:
+            return latest_version(requirement)
+        except Exception:
+            return None
+    requirements = list(requirements)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(requirements,
+                        executor.map(lookup, requirements)))
+
+
+def requires(name, version):
+    """Requirements the ``version`` release of ``name`` declares."""
+    info = project_info(name, version)
+    return info['info'].get('requires_dist') or []
@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import threading
+from collections import namedtuple
+
+from chalicelib.s3objects import S3Objects
+
+
+ResultKey = namedtuple('ResultKey', ['package', 'version', 'chalice_version',
+                                     'runtime'])
+
+
+class ResultStore(object):
+    """Latest result per check, used to skip unchanged packages.
+
+    A check is a package requirement packaged with a chalice version for a
+    runtime.  It only needs to run again when the key it was last checked
+    under changes, i.e. there is a new release of the package.  A new
+    chalice release is a new check, checks that are no longer part of the
+    matrix are dropped with ``retain``.  A key without a version, a package
+    whose release could not be looked up, is never skipped nor recorded, so
+    a PyPI outage cannot hide a new release.  Subclasses only need to
+    implement ``_read`` and ``_write`` for the serialized document.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results = {}
+        self._last_full_sweep = 0
+
+    def load(self):
+        document = self._read()
+        with self._lock:
+            self._results = document.get('results', {})
+            self._last_full_sweep = document.get('last_full_sweep', 0)
+
+    def save(self):
+        with self._lock:
+            document = {
+                'results': dict(self._results),
+                'last_full_sweep': self._last_full_sweep,
+            }
+        self._write(document)
+
+    def is_unchanged_success(self, key):
+        if key.version is None:
+            return False
+        with self._lock:
+            result = self._results.get(_check_id(key))
+        return (result is not None and result['success'] and
+                result['key'] == list(key))
+
+    def is_new_release_of_success(self, key):
+        """True if only the package version changed since a green check.
+
+        The same package with the same chalice version on the same runtime
+        packaged, so a new chalice release or a check that failed last time
+        is never one.
+        """
+        if key.version is None:
+            return False
+        with self._lock:
+            result = self._results.get(_check_id(key))
+        return (result is not None and result['success'] and
+                result['key'] != list(key))
+
+    def checked_at(self, key):
+        """When ``key`` was last checked, None if it never was."""
+        with self._lock:
+            result = self._results.get(_check_id(key))
+        if result is None or result['key'] != list(key):
+            return None
+        return result['checked_at']
+
+    def expected_cost(self, key):
+        """Seconds the last timed check of ``key``, any version, took."""
+        with self._lock:
+            result = self._results.get(_check_id(key))
+        if result is None:
+            return None
+        return result.get('duration')
+
+    def record(self, key, success, duration=None):
+        if key.version is None:
+            return
+        with self._lock:
+            previous = self._results.get(_check_id(key), {})
+            self._results[_check_id(key)] = {
+                'key': list(key),
+                'success': bool(success),
+                'checked_at': time.time(),
+                # Verdicts that did not package anything keep the duration
+                # of the last check that did.
+                'duration': (previous.get('duration') if duration is None
+                             else duration),
+            }
+
+    def retain(self, keys):
+        check_ids = {_check_id(key) for key in keys}
+        with self._lock:
+            self._results = {check_id: result
+                             for check_id, result in self._results.items()
+                             if check_id in check_ids}
+
+    def full_sweep_due(self, interval):
+        with self._lock:
+            return time.time() - self._last_full_sweep >= interval
+
+    def mark_full_sweep(self):
+        with self._lock:
+            self._last_full_sweep = time.time()
+
+    def _read(self):
+        raise NotImplementedError('_read')
+
+    def _write(self, document):
+        raise NotImplementedError('_write')
+
+
+class FileResultStore(ResultStore):
+    def __init__(self, path):
+        super(FileResultStore, self).__init__()
+        self._path = path
+
+    def _read(self):
+        if not os.path.isfile(self._path):
+            return {}
+        with open(self._path, 'r') as f:
+            return json.load(f)
+
+    def _write(self, document):
+        tmp_path = '%s.tmp' % self._path
+        with open(tmp_path, 'w') as f:
+            json.dump(document, f)
+        os.replace(tmp_path, self._path)
+
+
+class S3ResultStore(ResultStore):
+    def __init__(self, bucket, key='results/latest.json', client=None):
+        super(S3ResultStore, self).__init__()
+        self._objects = S3Objects(bucket, '', client)
+        self._key = key
+
+    def _read(self):
+        try:
+            data, _ = self._objects.fetch(self._key)
+        except KeyError:
+            return {}
+        return json.loads(data.decode('utf-8'))
+
+    def _write(self, document):
+        self._objects.put(self._key, json.dumps(document).encode('utf-8'))
+
+
+def _check_id(key):
+    # Everything but the package version, which is what decides whether an
+    # existing check has to run again.
+    return '%s chalice-%s %s' % (key.package, key.chalice_version,
+                                 key.runtime)
@@ -0,0 +1,103 @@
+import datetime
+
+import boto3
+from botocore.exceptions import ClientError
+
+
+class S3Objects(object):
+    """The objects under ``prefix`` in an S3 bucket.
+
+    Objects are named relative to the prefix, which is how the stores that
+    keep their state in the canary's bucket address them.  A missing object
+    is told apart from other errors here, the same way for every store.
+    """
+    def __init__(self, bucket, prefix, client=None):
+        if client is None:
+            client = boto3.client('s3')
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = client
+
+    def url(self, name):
+        return 's3://%s/%s%s' % (self.bucket, self.prefix, name)
+
+    def list(self, prefix=''):
+        paginator = self._client.get_paginator('list_objects_v2')
+        names = []
+        for page in paginator.paginate(Bucket=self.bucket,
+                                       Prefix=self.prefix + prefix):
+            names.extend(item['Key'][len(self.prefix):]
+                         for item in page.get('Contents', []))
+        return names
+
+    def exists(self, name):
+        try:
+            self._client.head_object(Bucket=self.bucket,
+                                     Key=self.prefix + name)
+        except ClientError as e:
+            if _missing(e):
+                return False
+            raise
+        return True
+
+    def get(self, name):
+        response = self._client.get_object(Bucket=self.bucket,
+                                           Key=self.prefix + name)
+        return response['Body'].read()
+
+    def fetch(self, name, etag=None):
+        """Return the data of ``name`` and its ETag, None if unchanged.
+
+        With ``etag`` this is a conditional request that transfers nothing
+        while the object still has that ETag.  Raises KeyError when there is
+        no such object.
+        """
+        kwargs = {}
+        if etag is not None:
+            kwargs['IfNoneMatch'] = etag
+        try:
+            response = self._client.get_object(Bucket=self.bucket,
+                                               Key=self.prefix + name,
+                                               **kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('304', 'NotModified'):
+                return None
+            if _missing(e):
+                raise KeyError(self.url(name))
+            raise
+        return response['Body'].read(), response['ETag']
+
+    def put(self, name, data):
+        self._client.put_object(Bucket=self.bucket, Key=self.prefix + name,
+                                Body=data)
+
+    def download(self, name, filename):
+        """Download ``name`` to ``filename``, False if there is none."""
+        try:
+            self._client.download_file(self.bucket, self.prefix + name,
+                                       filename)
+        except ClientError as e:
+            if _missing(e):
+                return False
+            raise
+        return True
+
+    def upload(self, filename, name):
+        self._client.upload_file(filename, self.bucket, self.prefix + name)
+
+    def delete(self, names):
+        # DeleteObjects takes at most 1000 keys per call.
+        for i in range(0, len(names), 1000):
+            self._client.delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': self.prefix + name}
+                                    for name in names[i:i + 1000]]})
+
+
+def _missing(error):
+    return error.response['Error']['Code'] in ('404', 'NoSuchKey')
+
+
+def utc_day(timestamp):
+    """The UTC day of ``timestamp``, as the directory stores keep it in."""
+    return datetime.datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%d')
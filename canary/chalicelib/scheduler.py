@@ -0,0 +1,145 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+
+# Rough amount of memory a single ``chalice package`` run needs once pip and
+# any compilers it spawns for sdists are accounted for.
+_MEMORY_PER_WORKER_MB = 512
+
+
+def default_max_workers():
+    configured = os.environ.get('CANARY_MAX_WORKERS')
+    if configured:
+        return max(1, int(configured))
+    cpus = os.cpu_count() or 1
+    # Packaging is a mix of network bound downloads and CPU bound builds, so
+    # allow some oversubscription of the CPUs but never more workers than
+    # the memory can hold.
+    workers = cpus * 2
+    memory_mb = available_memory_mb()
+    if memory_mb is not None:
+        workers = min(workers, memory_mb // _MEMORY_PER_WORKER_MB)
+    return max(1, workers)
+
+
+def available_memory_mb():
+    lambda_memory = os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE')
+    if lambda_memory:
+        return int(lambda_memory)
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return None
+
+
+class Scheduler(object):
+    """Run work items on a bounded pool, longest expected first.
+
+    The expected cost of an item is the duration it took the last time this
+    scheduler ran it, so a warm Lambda container gets better at ordering its
+    work with every invocation.  Items that have never been timed are
+    scheduled first since there is no reason to assume they are cheap.
+    """
+    def __init__(self, max_workers=None):
+        if max_workers is None:
+            max_workers = default_max_workers()
+        self.max_workers = max_workers
+        self._expected_costs = {}
+        self._lock = threading.Lock()
+
+    def expected_cost(self, key):
+        with self._lock:
+            return self._expected_costs.get(key)
+
+    def set_expected_cost(self, key, seconds):
+        with self._lock:
+            self._expected_costs[key] = seconds
+
+    def map(self, func, items, key=None, after=None):
+        """Run ``func`` on every item and return the results in order.
+
+        ``after`` lists, for every item, the indices of the items it has to
+        wait for.  An item starts as soon as those are done, not when a
+        batch of unrelated items is, and they must not wait for it in turn.
+        """
+        if key is None:
+            key = _identity
+        items = list(items)
+        order = sorted(range(len(items)),
+                       key=lambda i: self._sort_key(key(items[i])))
+        waiting = [set(after[i]) if after else set()
+                   for i in range(len(items))]
+        futures = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            running = {}
+            while True:
+                for i in order:
+                    if i not in futures and not waiting[i]:
+                        futures[i] = executor.submit(
+                            self._timed, func, items[i], key(items[i]))
+                        running[futures[i]] = i
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finished = running.pop(future)
+                    for dependencies in waiting:
+                        dependencies.discard(finished)
+        return [futures[i].result() for i in range(len(items))]
+
+    async def map_async(self, func, items, key=None, after=None):
+        """Like ``map`` for a coroutine function, on the current loop.
+
+        At most ``max_workers`` items run at once, the others wait as
+        coroutines rather than occupying threads.
+        """
+        if key is None:
+            key = _identity
+        items = list(items)
+        order = sorted(range(len(items)),
+                       key=lambda i: self._sort_key(key(items[i])))
+        semaphore = asyncio.Semaphore(self.max_workers)
+        tasks = {}
+
+        async def timed(i):
+            dependencies = [tasks[j] for j in (after[i] if after else ())]
+            if dependencies:
+                await asyncio.wait(dependencies)
+            async with semaphore:
+                start = time.time()
+                try:
+                    return await func(items[i])
+                finally:
+                    self.set_expected_cost(key(items[i]),
+                                           time.time() - start)
+        # The semaphore admits waiters first come first served, so creating
+        # the tasks in order keeps the longest first ordering.
+        for i in order:
+            tasks[i] = asyncio.ensure_future(timed(i))
+        return await asyncio.gather(*[tasks[i] for i in range(len(items))])
+
+    def _sort_key(self, item_key):
+        cost = self.expected_cost(item_key)
+        if cost is None:
+            return (0, 0)
+        return (1, -cost)
+
+    def _timed(self, func, item, item_key):
+        start = time.time()
+        try:
+            return func(item)
+        finally:
+            self.set_expected_cost(item_key, time.time() - start)
+
+
+def _identity(item):
+    return item
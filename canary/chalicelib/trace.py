@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import heapq
+import uuid
+import threading
+from contextlib import contextmanager
+
+from chalicelib.s3objects import S3Objects
+from chalicelib.s3objects import utc_day
+
+
+# Rows of the async engine's lanes start here, well clear of thread rows.
+_LANE_BASE = 1000
+
+
+class Tracer(object):
+    """Spans of a single run, exported as a Chrome trace.
+
+    ``span`` records how long a block took on the thread that ran it, as a
+    complete event of the Trace Event Format.  chrome://tracing and Perfetto
+    show every thread as a row, so checks running at the same time, threads
+    waiting for disk space and idle stretches are visible at a glance.  The
+    coroutines of the async engine share one thread, spans given a ``lane``
+    go to a row of that lane instead.  Nothing is recorded between ``stop``
+    and the next ``start``, a span then costs a single check.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = None
+        self._name = None
+        self._threads = {}
+        self._lanes = 0
+        self._free_lanes = []
+
+    def start(self, name):
+        """Start recording the spans of a run named ``name``."""
+        with self._lock:
+            self._events = []
+            self._name = name
+            self._threads = {}
+            self._lanes = 0
+            self._free_lanes = []
+
+    def stop(self):
+        """Stop recording and return the trace, None if none was started."""
+        with self._lock:
+            events, self._events = self._events, None
+            threads = dict(self._threads)
+            lanes = self._lanes
+        if events is None:
+            return None
+        pid = os.getpid()
+        metadata = [_metadata('process_name', pid, 0, self._name)]
+        metadata.extend(_metadata('thread_name', pid, tid, name)
+                        for tid, name in sorted(threads.values()))
+        metadata.extend(_metadata('thread_name', pid, _LANE_BASE + lane,
+                                  'async check %s' % lane)
+                        for lane in range(lanes))
+        return {'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}
+
+    @contextmanager
+    def span(self, name, lane=None, **args):
+        if self._events is None:
+            yield
+            return
+        start = time.time()
+        try:
+            yield
+        finally:
+            self._add(name, start, time.time(), lane, args)
+
+    @contextmanager
+    def lane(self):
+        """Yield the lowest lane no other coroutine holds."""
+        with self._lock:
+            if self._free_lanes:
+                lane = heapq.heappop(self._free_lanes)
+            else:
+                lane = self._lanes
+                self._lanes += 1
+        try:
+            yield lane
+        finally:
+            with self._lock:
+                heapq.heappush(self._free_lanes, lane)
+
+    def _add(self, name, start, end, lane, args):
+        # Timestamps are microseconds since the epoch, so the traces of the
+        # canary and its workers line up when loaded together.
+        event = {'name': name, 'ph': 'X', 'pid': os.getpid(),
+                 'ts': int(start * 1e6), 'dur': int((end - start) * 1e6),
+                 'args': args}
+        with self._lock:
+            if self._events is None:
+                return
+            if lane is None:
+                ident = threading.get_ident()
+                if ident not in self._threads:
+                    self._threads[ident] = (len(self._threads) + 1,
+                                            threading.current_thread().name)
+                event['tid'] = self._threads[ident][0]
+            else:
+                event['tid'] = _LANE_BASE + lane
+            self._events.append(event)
+
+
+class FileTraceStore(object):
+    def __init__(self, root):
+        self._root = root
+
+    def put(self, name, trace):
+        path = os.path.join(self._root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(trace, f)
+        return path
+
+
+class S3TraceStore(object):
+    def __init__(self, bucket, prefix='traces/', client=None):
+        self._objects = S3Objects(bucket, prefix, client)
+
+    def put(self, name, trace):
+        self._objects.put(name, json.dumps(trace).encode('utf-8'))
+        return self._objects.url(name)
+
+
+def trace_name(run):
+    """Name of the trace of a ``run``, under a directory for the UTC day."""
+    now = time.time()
+    return '%s/%s-%s-%s.json' % (
+        utc_day(now), time.strftime('%H%M%S', time.gmtime(now)), run,
+        uuid.uuid4().hex[:8])
+
+
+def _metadata(name, pid, tid, value):
+    return {'name': name, 'ph': 'M', 'pid': pid, 'tid': tid,
+            'args': {'name': value}}
+
+
+_TRACER = Tracer()
+start = _TRACER.start
+stop = _TRACER.stop
+span = _TRACER.span
+lane = _TRACER.lane
@@ -0,0 +1,108 @@
+import os
+import time
+import logging
+from subprocess import TimeoutExpired
+
+from chalicelib import proc
+from chalicelib.classify import normalize_name
+
+
+LOG = logging.getLogger(__name__)
+
+
+_SDIST_EXTENSIONS = ('.tar.gz', '.tar.bz2', '.tgz', '.zip')
+
+
+class WheelCache(object):
+    """Run scoped pip cache and wheelhouse shared by every package check.
+
+    ``prime`` resolves the whole package list in one pip invocation so each
+    distinct distribution is downloaded once, then builds every sdist it got
+    into a wheel once.  The per package ``chalice package`` runs are pointed
+    at the wheelhouse through ``PIP_FIND_LINKS`` and at the shared HTTP cache
+    through ``PIP_CACHE_DIR``.  Pip prefers a wheel over an sdist of the same
+    version, so the packaging runs pick up the prebuilt wheels instead of
+    compiling the same dependency once per package that needs it.
+
+    When given a ``BuildStore``, an sdist is only built when no earlier run
+    stored a wheel of the same release.
+    """
+    def __init__(self, root, builds=None):
+        self.cache_dir = os.path.join(root, 'pip-cache')
+        self.wheelhouse = os.path.join(root, 'wheelhouse')
+        self._builds = builds
+        os.makedirs(self.cache_dir, exist_ok=True)
+        os.makedirs(self.wheelhouse, exist_ok=True)
+
+    def environ(self):
+        env = proc.child_environ()
+        env['PIP_CACHE_DIR'] = self.cache_dir
+        env['PIP_FIND_LINKS'] = self.wheelhouse
+        return env
+
+    def prime(self, py_exe, requirements, timeout=None):
+        # Priming is only an optimization, when it runs out of time the
+        # package checks download and build what is still missing.
+        expires_at = None if timeout is None else time.time() + timeout
+        try:
+            self._prime(py_exe, list(requirements), expires_at)
+        except TimeoutExpired:
+            LOG.warning('Ran out of time priming the wheel cache.')
+
+    def _prime(self, py_exe, requirements, expires_at):
+        if not requirements:
+            return
+        p = self._pip(py_exe, ['download', '--dest', self.wheelhouse] +
+                      requirements, expires_at)
+        if p.returncode != 0:
+            # A single unresolvable package fails the whole combined
+            # download, fall back to resolving them one at a time so the
+            # rest of the list still benefits from the cache.
+            for requirement in requirements:
+                self._pip(py_exe, ['download', '--dest', self.wheelhouse,
+                                   requirement], expires_at)
+        self._build_sdists(py_exe, expires_at)
+
+    def _build_sdists(self, py_exe, expires_at):
+        sdists = [os.path.join(self.wheelhouse, filename)
+                  for filename in os.listdir(self.wheelhouse)
+                  if filename.endswith(_SDIST_EXTENSIONS)]
+        for sdist in sdists:
+            if self._reuse_wheels(sdist):
+                continue
+            # Failures are left for chalice to report, it tries to build
+            # the sdist again itself.
+            self._pip(py_exe, ['wheel', '--no-deps', '--wheel-dir',
+                               self.wheelhouse, sdist], expires_at)
+
+    def _reuse_wheels(self, sdist):
+        if self._builds is None:
+            return False
+        filename = os.path.basename(sdist)
+        for extension in _SDIST_EXTENSIONS:
+            if filename.endswith(extension):
+                filename = filename[:-len(extension)]
+                break
+        name, _, version = filename.rpartition('-')
+        try:
+            return self._builds.export_wheels(name, version,
+                                              self.wheelhouse) > 0
+        except Exception as e:
+            LOG.warning('Could not reuse stored wheels of %s: %s',
+                        filename, e)
+            return False
+
+    def _pip(self, py_exe, args, expires_at):
+        timeout = None
+        if expires_at is not None:
+            timeout = max(0, expires_at - time.time())
+        p, _ = proc.run([py_exe, '-m', 'pip'] + args, env=self.environ(),
+                        timeout=timeout)
+        return p
+
+    def sdist_only_names(self):
+        # Pip only downloads an sdist when there is no wheel it can use, the
+        # wheels built from them during priming do not change that.
+        return {normalize_name(filename.rsplit('-', 1)[0])
+                for filename in os.listdir(self.wheelhouse)
+                if filename.endswith(_SDIST_EXTENSIONS)}
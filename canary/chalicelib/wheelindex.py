@@ -0,0 +1,163 @@
+import re
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+from packaging.requirements import Requirement
+
+from chalicelib import pypi
+from chalicelib.classify import normalize_name
+from chalicelib.matrix import runtime_abi
+
+
+LOG = logging.getLogger(__name__)
+
+
+# Platforms every chalice release accepts for Lambda.  Newer releases also
+# accept later manylinux tags, wheels with only those are left undecided.
+_PLATFORMS = {'any', 'manylinux1_x86_64'}
+
+
+class WheelIndex(object):
+    """Tell from index metadata alone that a package has Lambda wheels.
+
+    A release packages without building anything when it and every release
+    it pulls in has a wheel chalice accepts for the runtime, a pure python
+    wheel or a manylinux1 wheel for the runtime's ABI.  Dependencies are
+    resolved to the newest release matching each requirement, without
+    reconciling conflicting requirements like pip's resolver would.  Finding
+    that out takes a few JSON lookups per package instead of downloads and
+    builds.  Anything else, a dependency with only an sdist, a lookup that
+    fails, more than ``max_packages`` packages to look at or running out of
+    time, is left undecided for a real packaging run.
+
+    ``requires`` maps ``(name, version)`` to the requirements the release
+    declares and can be shared between runs, a release never changes them.
+    """
+    def __init__(self, requires=None, max_packages=100):
+        if requires is None:
+            requires = {}
+        self._requires = requires
+        self._max_packages = max_packages
+        self._projects = {}
+
+    def verdicts(self, checks, max_workers=16, timeout=None):
+        """``has_wheels`` for every ``(requirement, version, runtime)``.
+
+        Checks still undecided after ``timeout`` seconds are None.
+        """
+        expires_at = None if timeout is None else time.time() + timeout
+
+        def verdict(check):
+            try:
+                return self.has_wheels(*check, expires_at=expires_at)
+            except Exception as e:
+                LOG.warning('Could not scan the index for %s: %s',
+                            check[0], e)
+                return None
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = [executor.submit(verdict, check) for check in checks]
+            wait(futures, timeout=timeout)
+        finally:
+            # Lookups still running give up at ``expires_at``, nothing waits
+            # for them.
+            executor.shutdown(wait=False)
+        return [future.result() if future.done() else None
+                for future in futures]
+
+    def has_wheels(self, requirement, version, runtime, expires_at=None):
+        """True if the release and its dependencies all have wheels.
+
+        Returns None when that cannot be told from the index, or not before
+        ``expires_at``.
+        """
+        abi = runtime_abi(runtime)
+        environment = _marker_environment(runtime)
+        root = Requirement(requirement)
+        pending = [(root, version, set(root.extras))]
+        seen = set()
+        while pending:
+            if expires_at is not None and time.time() >= expires_at:
+                return None
+            parsed, version, extras = pending.pop()
+            # Every set of extras a package is required with can pull in
+            # dependencies of its own.
+            scanned = (normalize_name(parsed.name), frozenset(extras))
+            if scanned in seen:
+                continue
+            seen.add(scanned)
+            if len(seen) > self._max_packages:
+                return None
+            info = self._project(parsed.name)
+            if version is None:
+                try:
+                    version = pypi.newest_release(info, parsed.specifier)
+                except ValueError:
+                    return None
+            files = info['releases'].get(version, [])
+            if not any(_compatible_wheel(f['filename'], runtime, abi)
+                       for f in files):
+                return None
+            for declared in self._declared(parsed.name, version, info):
+                dependency = Requirement(declared)
+                if dependency.marker and not any(
+                        dependency.marker.evaluate(dict(environment,
+                                                        extra=extra))
+                        for extra in extras | {''}):
+                    continue
+                pending.append((dependency, None, set(dependency.extras)))
+        return True
+
+    def _project(self, name):
+        key = normalize_name(name)
+        if key not in self._projects:
+            self._projects[key] = pypi.project_info(name)
+        return self._projects[key]
+
+    def _declared(self, name, version, info):
+        if (name, version) not in self._requires:
+            if info['info']['version'] == version:
+                self._requires[(name, version)] = (
+                    info['info'].get('requires_dist') or [])
+            else:
+                self._requires[(name, version)] = pypi.requires(name,
+                                                                version)
+        return self._requires[(name, version)]
+
+
+def _compatible_wheel(filename, runtime, abi):
+    if not filename.endswith('.whl'):
+        return False
+    python_tags, abi_tag, platforms = filename[:-4].split('-')[-3:]
+    if not set(platforms.split('.')) & _PLATFORMS:
+        return False
+    major, minor = _python_version(runtime)
+    python_tags = set(python_tags.split('.'))
+    if abi_tag == 'none':
+        return bool(python_tags & {'py%s' % major, 'py%s%s' % (major, minor),
+                                   'cp%s%s' % (major, minor)})
+    if abi_tag == 'abi3':
+        return any(re.match(r'cp%s(\d+)$' % major, tag) and
+                   int(tag[3:]) <= minor for tag in python_tags)
+    return abi_tag == abi and 'cp%s%s' % (major, minor) in python_tags
+
+
+def _python_version(runtime):
+    major, minor = re.match(r'python(\d)\.(\d+)$', runtime).groups()
+    return int(major), int(minor)
+
+
+def _marker_environment(runtime):
+    major, minor = _python_version(runtime)
+    return {
+        'python_version': '%s.%s' % (major, minor),
+        'python_full_version': '%s.%s.0' % (major, minor),
+        'implementation_name': 'cpython',
+        'platform_python_implementation': 'CPython',
+        'os_name': 'posix',
+        'sys_platform': 'linux',
+        'platform_system': 'Linux',
+        'platform_machine': 'x86_64',
+    }
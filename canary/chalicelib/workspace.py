@@ -0,0 +1,123 @@
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from chalicelib import proc
+from chalicelib import trace
+from chalicelib.scheduler import available_memory_mb
+
+
+# Disk usage assumed for a project that has never been measured.
+_DEFAULT_ESTIMATE = 64 * 1024 * 1024
+# Share of the free space the projects may use when no budget is configured,
+# the rest is left for the wheel cache and the environments.
+_FREE_SPACE_SHARE = 0.75
+# Files on tmpfs live in memory, so a workspace there must also leave room
+# for the processes doing the packaging.
+_TMPFS_MEMORY_SHARE = 0.5
+
+
+class AdmissionTimeout(Exception):
+    pass
+
+
+class Workspace(object):
+    """Project directories for package checks, kept within a disk budget.
+
+    Every check gets its own directory under ``root`` that is removed as
+    soon as the check is done with it.  A check is only admitted once the
+    expected disk usage of all checks in flight, including its own, fits
+    in ``budget`` bytes.  The expected usage of a package is what it used
+    the last time, as recorded in ``usage``, which can be shared between
+    workspaces so later runs start with better estimates.  A single check
+    larger than the budget is admitted when nothing else is running.
+    """
+    def __init__(self, root, budget=None, usage=None):
+        os.makedirs(root, exist_ok=True)
+        if budget is None:
+            budget = default_budget(root)
+        if usage is None:
+            usage = {}
+        self.root = root
+        self.budget = budget
+        self.usage = usage
+        self._reservations = {}
+        self._condition = threading.Condition()
+
+    def expected_usage(self, name):
+        with self._condition:
+            return self.usage.get(name, _DEFAULT_ESTIMATE)
+
+    @contextmanager
+    def project(self, name, timeout=None):
+        """Reserve space for ``name`` and yield a fresh directory for it."""
+        path = self.acquire(name, timeout)
+        try:
+            yield path
+        finally:
+            self.release(name, path)
+
+    def acquire(self, name, timeout=None):
+        """Wait until ``name`` fits in the budget and create its directory.
+
+        Every directory returned must be passed to ``release``.
+        """
+        with trace.span('wait_for_disk', package=name), self._condition:
+            estimate = self.usage.get(name, _DEFAULT_ESTIMATE)
+            admitted = self._condition.wait_for(
+                lambda: (not self._reservations or
+                         self._reserved() + estimate <= self.budget),
+                timeout)
+            if not admitted:
+                raise AdmissionTimeout(name)
+            path = tempfile.mkdtemp(prefix='check-', dir=self.root)
+            self._reservations[path] = estimate
+            return path
+
+    def release(self, name, path):
+        used = proc.directory_size(path)
+        shutil.rmtree(path, ignore_errors=True)
+        with self._condition:
+            self.usage[name] = used
+            del self._reservations[path]
+            self._condition.notify_all()
+
+    def _reserved(self):
+        return sum(self._reservations.values())
+
+
+def default_budget(root):
+    configured = os.environ.get('CANARY_DISK_BUDGET_MB')
+    if configured:
+        return int(configured) * 1024 * 1024
+    stat = os.statvfs(root)
+    budget = int(stat.f_bavail * stat.f_frsize * _FREE_SPACE_SHARE)
+    if _filesystem_type(root) == 'tmpfs':
+        memory_mb = available_memory_mb()
+        if memory_mb is not None:
+            budget = min(budget, int(memory_mb * 1024 * 1024 *
+                                     _TMPFS_MEMORY_SHARE))
+    return budget
+
+
+def _filesystem_type(path):
+    path = os.path.realpath(path)
+    best, fs_type = '', None
+    try:
+        with open('/proc/mounts', 'r') as f:
+            for line in f:
+                fields = line.split()
+                mount_point = fields[1]
+                if (_contains(mount_point, path) and
+                        len(mount_point) >= len(best)):
+                    best, fs_type = mount_point, fields[2]
+    except OSError:
+        return None
+    return fs_type
+
+
+def _contains(mount_point, path):
+    return (mount_point == '/' or path == mount_point or
+            path.startswith(mount_point.rstrip('/') + '/'))
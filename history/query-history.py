@@ -0,0 +1,202 @@
+"""Report trends over the canary's history of check results.
+
+Reads the history the canary writes to ``history/`` in its state bucket, or
+to a local directory, and prints one of:
+
+* ``flakiness`` - how often the result of a check changed while the package
+  version stayed the same, which tells a flaky check from a broken release,
+* ``durations`` - p50 and p95 packaging durations, and how the p50 of the
+  second half of the period compares to the first half,
+* ``first-failure`` - for checks failing on their newest version, the first
+  version of the package that has failed ever since and the last one that
+  packaged.
+
+Checks are a package with a chalice version on a runtime.  Only records of
+the last ``--days`` days are read.
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+from collections import OrderedDict
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_ROOT, 'canary'))
+
+from packaging.version import parse as parse_version  # noqa: E402
+
+from chalicelib.history import FileHistoryStore  # noqa: E402
+from chalicelib.history import S3HistoryStore  # noqa: E402
+
+
+def query_history(args):
+    store = _create_store(args)
+    since = time.time() - args.days * 24 * 3600
+    rows = [row for row in store.read(since=since)
+            if not args.package or row['package'] in args.package]
+    report = _REPORTS[args.report](rows)
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        _print_table(report)
+
+
+def flakiness(rows):
+    by_check = _group(_real_checks(rows), _check)
+    report = []
+    for check, check_rows in by_check.items():
+        by_version = _group(check_rows, lambda row: row['version'])
+        flips = transitions = flaky_versions = 0
+        for version_rows in by_version.values():
+            outcomes = [row['success'] for row in version_rows]
+            changes = sum(1 for a, b in zip(outcomes, outcomes[1:]) if a != b)
+            flips += changes
+            transitions += len(outcomes) - 1
+            flaky_versions += bool(changes)
+        failures = sum(1 for row in check_rows if not row['success'])
+        report.append(OrderedDict([
+            ('check', check),
+            ('runs', len(check_rows)),
+            ('failure_rate', _ratio(failures, len(check_rows))),
+            ('flakiness', _ratio(flips, transitions)),
+            ('flaky_versions', flaky_versions),
+        ]))
+    report.sort(key=lambda item: (-item['flakiness'], item['check']))
+    return report
+
+
+def durations(rows):
+    timed = [row for row in _real_checks(rows)
+             if row.get('duration') is not None]
+    report = []
+    for check, check_rows in _group(timed, _check).items():
+        values = [row['duration'] for row in check_rows]
+        half = len(values) // 2
+        change = None
+        if half:
+            before = _percentile(values[:half], 50)
+            change = _ratio(_percentile(values[half:], 50) - before, before)
+        report.append(OrderedDict([
+            ('check', check),
+            ('runs', len(values)),
+            ('p50', round(_percentile(values, 50), 2)),
+            ('p95', round(_percentile(values, 95), 2)),
+            ('p50_change', change),
+        ]))
+    report.sort(key=lambda item: (-item['p95'], item['check']))
+    return report
+
+
+def first_failure(rows):
+    report = []
+    for check, check_rows in _group(rows, _check).items():
+        passed = OrderedDict()
+        for row in check_rows:
+            passed[row['version']] = (passed.get(row['version'], False) or
+                                      row['success'])
+        versions = sorted((version for version in passed
+                           if version is not None), key=parse_version)
+        first_failing = last_good = None
+        for version in reversed(versions):
+            if passed[version]:
+                last_good = version
+                break
+            first_failing = version
+        if first_failing is not None:
+            report.append(OrderedDict([
+                ('check', check),
+                ('first_failing_version', first_failing),
+                ('last_good_version', last_good),
+            ]))
+    report.sort(key=lambda item: item['check'])
+    return report
+
+
+_REPORTS = OrderedDict([
+    ('flakiness', flakiness),
+    ('durations', durations),
+    ('first-failure', first_failure),
+])
+
+
+def _create_store(args):
+    if args.bucket:
+        return S3HistoryStore(args.bucket)
+    return FileHistoryStore(args.dir)
+
+
+def _real_checks(rows):
+    # Index scan verdicts and checks skipped for a failed dependency say
+    # nothing about packaging the package itself.
+    return [row for row in rows
+            if not row.get('index_scan') and
+            row.get('failure_class') != 'dependency_failed']
+
+
+def _check(row):
+    return '%s chalice-%s %s' % (row['package'], row['chalice_version'],
+                                 row['runtime'])
+
+
+def _group(rows, key):
+    groups = OrderedDict()
+    for row in sorted(rows, key=lambda row: row['checked_at']):
+        groups.setdefault(key(row), []).append(row)
+    return groups
+
+
+def _percentile(values, percentile):
+    # Nearest rank, so the result is always a duration that was measured.
+    values = sorted(values)
+    rank = max(1, -(-len(values) * percentile // 100))
+    return values[int(rank) - 1]
+
+
+def _ratio(numerator, denominator):
+    if not denominator:
+        return 0.0
+    return round(float(numerator) / denominator, 3)
+
+
+def _print_table(report):
+    if not report:
+        print('No matching results.')
+        return
+    columns = list(report[0])
+    widths = [max(len(column), *(len(str(item[column])) for item in report))
+              for column in columns]
+    print('  '.join(column.ljust(width)
+                    for column, width in zip(columns, widths)))
+    for item in report:
+        print('  '.join(str(item[column]).ljust(width)
+                        for column, width in zip(columns, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('report', choices=list(_REPORTS))
+    parser.add_argument('--bucket',
+                        default=os.environ.get('CANARY_STATE_BUCKET'),
+                        help='State bucket to read the history from, '
+                             'defaults to CANARY_STATE_BUCKET.')
+    parser.add_argument('--dir',
+                        default=os.environ.get(
+                            'CANARY_HISTORY_DIR',
+                            os.path.join(tempfile.gettempdir(),
+                                         'canary-history')),
+                        help='Local history directory, used when no bucket '
+                             'is given.')
+    parser.add_argument('--days', type=float, default=30,
+                        help='Number of days of history to read.')
+    parser.add_argument('--package', action='append',
+                        help='Only report on this package, can be repeated.')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the report as JSON.')
+    query_history(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
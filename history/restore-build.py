@@ -0,0 +1,64 @@
+"""Restore the outputs of a failed check from the canary's build store.
+
+Without ``--manifest`` the checks that failed in the last ``--days`` days are
+listed.  With it, the project the check packaged is unpacked into
+``--output`` and its deployment package, when it produced one, into
+``--output``/deployment.
+"""
+import os
+import sys
+import time
+import tempfile
+import argparse
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_ROOT, 'canary'))
+
+from chalicelib.buildstore import FileBuildStore  # noqa: E402
+from chalicelib.buildstore import S3BuildStore  # noqa: E402
+
+
+def restore_build(args):
+    store = _create_store(args)
+    if args.manifest is None:
+        since = time.time() - args.days * 24 * 3600
+        for name, manifest in store.manifests(since=since):
+            print('%s  %s' % (name, manifest['failure_class']))
+        return
+    manifest = store.restore(args.manifest, args.output)
+    print('Restored %s %s to %s' % (manifest['key']['package'],
+                                    manifest['key']['version'], args.output))
+    for line in manifest['tail']:
+        print('  %s' % line)
+
+
+def _create_store(args):
+    if args.bucket:
+        return S3BuildStore(args.bucket)
+    return FileBuildStore(args.dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--manifest',
+                        help='Manifest of the check to restore, as listed.')
+    parser.add_argument('--output', default='restored-build',
+                        help='Directory to restore the outputs to.')
+    parser.add_argument('--bucket',
+                        default=os.environ.get('CANARY_STATE_BUCKET'),
+                        help='State bucket to read the build store from, '
+                             'defaults to CANARY_STATE_BUCKET.')
+    parser.add_argument('--dir',
+                        default=os.environ.get(
+                            'CANARY_BUILD_DIR',
+                            os.path.join(tempfile.gettempdir(),
+                                         'canary-builds')),
+                        help='Local build store, used when no bucket is '
+                             'given.')
+    parser.add_argument('--days', type=float, default=7,
+                        help='Number of days of checks to list.')
+    restore_build(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
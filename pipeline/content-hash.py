@@ -0,0 +1,87 @@
+"""Stamp a packaged template with a hash of everything it deploys.
+
+The hash covers the template and the local files it refers to, the Lambda
+bundles and the nested dashboard templates.  Zip files are hashed by the
+names and contents of their members, so rebuilding the same code with new
+timestamps gives the same hash.  The hash is added to the template as the
+``ContentHash`` output, which lets the build compare it with the deployed
+stack, and printed.
+"""
+import os
+import json
+import hashlib
+import zipfile
+import argparse
+
+
+OUTPUT_NAME = 'ContentHash'
+# Properties that refer to files packaged next to the template.
+LOCAL_PATH_PROPERTIES = ['CodeUri', 'TemplateURL']
+
+
+def stamp_content_hash(args):
+    with open(args.template_path, 'r') as f:
+        template = json.load(f)
+    content_hash = compute_content_hash(template, args.template_path)
+    template.setdefault('Outputs', {})[OUTPUT_NAME] = {'Value': content_hash}
+    with open(args.template_path, 'w') as f:
+        json.dump(template, f, indent=4, sort_keys=True)
+    print(content_hash)
+
+
+def compute_content_hash(template, template_path):
+    template = dict(template)
+    outputs = dict(template.get('Outputs', {}))
+    outputs.pop(OUTPUT_NAME, None)
+    template['Outputs'] = outputs
+    digest = hashlib.sha256()
+    digest.update(json.dumps(template, sort_keys=True).encode('utf-8'))
+    template_dir = os.path.dirname(os.path.abspath(template_path))
+    for path in sorted(set(_local_paths(template))):
+        digest.update(path.encode('utf-8'))
+        _update_with_file(digest, os.path.join(template_dir, path))
+    return digest.hexdigest()
+
+
+def _local_paths(value):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if (key in LOCAL_PATH_PROPERTIES and
+                    isinstance(item, str) and '://' not in item):
+                yield os.path.normpath(item)
+            else:
+                for path in _local_paths(item):
+                    yield path
+    elif isinstance(value, list):
+        for item in value:
+            for path in _local_paths(item):
+                yield path
+
+
+def _update_with_file(digest, filename):
+    if zipfile.is_zipfile(filename):
+        with zipfile.ZipFile(filename) as z:
+            for name in sorted(z.namelist()):
+                digest.update(name.encode('utf-8'))
+                digest.update(_file_digest(z.open(name)))
+    else:
+        with open(filename, 'rb') as f:
+            digest.update(_file_digest(f))
+
+
+def _file_digest(f):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+        digest.update(chunk)
+    return digest.digest()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('template_path')
+    args = parser.parse_args()
+    stamp_content_hash(args)
+
+
+if __name__ == '__main__':
+    main()
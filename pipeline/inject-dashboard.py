@@ -1,12 +1,61 @@
+import os
+import sys
+import copy
 import json
-import codecs
 import argparse
 
+from troposphere import AWSObject
+from troposphere import Parameter
+from troposphere import GetAtt
+from troposphere import Ref
 from troposphere import Sub
+from troposphere import Template
+from troposphere import s3
+from troposphere import cloudformation
 from troposphere import cloudwatch
-from troposphere.template_generator import TemplateGenerator
+from troposphere import encode_to_dict
+from troposphere import iam
+from troposphere.validators import positive_integer
 
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_ROOT, 'canary'))
 
+from chalicelib.matrix import Matrix  # noqa: E402
+
+
+# Mirrors the failure classes in canary/chalicelib/classify.py.
+FAILURE_CLASSES = ['missing_wheel', 'sdist_build', 'no_such_package',
+                   'network', 'timeout', 'unknown', 'dependency_failed']
+# A fixed set of alarms over the aggregate metrics, so the number of
+# resources does not grow with the package list.  The dashboards show which
+# package failed.
+ALARMS = [
+    ('CannotPackage',
+     'Alarm that triggers if Chalice fails to package any package.',
+     [('failure', [('FailureClass', failure_class)])
+      for failure_class in ['missing_wheel', 'sdist_build',
+                            'no_such_package', 'unknown']]),
+    ('CanaryDegraded',
+     'Alarm that triggers if package checks cannot complete because of '
+     'network errors, timeouts or failed shards.',
+     [('failure', [('FailureClass', 'network')]),
+      ('failure', [('FailureClass', 'timeout')]),
+      ('shard_failures', [])]),
+]
+# Lambda's limit on the unzipped size of a function, as in
+# canary/chalicelib/artifact.py, and how close to it a package's bundle may
+# get before ``BundleNearSizeLimit`` goes off.
+LAMBDA_UNZIPPED_LIMIT = 250 * 1024 * 1024
+BUNDLE_SIZE_THRESHOLD = 0.8 * LAMBDA_UNZIPPED_LIMIT
+# Keeps graph widgets readable and well within CloudWatch's limit on metrics
+# per widget.
+MAX_METRICS_PER_WIDGET = 100
+# Dashboards are split so that every template, including nested ones, stays
+# well below CloudFormation's template size limit.
+MAX_DASHBOARD_BYTES = 100 * 1024
+MAX_INLINE_DASHBOARD_BYTES = 300 * 1024
+MAX_NESTED_STACK_BYTES = 400 * 1024
+MAX_DASHBOARDS_PER_STACK = 100
 DASHBOARD = {
     "widgets": [
         {
@@ -121,67 +170,312 @@ DASHBOARD = {
 
 def inject_dashboard(args):
     template = _load_template(args.template_path)
-    packages = _load_packages(args.packages)
-    _inject_alarms(template, packages)
-
-    canary_lambda = template.resources['Canary']
-    dashboard_body = _build_dashboard_body(canary_lambda, packages)
-    dashboard = cloudwatch.Dashboard(
-        'ChalicePackaging',
-        DashboardName='ChalicePackaging',
-        DashboardBody=dashboard_body,
-    )
-    template.add_resource(dashboard)
-    new_template_content = template.to_json()
+    canary_lambda = template['Resources']['Canary']
+    packages, cells = _load_packages(args.packages,
+                                     canary_lambda['Properties']['Runtime'])
+    _inject_alarms(template)
+    _inject_bundle_size_alarm(template)
+
+    state_bucket = _inject_state_bucket(template, ['Canary', 'Worker'])
+    _inject_state_policy(template, state_bucket, 'Canary', 'Worker')
+    _set_environment_variable(template, 'Canary', 'CANARY_WORKER_FUNCTION',
+                              Ref('Worker'))
+    dashboards = _build_dashboards(packages, cells)
+    _inject_dashboards(template, args.template_path, dashboards)
+    new_template_content = json.dumps(template, indent=4, sort_keys=True)
     _overwrite_template(args.template_path, new_template_content)
 
 
 def _load_template(template_path):
-    raw_json = json.loads(open(template_path, 'r').read())
-    template = TemplateGenerator(raw_json)
-    return template
+    # The template generated by chalice is patched as plain JSON, only the
+    # added resources are built with troposphere.
+    with open(template_path, 'r') as f:
+        return json.load(f)
+
+
+def _add_resource(template, resource):
+    template['Resources'][resource.title] = resource.to_dict()
 
 
-def _load_packages(packages_file):
-    raw_packages = codecs.open(packages_file, 'r', encoding='utf-8').read()
-    packages = json.loads(raw_packages)
-    return packages
+def _load_packages(packages_file, default_runtime):
+    """Return the packages and the dimensions of every matrix cell.
 
+    The list is parsed by the canary's own ``Matrix``, so the dashboards
+    and alarms use the names the canary publishes its metrics under.
+    """
+    matrix = Matrix.load(packages_file, default_runtime)
+    return matrix.requirements, [list(matrix.dimensions(cell).items())
+                                 for cell in matrix.cells()]
 
-def _inject_alarms(template, packages):
-    for package in packages:
-        cannot_package_alarm = cloudwatch.Alarm(
-            'CannotPackage%s' % package,
-            AlarmDescription=(
-                'Alarm that triggers if Chalice fails to package %s.' % package
-            ),
-            ComparisonOperator='LessThanThreshold',
+
+def _inject_alarms(template):
+    for name, description, metrics in ALARMS:
+        queries = [{
+            'Id': 'm%s' % i,
+            'MetricStat': {
+                'Metric': {
+                    'Namespace': 'ChalicePackageCanary',
+                    'MetricName': metric_name,
+                    'Dimensions': [{'Name': dimension, 'Value': value}
+                                   for dimension, value in dimensions],
+                },
+                'Period': 3600,
+                'Stat': 'Sum',
+            },
+            'ReturnData': False,
+        } for i, (metric_name, dimensions) in enumerate(metrics)]
+        queries.append({
+            'Id': 'total',
+            'Expression': 'SUM([%s])' % ','.join(q['Id'] for q in queries),
+            'Label': name,
+            'ReturnData': True,
+        })
+        _add_resource(template, _MetricMathAlarm(
+            name,
+            AlarmDescription=description,
+            ComparisonOperator='GreaterThanThreshold',
             EvaluationPeriods=1,
-            Period=3600,
-            MetricName='package',
-            Namespace='ChalicePackageCanary',
-            Threshold='1',
-            Statistic='Minimum',
-            Dimensions=[cloudwatch.MetricDimension(
-                Name='Name',
-                Value=package
-            )]
-        )
-        template.add_resource(cannot_package_alarm)
-
-
-def _build_dashboard_body(canary_lambda, packages):
-    metrics = []
-    prefix = ["ChalicePackageCanary", "package", "Name"]
-    for package in packages:
-        metric = [*prefix, package,
-                  {"period": 3600}],
-        metrics.extend(metric)
-        prefix = ["..."]
-    dashboard = DASHBOARD.copy()
-    dashboard['widgets'][0]['properties']['metrics'] = metrics
-    dashboard_body = json.dumps(dashboard)
-    return Sub(dashboard_body, CanaryFunctionName=canary_lambda.Ref())
+            Metrics=queries,
+            Threshold='0',
+            TreatMissingData='notBreaching',
+        ))
+
+
+def _inject_bundle_size_alarm(template):
+    _add_resource(template, cloudwatch.Alarm(
+        'BundleNearSizeLimit',
+        AlarmDescription='Alarm that triggers if the unzipped deployment '
+                         'package of any package nears the Lambda size '
+                         'limit.',
+        ComparisonOperator='GreaterThanThreshold',
+        EvaluationPeriods=1,
+        MetricName='artifact_unzipped_bytes',
+        Namespace='ChalicePackageCanary',
+        Period=3600,
+        Statistic='Maximum',
+        Threshold=str(int(BUNDLE_SIZE_THRESHOLD)),
+        TreatMissingData='notBreaching',
+    ))
+
+
+class _MetricMathAlarm(AWSObject):
+    """An alarm on a metric math expression.
+
+    ``cloudwatch.Alarm`` in this troposphere release only supports alarms
+    on a single metric.
+    """
+    resource_type = 'AWS::CloudWatch::Alarm'
+
+    props = {
+        'AlarmDescription': (str, False),
+        'ComparisonOperator': (str, True),
+        'EvaluationPeriods': (positive_integer, True),
+        'Metrics': (list, True),
+        'Threshold': (str, True),
+        'TreatMissingData': (str, False),
+    }
+
+
+def _inject_state_bucket(template, functions):
+    state_bucket = s3.Bucket('CanaryStateBucket')
+    _add_resource(template, state_bucket)
+    for function in functions:
+        _set_environment_variable(template, function, 'CANARY_STATE_BUCKET',
+                                  Ref(state_bucket))
+    return state_bucket
+
+
+def _inject_state_policy(template, state_bucket, canary, worker):
+    """Grant the functions' role the state bucket and the worker only.
+
+    Package builds run third party code with the role's permissions, so
+    ``policy.json`` grants nothing beyond logs and metrics.  The grants are
+    a policy of their own rather than part of the role, which the worker
+    function depends on.
+    """
+    role = template['Resources'][canary]['Properties']['Role']
+    role_name = role['Fn::GetAtt'][0]
+    _add_resource(template, iam.PolicyType(
+        'CanaryStatePolicy',
+        PolicyName='CanaryStatePolicy',
+        Roles=[Ref(role_name)],
+        PolicyDocument={
+            'Version': '2012-10-17',
+            'Statement': [
+                {
+                    'Effect': 'Allow',
+                    'Action': ['s3:GetObject', 's3:PutObject',
+                               's3:DeleteObject'],
+                    'Resource': Sub('${%s.Arn}/*' % state_bucket.title),
+                },
+                {
+                    'Effect': 'Allow',
+                    'Action': 's3:ListBucket',
+                    'Resource': GetAtt(state_bucket, 'Arn'),
+                },
+                {
+                    'Effect': 'Allow',
+                    'Action': 'lambda:InvokeFunction',
+                    'Resource': GetAtt(worker, 'Arn'),
+                },
+            ],
+        },
+    ))
+
+
+def _set_environment_variable(template, function, name, value):
+    properties = template['Resources'][function]['Properties']
+    variables = properties.setdefault(
+        'Environment', {}).setdefault('Variables', {})
+    variables[name] = encode_to_dict(value)
+
+
+def _build_dashboards(packages, cells):
+    """Return the bodies of the dashboards, split to stay within limits."""
+    lambda_widgets = copy.deepcopy(DASHBOARD['widgets'][1:])
+    status_widget = DASHBOARD['widgets'][0]
+    widgets = _chunked_widgets(
+        status_widget['properties']['title'],
+        [["ChalicePackageCanary", "package",
+          *[part for dimension in dimensions for part in dimension],
+          {"period": 3600}]
+         for dimensions in cells],
+        status_widget)
+    widgets.extend(sorted(lambda_widgets, key=lambda widget: widget['y']))
+    widgets.append(_package_widget(
+        'Packaging Failures by Class',
+        [["ChalicePackageCanary", "failure", "FailureClass",
+          failure_class, {"period": 3600, "stat": "Sum"}]
+         for failure_class in FAILURE_CLASSES]))
+    widgets.append(_package_widget(
+        'Coverage and Deferred Checks',
+        [["ChalicePackageCanary", "coverage",
+          {"period": 3600, "stat": "Minimum"}],
+         ["ChalicePackageCanary", "deferred_checks",
+          {"period": 3600, "stat": "Maximum", "yAxis": "right"}]]))
+    widgets.extend(_chunked_widgets(
+        'Packaging Duration',
+        _package_metrics('duration', packages, ['Phase', 'total'])))
+    widgets.extend(_chunked_widgets(
+        'Packaging Peak RSS',
+        _package_metrics('peak_rss', packages, stat='Maximum')))
+    widgets.extend(_chunked_widgets(
+        'Packaging Bytes Downloaded',
+        _package_metrics('bytes_downloaded', packages)))
+    widgets.extend(_chunked_widgets(
+        'Unzipped Bundle Size',
+        _package_metrics('artifact_unzipped_bytes', packages,
+                         stat='Maximum')))
+    widgets.extend(_chunked_widgets(
+        'Bundle Import Time',
+        _package_metrics('import_time', packages, stat='Maximum')))
+    dashboards = []
+    for widget in widgets:
+        if (not dashboards or
+                len(json.dumps(dashboards[-1] + [widget])) >
+                MAX_DASHBOARD_BYTES):
+            dashboards.append([])
+        dashboards[-1].append(widget)
+    bodies = []
+    for dashboard_widgets in dashboards:
+        for i, widget in enumerate(dashboard_widgets):
+            widget['x'] = 0
+            widget['y'] = i * widget['height']
+        bodies.append(json.dumps({'widgets': dashboard_widgets}))
+    return bodies
+
+
+def _chunked_widgets(title, metrics, template_widget=None):
+    chunks = [metrics[i:i + MAX_METRICS_PER_WIDGET]
+              for i in range(0, len(metrics), MAX_METRICS_PER_WIDGET)]
+    widgets = []
+    for i, chunk in enumerate(chunks):
+        chunk_title = title
+        if len(chunks) > 1:
+            chunk_title = '%s (%s/%s)' % (title, i + 1, len(chunks))
+        if template_widget is None:
+            widget = _package_widget(chunk_title, chunk)
+        else:
+            widget = copy.deepcopy(template_widget)
+            widget['properties']['title'] = chunk_title
+            widget['properties']['metrics'] = chunk
+        widgets.append(widget)
+    return widgets
+
+
+def _package_metrics(metric_name, packages, dimensions=(), stat=None):
+    options = {"period": 3600}
+    if stat is not None:
+        options['stat'] = stat
+    return [["ChalicePackageCanary", metric_name, "Name", package,
+             *dimensions, options]
+            for package in packages]
+
+
+def _package_widget(title, metrics):
+    return {
+        "type": "metric",
+        "x": 0,
+        "y": 0,
+        "width": 15,
+        "height": 6,
+        "properties": {
+            "view": "timeSeries",
+            "stacked": False,
+            "metrics": metrics,
+            "region": "${AWS::Region}",
+            "title": title,
+            "period": 300
+        }
+    }
+
+
+def _inject_dashboards(template, template_path, bodies):
+    """Add the dashboards, moving them to nested stacks when they are large.
+
+    The first dashboard always stays in the main template.  When the rest
+    would push the main template past ``MAX_INLINE_DASHBOARD_BYTES`` they
+    are written to nested stack templates next to it, which
+    ``aws cloudformation package`` uploads along with the code.
+    """
+    _add_resource(template, _dashboard(
+        1, Sub(bodies[0], CanaryFunctionName=Ref('Canary'))))
+    rest = list(enumerate(bodies[1:], 2))
+    if sum(len(body) for _, body in rest) <= MAX_INLINE_DASHBOARD_BYTES:
+        for number, body in rest:
+            _add_resource(template, _dashboard(
+                number, Sub(body, CanaryFunctionName=Ref('Canary'))))
+        return
+    stacks = []
+    for number, body in rest:
+        if (not stacks or
+                sum(len(b) for _, b in stacks[-1]) + len(body) >
+                MAX_NESTED_STACK_BYTES or
+                len(stacks[-1]) >= MAX_DASHBOARDS_PER_STACK):
+            stacks.append([])
+        stacks[-1].append((number, body))
+    template_dir = os.path.dirname(os.path.abspath(template_path))
+    for i, stack_dashboards in enumerate(stacks, 1):
+        nested = Template()
+        nested.add_parameter(Parameter('CanaryFunctionName', Type='String'))
+        for number, body in stack_dashboards:
+            nested.add_resource(_dashboard(number, Sub(body)))
+        filename = 'dashboards-%s.json' % i
+        _overwrite_template(os.path.join(template_dir, filename),
+                            nested.to_json())
+        _add_resource(template, cloudformation.Stack(
+            'PackageDashboards%s' % i,
+            TemplateURL='./%s' % filename,
+            Parameters={'CanaryFunctionName': Ref('Canary')},
+        ))
+
+
+def _dashboard(number, body):
+    name = 'ChalicePackaging'
+    if number > 1:
+        name = '%s%s' % (name, number)
+    return cloudwatch.Dashboard(name, DashboardName=name,
+                                DashboardBody=body)
 
 
 def _overwrite_template(template_path, new_template_content):
@@ -140,6 +140,16 @@ class PipelineTemplate(object):
                         ],
                         Resource=[_s3.ARN('*')],
                     ),
+                    # Lets the build compare its content hash with the
+                    # deployed stack's.
+                    Statement(
+                        Effect=Allow,
+                        Action=[
+                            _cfn.DescribeStacks,
+                            _cfn.GetTemplate,
+                        ],
+                        Resource=['*'],
+                    ),
                 ]
             ),
             Roles=[Ref(code_build_role)],
@@ -377,6 +387,10 @@ class PipelineTemplate(object):
                         Name='APP_S3_BUCKET',
                         Value=Ref('ApplicationBucket'),
                     ),
+                    codebuild.EnvironmentVariable(
+                        Name='APP_STACK_NAME',
+                        Value=Sub('${ApplicationName}-beta-stack'),
+                    ),
                 ]
             ),
             ServiceRole=code_build_role.GetAtt('Arn'),
@@ -384,6 +398,12 @@ class PipelineTemplate(object):
                 Type='CODEPIPELINE',
                 BuildSpec='pipeline/buildspec.yml',
             ),
+            # Keeps the build virtualenv and pip's cache between builds,
+            # see the cache paths in buildspec.yml.
+            Cache=codebuild.ProjectCache(
+                Type='S3',
+                Location=Sub('${ArtifactBucketStore}/build-cache'),
+            ),
         )
         self._t.add_resource(app_package_build)
         return app_package_build
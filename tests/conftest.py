@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The canary is deployed from its own directory, so chalicelib is imported
+# the way the Lambda function imports it.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'canary'))
@@ -0,0 +1,114 @@
+import os
+import time
+import zipfile
+
+from chalicelib.buildstore import FileBuildStore
+from chalicelib.results import ResultKey
+
+
+_KEY = ResultKey('Flask', '2.0.0', '1.2.0', 'python3.6')
+_DAY = 24 * 3600
+
+
+def _dist(name, version, files, tag='py3-none-any'):
+    dist_info = '%s-%s.dist-info' % (name, version)
+    files = dict(files)
+    files['%s/WHEEL' % dist_info] = 'Wheel-Version: 1.0\nTag: %s\n' % tag
+    record = ''.join('%s,,\n' % path for path in sorted(files))
+    files['%s/RECORD' % dist_info] = record + '%s/RECORD,,\n' % dist_info
+    return files
+
+
+def _workdir(tmp_path, name='project', extra=None):
+    """A project as chalice leaves it, with its deployment package."""
+    workdir = tmp_path / name
+    (workdir / 'out').mkdir(parents=True)
+    (workdir / 'app.py').write_text('from chalice import Chalice\n')
+    files = _dist('flask', '2.0.0', {'flask/__init__.py': 'flask'})
+    files.update(_dist('jinja2', '3.0.0', {'jinja2/__init__.py': 'jinja2'}))
+    files['app.py'] = 'from chalice import Chalice\n'
+    files.update(extra or {})
+    with zipfile.ZipFile(str(workdir / 'out' / 'deployment.zip'), 'w') as z:
+        for path, content in files.items():
+            z.writestr(path, content)
+    return str(workdir)
+
+
+def _names(store, prefix=''):
+    return sorted(store._list(prefix))
+
+
+def test_green_check_keeps_only_its_wheels(tmp_path):
+    store = FileBuildStore(str(tmp_path / 'store'))
+    assert store.add(_KEY, _workdir(tmp_path), True) is None
+    assert _names(store, 'manifests/') == []
+    assert len(_names(store, 'objects/')) == 2
+    wheelhouse = tmp_path / 'wheelhouse'
+    wheelhouse.mkdir()
+    assert store.export_wheels('Jinja2', '3.0.0', str(wheelhouse)) == 1
+    wheel, = os.listdir(str(wheelhouse))
+    assert wheel == 'jinja2-3.0.0-py3-none-any.whl'
+    with zipfile.ZipFile(str(wheelhouse / wheel)) as z:
+        assert z.read('jinja2/__init__.py') == b'jinja2'
+
+
+def test_same_distributions_are_stored_once(tmp_path):
+    store = FileBuildStore(str(tmp_path / 'store'))
+    store.add(_KEY, _workdir(tmp_path, 'one'), True)
+    store.add(_KEY, _workdir(tmp_path, 'two'), True)
+    assert len(_names(store, 'objects/')) == 2
+    wheelhouse = tmp_path / 'wheelhouse'
+    wheelhouse.mkdir()
+    assert store.export_wheels('flask', '2.0.0', str(wheelhouse)) == 1
+
+
+def test_failed_check_is_restored(tmp_path):
+    store = FileBuildStore(str(tmp_path / 'store'))
+    name = store.add(_KEY, _workdir(tmp_path), False, 'missing_wheel',
+                     ['Could not install dependencies:'])
+    (listed, manifest), = store.manifests()
+    assert listed == name
+    assert manifest['failure_class'] == 'missing_wheel'
+    target = tmp_path / 'restored'
+    store.restore(name, str(target))
+    assert (target / 'app.py').read_text() == 'from chalice import Chalice\n'
+    assert (target / 'deployment' / 'jinja2' / '__init__.py').exists()
+    assert (target / 'deployment' / 'app.py').exists()
+
+
+def test_prune_drops_what_was_last_stored_before_the_cutoff(tmp_path,
+                                                            monkeypatch):
+    store = FileBuildStore(str(tmp_path / 'store'))
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now - 30 * _DAY)
+    store.add(_KEY, _workdir(tmp_path, 'old'), False, 'unknown')
+    monkeypatch.setattr(time, 'time', lambda: now)
+    store.add(_KEY, _workdir(tmp_path, 'new', {
+        'other/__init__.py': 'other'}), True)
+    before = _names(store, 'objects/')
+    store.prune(now - 14 * _DAY)
+    assert _names(store, 'manifests/') == []
+    assert len(_names(store, 'wheels/')) == 2
+    # The project and the unrecorded files of the failed check go, the
+    # wheels bundled again today stay.
+    assert len(_names(store, 'objects/')) == 2
+    assert set(_names(store, 'objects/')) < set(before)
+    store.prune(now + 1 * _DAY)
+    assert _names(store) == []
+
+
+def test_prune_keeps_recent_manifests_and_their_parts(tmp_path):
+    store = FileBuildStore(str(tmp_path / 'store'))
+    store.add(_KEY, _workdir(tmp_path), False, 'unknown')
+    names = _names(store)
+    store.prune(time.time() - _DAY)
+    assert _names(store) == names
+
+
+def test_prune_out_of_time_keeps_every_part(tmp_path):
+    store = FileBuildStore(str(tmp_path / 'store'))
+    store.add(_KEY, _workdir(tmp_path), False, 'unknown')
+    objects = _names(store, 'objects/')
+    store.prune(time.time() + 2 * _DAY, timeout=0)
+    assert _names(store, 'manifests/') == []
+    assert _names(store, 'objects/') == objects
@@ -0,0 +1,83 @@
+from chalicelib.classify import MISSING_WHEEL
+from chalicelib.classify import NETWORK
+from chalicelib.classify import NO_SUCH_PACKAGE
+from chalicelib.classify import SDIST_BUILD
+from chalicelib.classify import UNKNOWN
+from chalicelib.classify import OutputClassifier
+
+
+_MISSING_OUTPUT = [
+    'Creating deployment package.',
+    'Could not install dependencies:',
+    'cryptography==2.1.4',
+    'You will have to build these yourself and vendor them in',
+    'the chalice vendor folder.',
+]
+
+
+def _classify(lines, returncode=1, sdist_only=()):
+    classifier = OutputClassifier(sdist_only)
+    for line in lines:
+        if classifier.feed(line):
+            break
+    return classifier.finish(returncode)
+
+
+def test_success():
+    assert _classify(['Creating deployment package.'], returncode=0) is None
+
+
+def test_missing_wheel():
+    assert _classify(_MISSING_OUTPUT) == MISSING_WHEEL
+
+
+def test_missing_sdist_only_package_is_a_failed_sdist_build():
+    assert _classify(_MISSING_OUTPUT,
+                     sdist_only={'cryptography'}) == SDIST_BUILD
+
+
+def test_missing_list_ends_the_output():
+    classifier = OutputClassifier()
+    assert [classifier.feed(line) for line in _MISSING_OUTPUT[:4]] == [
+        False, False, False, True]
+
+
+def test_no_such_package_is_definitive():
+    classifier = OutputClassifier()
+    assert classifier.feed('Could not find a version that satisfies the '
+                           'requirement nosuchpackage')
+    assert classifier.finish(1) == NO_SUCH_PACKAGE
+
+
+def test_network():
+    assert _classify(['Max retries exceeded']) == NETWORK
+
+
+def test_unknown_failure():
+    assert _classify(['Traceback (most recent call last):']) == UNKNOWN
+
+
+def test_missing_identifiers_from_the_build_server():
+    classifier = OutputClassifier()
+    classifier.add_missing(['pycrypto==2.6.1'], sdists=['pycrypto==2.6.1'])
+    assert classifier.finish(1) == SDIST_BUILD
+
+
+def test_tail_keeps_the_last_lines():
+    classifier = OutputClassifier(tail_size=2)
+    for line in ['one\n', 'two\n', 'three\n']:
+        classifier.feed(line)
+    assert list(classifier.tail) == ['two', 'three']
+
+
+def test_retried_network_error_does_not_fail_a_run_that_packaged():
+    assert _classify([
+        "Retrying (Retry(total=4, connect=None, read=None, redirect=None)) "
+        "after connection broken by 'ReadTimeoutError(\"HTTPSConnectionPool"
+        "(host='pypi.org', port=443): Read timed out.\")': /simple/six/",
+        'Creating deployment package.',
+    ], returncode=0) is None
+
+
+def test_network_error_of_a_failed_run():
+    assert _classify(['Connection reset by peer', 'Error: boom']) == NETWORK
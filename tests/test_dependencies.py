@@ -0,0 +1,87 @@
+import pytest
+
+from chalicelib import dependencies
+from chalicelib.dependencies import DependencyGraph
+
+
+def test_levels_put_dependencies_first():
+    graph = DependencyGraph({
+        'Jinja2': ['MarkupSafe'],
+        'Flask': ['Jinja2', 'MarkupSafe'],
+        'MarkupSafe': [],
+        'requests': [],
+    })
+    assert graph.levels(['Flask', 'Jinja2', 'MarkupSafe', 'requests']) == [
+        ['MarkupSafe', 'requests'], ['Jinja2'], ['Flask']]
+
+
+def test_levels_ignore_dependencies_outside_the_requirements():
+    graph = DependencyGraph({'Jinja2': ['MarkupSafe']})
+    assert graph.levels(['Jinja2']) == [['Jinja2']]
+
+
+def test_levels_put_a_cycle_last_with_what_depends_on_it():
+    graph = DependencyGraph({'a': ['b'], 'b': ['a'], 'c': ['a'], 'd': []})
+    assert graph.levels(['a', 'b', 'c', 'd']) == [['d'], ['a', 'b', 'c']]
+
+
+def test_components_group_connected_requirements_in_order():
+    graph = DependencyGraph({
+        'Flask': ['Jinja2'],
+        'Jinja2': ['MarkupSafe'],
+        'boto3': ['botocore'],
+    })
+    assert graph.components(
+        ['requests', 'MarkupSafe', 'boto3', 'Flask', 'botocore',
+         'Jinja2']) == [
+        ['requests'], ['MarkupSafe', 'Flask', 'Jinja2'],
+        ['boto3', 'botocore']]
+
+
+def test_dependencies_are_transitive():
+    graph = DependencyGraph({'Flask': ['Jinja2'], 'Jinja2': ['MarkupSafe']})
+    assert graph.dependencies('Flask') == {'Jinja2', 'MarkupSafe'}
+    assert graph.dependencies('MarkupSafe') == set()
+
+
+_REQUIRES = {
+    ('Jinja2', '3.0.0'): ['MarkupSafe>=2.0'],
+    ('Flask', '2.0.0'): ['Jinja2>=3.0', 'Werkzeug>=2.0',
+                         "pytest; extra == 'testing'"],
+}
+_RELEASES = {'markupsafe': {
+    'info': {'name': 'MarkupSafe', 'version': '2.0.1'},
+    'releases': {'1.1.1': [{}], '2.0.0': [{}], '2.0.1': [{}]},
+}}
+
+
+@pytest.fixture
+def pypi(monkeypatch):
+    monkeypatch.setattr(dependencies.pypi, 'requires',
+                        lambda name, version: _REQUIRES.get((name, version),
+                                                            []))
+    monkeypatch.setattr(dependencies.pypi, 'project_info',
+                        lambda name: _RELEASES[name])
+
+
+def test_resolve_links_the_releases_a_package_installs(pypi):
+    graph = DependencyGraph.resolve({
+        'Flask': '2.0.0', 'Jinja2': '3.0.0', 'MarkupSafe': '2.0.1',
+        'pytest': '7.0.0'})
+    assert graph.dependencies('Flask') == {'Jinja2', 'MarkupSafe'}
+    assert graph.dependencies('pytest') == set()
+
+
+def test_resolve_ignores_entries_of_other_releases(pypi):
+    graph = DependencyGraph.resolve({
+        'Jinja2': '3.0.0', 'MarkupSafe<2': '1.1.1',
+        'MarkupSafe==2.0.1': '2.0.1'})
+    assert graph.dependencies('Jinja2') == {'MarkupSafe==2.0.1'}
+
+
+def test_resolve_without_release_lookups(monkeypatch):
+    def fail(*args):
+        raise IOError('PyPI is down')
+    monkeypatch.setattr(dependencies.pypi, 'requires', fail)
+    graph = DependencyGraph.resolve({'Jinja2': '3.0.0', 'MarkupSafe': None})
+    assert graph.dependencies('Jinja2') == set()
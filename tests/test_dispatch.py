@@ -0,0 +1,41 @@
+from chalicelib.dispatch import LocalDispatcher
+from chalicelib.dispatch import ShardFailedError
+from chalicelib.dispatch import shard
+from chalicelib.dispatch import shard_groups
+
+
+def test_results_in_order():
+    dispatcher = LocalDispatcher(lambda payload: payload['n'] * 2)
+    results, failures = dispatcher.dispatch([{'n': 1}, {'n': 2}])
+    assert results == [2, 4]
+    assert failures == []
+
+
+def test_a_failed_shard_does_not_stop_the_others():
+    def handler(payload):
+        if payload['n'] == 1:
+            raise RuntimeError('boom')
+        return payload['n']
+    results, failures = LocalDispatcher(handler).dispatch(
+        [{'n': 0}, {'n': 1}, {'n': 2}])
+    assert results == [0, 2]
+    assert len(failures) == 1
+    assert isinstance(failures[0], ShardFailedError)
+    assert failures[0].payload == {'n': 1}
+    assert str(failures[0].error) == 'boom'
+
+
+def test_one_shard_at_a_time():
+    assert LocalDispatcher(None).concurrency == 1
+    assert LocalDispatcher(None).dispatch([]) == ([], [])
+
+
+def test_shard_keeps_everything_together_without_a_size():
+    assert shard(range(5), 0) == [[0, 1, 2, 3, 4]]
+    assert shard(range(5), 2) == [[0, 1], [2, 3], [4]]
+
+
+def test_shard_groups_never_split_a_group():
+    groups = [['a'], ['b', 'c', 'd'], ['e'], ['f']]
+    assert shard_groups(groups, 2) == [['a'], ['b', 'c', 'd'], ['e', 'f']]
+    assert shard_groups(groups, 0) == [['a', 'b', 'c', 'd', 'e', 'f']]
@@ -0,0 +1,128 @@
+import pytest
+
+from chalicelib.matrix import CRITICAL
+from chalicelib.matrix import DEFAULT_SETTINGS
+from chalicelib.matrix import LATEST
+from chalicelib.matrix import Cell
+from chalicelib.matrix import FileMatrixSource
+from chalicelib.matrix import Matrix
+from chalicelib.matrix import MatrixProvider
+from chalicelib.matrix import PackageSettings
+from chalicelib.matrix import runtime_abi
+
+
+def test_list_of_requirements():
+    matrix = Matrix.from_document(['requests', 'Flask'], 'python3.6')
+    assert matrix.cells() == [Cell('requests', LATEST, 'python3.6'),
+                              Cell('Flask', LATEST, 'python3.6')]
+
+
+def test_every_combination():
+    matrix = Matrix.from_document({
+        'packages': ['requests'],
+        'chalice_versions': ['latest', '1.6.0'],
+        'runtimes': ['python3.6', 'python2.7'],
+    }, 'python3.6')
+    assert matrix.cells() == [
+        Cell('requests', 'latest', 'python3.6'),
+        Cell('requests', 'latest', 'python2.7'),
+        Cell('requests', '1.6.0', 'python3.6'),
+        Cell('requests', '1.6.0', 'python2.7'),
+    ]
+
+
+def test_default_cell_keeps_its_original_dimensions():
+    matrix = Matrix.from_document({
+        'packages': ['requests'],
+        'runtimes': ['python3.6', 'python2.7'],
+    }, 'python3.6')
+    default, other = matrix.cells()
+    assert dict(matrix.dimensions(default)) == {'Name': 'requests'}
+    assert dict(matrix.dimensions(other)) == {
+        'Name': 'requests', 'ChaliceVersion': 'latest',
+        'Runtime': 'python2.7'}
+
+
+def test_runtime_abi():
+    assert runtime_abi('python2.7') == 'cp27mu'
+    assert runtime_abi('python3.6') == 'cp36m'
+    assert runtime_abi('python3.8') == 'cp38'
+
+
+def test_duplicate_spellings_are_checked_once():
+    matrix = Matrix.from_document(['Jinja2', ' jinja2', 'jinja-2'],
+                                  'python3.6')
+    assert matrix.requirements == ['Jinja2', 'jinja-2']
+
+
+@pytest.mark.parametrize('document', [
+    {},
+    {'packages': []},
+    {'packages': 'requests'},
+    {'packages': ['requests'], 'runtimes': ['python3']},
+    {'packages': ['requests'], 'chalice_versions': ['not a version']},
+    {'packages': ['requests[']},
+    {'packages': [{'requirement': 'requests', 'tier': 'urgent'}]},
+    {'packages': [{'requirement': 'requests', 'every_hours': -1}]},
+    {'packages': [{'requirement': 'requests', 'owner': 'me'}]},
+])
+def test_invalid_documents(document):
+    with pytest.raises(ValueError):
+        Matrix.from_document(document, 'python3.6')
+
+
+class FakeSource(object):
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.versions = []
+
+    def fetch(self, version=None):
+        self.versions.append(version)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def test_provider_reloads_only_changed_documents():
+    source = FakeSource((['requests'], 'v1'), None, (['Flask'], 'v2'))
+    provider = MatrixProvider(source, 'python3.6')
+    first = provider.get()
+    assert provider.get() is first
+    assert provider.get().requirements == ['Flask']
+    assert source.versions == [None, 'v1', 'v1']
+
+
+@pytest.mark.parametrize('error', [ValueError('not valid'),
+                                   IOError('S3 is down')])
+def test_provider_keeps_the_last_valid_matrix(error):
+    source = FakeSource((['requests'], 'v1'), error, ({'packages': []}, 'v2'))
+    provider = MatrixProvider(source, 'python3.6')
+    matrix = provider.get()
+    assert provider.get() is matrix
+    assert provider.get() is matrix
+
+
+def test_provider_without_a_matrix_raises():
+    provider = MatrixProvider(FakeSource(IOError('S3 is down')), 'python3.6')
+    with pytest.raises(IOError):
+        provider.get()
+
+
+def test_file_source_is_versioned_by_its_stat(tmp_path):
+    path = tmp_path / 'packages.json'
+    path.write_text('["requests"]')
+    source = FileMatrixSource(str(path))
+    document, version = source.fetch()
+    assert document == ['requests']
+    assert source.fetch(version) is None
+
+
+def test_package_settings():
+    matrix = Matrix.from_document({'packages': [
+        {'requirement': 'boto3', 'tier': 'critical', 'every_hours': 1},
+        'requests',
+    ]}, 'python3.6')
+    assert matrix.requirements == ['boto3', 'requests']
+    assert matrix.settings('boto3') == PackageSettings(CRITICAL, 1, None)
+    assert matrix.settings('requests') == DEFAULT_SETTINGS
@@ -0,0 +1,61 @@
+import pytest
+
+from chalicelib.metrics import MemorySink
+
+
+class FlakySink(MemorySink):
+    """Fails the batch after ``fail_after`` datums were published."""
+    def __init__(self, fail_after, batch_size):
+        super(FlakySink, self).__init__(batch_size)
+        self.fail_after = fail_after
+
+    def _publish(self, batch):
+        if (self.fail_after is not None and
+                len(self.published) >= self.fail_after):
+            self.fail_after = None
+            raise RuntimeError('throttled')
+        super(FlakySink, self)._publish(batch)
+
+
+def _values(datums):
+    return [datum['Value'] for datum in datums]
+
+
+def test_flush_publishes_in_batches():
+    published = []
+
+    class RecordingSink(MemorySink):
+        def _publish(self, batch):
+            published.append(_values(batch))
+    sink = RecordingSink(batch_size=2)
+    for value in range(5):
+        sink.add('package', value)
+    sink.flush()
+    assert published == [[0, 1], [2, 3], [4]]
+    assert sink.pending() == 0
+
+
+def test_failed_batch_and_the_ones_after_it_are_sent_next_flush():
+    sink = FlakySink(fail_after=2, batch_size=2)
+    for value in range(7):
+        sink.add('package', value)
+    with pytest.raises(RuntimeError):
+        sink.flush()
+    assert _values(sink.published) == [0, 1]
+    assert sink.pending() == 5
+    sink.add('package', 7)
+    sink.flush()
+    assert _values(sink.published) == list(range(8))
+    assert sink.pending() == 0
+
+
+def test_dimensions_are_sorted():
+    sink = MemorySink()
+    sink.add('package', 1, {'Runtime': 'python3.6', 'Name': 'requests'},
+             unit='Count')
+    sink.flush()
+    datum, = sink.published
+    assert datum['Dimensions'] == [
+        {'Name': 'Name', 'Value': 'requests'},
+        {'Name': 'Runtime', 'Value': 'python3.6'}]
+    assert datum['Unit'] == 'Count'
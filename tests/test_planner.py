@@ -0,0 +1,43 @@
+from chalicelib.matrix import CRITICAL
+from chalicelib.matrix import LONG_TAIL
+from chalicelib.matrix import STANDARD
+from chalicelib.planner import CHANGED
+from chalicelib.planner import SCHEDULED
+from chalicelib.planner import STALE
+from chalicelib.planner import Candidate
+from chalicelib.planner import plan
+
+
+def _candidate(key, tier=STANDARD, reason=STALE, cost=10, checked_at=None):
+    return Candidate(key, [], tier, reason, cost, checked_at)
+
+
+def test_critical_candidates_are_planned_beyond_the_budget():
+    critical = _candidate('critical', tier=CRITICAL, reason=SCHEDULED,
+                          cost=100)
+    standard = _candidate('standard')
+    planned, deferred = plan([standard, critical], budget=50)
+    assert planned == [critical]
+    assert deferred == [standard]
+
+
+def test_tiers_then_reasons_then_least_recently_checked():
+    recent = _candidate('recent', checked_at=200)
+    old = _candidate('old', checked_at=100)
+    changed = _candidate('changed', reason=CHANGED, checked_at=300)
+    long_tail = _candidate('long_tail', tier=LONG_TAIL, reason=CHANGED)
+    planned, deferred = plan([long_tail, recent, old, changed], budget=30)
+    assert [c.key for c in planned] == ['changed', 'old', 'recent']
+    assert [c.key for c in deferred] == ['long_tail']
+
+
+def test_cheaper_candidates_fill_what_is_left_of_the_budget():
+    expensive = _candidate('expensive', cost=40, checked_at=1)
+    cheap = _candidate('cheap', cost=5, checked_at=2)
+    planned, deferred = plan([expensive, cheap], budget=10)
+    assert planned == [cheap]
+    assert deferred == [expensive]
+
+
+def test_nothing_to_plan():
+    assert plan([], budget=100) == ([], [])
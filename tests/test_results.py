@@ -0,0 +1,79 @@
+from chalicelib.results import ResultKey
+from chalicelib.results import ResultStore
+
+
+class MemoryResultStore(ResultStore):
+    def __init__(self, document=None):
+        super(MemoryResultStore, self).__init__()
+        self.document = document or {}
+
+    def _read(self):
+        return self.document
+
+    def _write(self, document):
+        self.document = document
+
+
+def _key(version='2.0', chalice='1.2.0'):
+    return ResultKey('requests', version, chalice, 'python3.6')
+
+
+def test_unchanged_success_is_skipped():
+    store = MemoryResultStore()
+    store.record(_key(), True, duration=5)
+    assert store.is_unchanged_success(_key())
+    assert store.checked_at(_key()) is not None
+
+
+def test_new_release_is_checked_again():
+    store = MemoryResultStore()
+    store.record(_key('2.0'), True)
+    assert not store.is_unchanged_success(_key('2.1'))
+    assert store.is_new_release_of_success(_key('2.1'))
+    assert store.checked_at(_key('2.1')) is None
+
+
+def test_failure_is_checked_again():
+    store = MemoryResultStore()
+    store.record(_key(), False)
+    assert not store.is_unchanged_success(_key())
+    assert not store.is_new_release_of_success(_key('2.1'))
+
+
+def test_new_chalice_release_is_a_new_check():
+    store = MemoryResultStore()
+    store.record(_key(chalice='1.2.0'), True)
+    assert not store.is_unchanged_success(_key(chalice='1.3.0'))
+    assert not store.is_new_release_of_success(_key(chalice='1.3.0'))
+
+
+def test_unknown_version_is_neither_skipped_nor_recorded():
+    store = MemoryResultStore()
+    store.record(_key(None), True)
+    assert store.checked_at(_key(None)) is None
+    assert not store.is_unchanged_success(_key(None))
+    store.record(_key('2.0'), True)
+    store.record(_key(None), False)
+    assert store.is_unchanged_success(_key('2.0'))
+    assert not store.is_new_release_of_success(_key(None))
+
+
+def test_expected_cost_survives_verdicts_without_a_duration():
+    store = MemoryResultStore()
+    store.record(_key('2.0'), True, duration=12)
+    store.record(_key('2.1'), True)
+    assert store.expected_cost(_key('2.2')) == 12
+
+
+def test_saved_results_are_loaded_and_retained_by_key():
+    store = MemoryResultStore()
+    store.record(_key(), True)
+    other = ResultKey('Flask', '1.0', '1.2.0', 'python3.6')
+    store.record(other, True)
+    store.save()
+    loaded = MemoryResultStore(store.document)
+    loaded.load()
+    assert loaded.is_unchanged_success(other)
+    loaded.retain([_key()])
+    assert not loaded.is_unchanged_success(other)
+    assert loaded.is_unchanged_success(_key())
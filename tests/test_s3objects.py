@@ -0,0 +1,95 @@
+import io
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+from chalicelib.environment import S3SnapshotStore
+from chalicelib.matrix import FileMatrixSource
+from chalicelib.matrix import S3MatrixSource
+from chalicelib.results import ResultKey
+from chalicelib.results import S3ResultStore
+
+
+def _error(code):
+    return ClientError({'Error': {'Code': code}}, 'GetObject')
+
+
+class FakeClient(object):
+    def __init__(self, missing_code='NoSuchKey'):
+        self.objects = {}
+        self._missing_code = missing_code
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        if Key not in self.objects:
+            raise _error(self._missing_code)
+        data, etag = self.objects[Key]
+        if IfNoneMatch == etag:
+            raise _error('304')
+        return {'Body': io.BytesIO(data), 'ETag': etag}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = (Body, '"%s"' % len(self.objects))
+
+    def download_file(self, Bucket, Key, Filename):
+        if Key not in self.objects:
+            raise _error('404')
+        with open(Filename, 'wb') as f:
+            f.write(self.objects[Key][0])
+
+    def upload_file(self, Filename, Bucket, Key):
+        with open(Filename, 'rb') as f:
+            self.put_object(Bucket, Key, f.read())
+
+
+@pytest.mark.parametrize('code', ['404', 'NoSuchKey'])
+def test_result_store_starts_empty_without_an_object(code):
+    client = FakeClient(code)
+    store = S3ResultStore('bucket', client=client)
+    key = ResultKey('requests', '2.0', '1.2.0', 'python3.6')
+    store.load()
+    assert not store.is_unchanged_success(key)
+    store.record(key, True)
+    store.save()
+    again = S3ResultStore('bucket', client=client)
+    again.load()
+    assert again.is_unchanged_success(key)
+
+
+def test_result_store_raises_other_errors():
+    store = S3ResultStore('bucket', client=FakeClient('AccessDenied'))
+    with pytest.raises(ClientError):
+        store.load()
+
+
+def test_snapshot_store_round_trip(tmp_path):
+    store = S3SnapshotStore('bucket', client=FakeClient())
+    target = str(tmp_path / 'snapshot.tar.gz')
+    assert not store.download('env.tar.gz', target)
+    source = tmp_path / 'source'
+    source.write_bytes(b'snapshot')
+    store.upload(str(source), 'env.tar.gz')
+    assert store.download('env.tar.gz', target)
+    assert open(target, 'rb').read() == b'snapshot'
+
+
+def test_matrix_source_falls_back_until_the_object_exists(tmp_path):
+    path = tmp_path / 'packages.json'
+    path.write_text('["requests"]')
+    client = FakeClient()
+    source = S3MatrixSource('bucket', 'packages.json',
+                            FileMatrixSource(str(path)), client)
+    document, version = source.fetch()
+    assert document == ['requests']
+    assert source.fetch(version) is None
+    client.put_object('bucket', 'packages.json',
+                      json.dumps(['Flask']).encode('utf-8'))
+    document, version = source.fetch(version)
+    assert document == ['Flask']
+    assert source.fetch(version) is None
+
+
+def test_matrix_source_without_fallback_raises_for_a_missing_object():
+    source = S3MatrixSource('bucket', 'packages.json', client=FakeClient())
+    with pytest.raises(KeyError):
+        source.fetch()
@@ -0,0 +1,96 @@
+import time
+import asyncio
+import threading
+
+from chalicelib.scheduler import Scheduler
+
+
+def test_map_returns_results_in_order():
+    scheduler = Scheduler(max_workers=4)
+    assert scheduler.map(lambda item: item * 2, [3, 1, 2]) == [6, 2, 4]
+
+
+def test_longest_expected_item_starts_first():
+    scheduler = Scheduler(max_workers=1)
+    scheduler.set_expected_cost('short', 1)
+    scheduler.set_expected_cost('long', 10)
+    started = []
+    scheduler.map(started.append, ['short', 'long', 'new'])
+    assert started == ['new', 'long', 'short']
+
+
+def test_item_starts_when_its_own_dependencies_are_done():
+    scheduler = Scheduler(max_workers=2)
+    events = []
+    lock = threading.Lock()
+
+    def run(item):
+        name, seconds = item
+        with lock:
+            events.append(('start', name))
+        time.sleep(seconds)
+        with lock:
+            events.append(('end', name))
+        return name
+    # The dependent waits for its dependency only, not for the slow item
+    # that happens to run at the same time.
+    results = scheduler.map(run, [('slow', 0.5), ('dependency', 0.05),
+                                  ('dependent', 0.05)],
+                            after=[[], [], [1]])
+    assert results == ['slow', 'dependency', 'dependent']
+    assert events.index(('end', 'dependency')) < \
+        events.index(('start', 'dependent')) < events.index(('end', 'slow'))
+
+
+def test_dependent_of_a_failed_item_still_runs():
+    scheduler = Scheduler(max_workers=2)
+    ran = []
+
+    def run(item):
+        if item == 'broken':
+            raise RuntimeError(item)
+        ran.append(item)
+    try:
+        scheduler.map(run, ['broken', 'dependent'], after=[[], [0]])
+    except RuntimeError:
+        pass
+    assert ran == ['dependent']
+
+
+def test_map_async_waits_for_dependencies_only():
+    scheduler = Scheduler(max_workers=2)
+    events = []
+
+    async def run(item):
+        name, seconds = item
+        events.append(('start', name))
+        await asyncio.sleep(seconds)
+        events.append(('end', name))
+        return name
+    loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(scheduler.map_async(
+            run, [('slow', 0.5), ('dependency', 0.05), ('dependent', 0.05)],
+            after=[[], [], [1]]))
+    finally:
+        loop.close()
+    assert results == ['slow', 'dependency', 'dependent']
+    assert events.index(('end', 'dependency')) < \
+        events.index(('start', 'dependent')) < events.index(('end', 'slow'))
+
+
+def test_map_async_runs_at_most_max_workers_at_once():
+    scheduler = Scheduler(max_workers=2)
+    running, peak = [0], [0]
+
+    async def run(item):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(scheduler.map_async(run, range(6)))
+    finally:
+        loop.close()
+    assert peak[0] == 2
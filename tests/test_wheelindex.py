@@ -0,0 +1,69 @@
+import pytest
+
+from chalicelib import wheelindex
+from chalicelib.wheelindex import WheelIndex
+from chalicelib.wheelindex import _compatible_wheel
+
+
+@pytest.mark.parametrize('filename, runtime, compatible', [
+    ('six-1.16.0-py2.py3-none-any.whl', 'python3.6', True),
+    ('six-1.16.0-py2.py3-none-any.whl', 'python2.7', True),
+    ('attrs-21.0-py3-none-any.whl', 'python2.7', False),
+    ('pkg-1.0-cp36-none-any.whl', 'python3.6', True),
+    ('pkg-1.0-cp36-cp36m-manylinux1_x86_64.whl', 'python3.6', True),
+    ('pkg-1.0-cp36-cp36m-manylinux1_x86_64.whl', 'python3.7', False),
+    ('pkg-1.0-cp37-cp37m-manylinux1_x86_64.whl', 'python3.6', False),
+    ('pkg-1.0-cp310-cp310-manylinux1_x86_64.whl', 'python3.10', True),
+    ('pkg-1.0-cp36-cp36m-manylinux2014_x86_64.whl', 'python3.6', False),
+    ('pkg-1.0-cp36-cp36m-manylinux1_x86_64.manylinux2014_x86_64.whl',
+     'python3.6', True),
+    ('pkg-1.0-cp36-cp36m-macosx_10_9_x86_64.whl', 'python3.6', False),
+    ('pkg-1.0-cp36-abi3-manylinux1_x86_64.whl', 'python3.8', True),
+    ('pkg-1.0-cp38-abi3-manylinux1_x86_64.whl', 'python3.6', False),
+    ('pkg-1.0.tar.gz', 'python3.6', False),
+])
+def test_compatible_wheel(filename, runtime, compatible):
+    abi = wheelindex.runtime_abi(runtime)
+    assert _compatible_wheel(filename, runtime, abi) is compatible
+
+
+_PROJECTS = {
+    'flask': ('2.0.0', ['Jinja2>=3.0', "pytest; extra == 'testing'"],
+              ['Flask-2.0.0-py3-none-any.whl']),
+    'jinja2': ('3.0.0', ['MarkupSafe>=2.0'],
+               ['Jinja2-3.0.0-py3-none-any.whl']),
+    'markupsafe': ('2.0.1', [],
+                   ['MarkupSafe-2.0.1-cp36-cp36m-manylinux1_x86_64.whl',
+                    'MarkupSafe-2.0.1.tar.gz']),
+    'pycrypto': ('2.6.1', [], ['pycrypto-2.6.1.tar.gz']),
+    'badlib': ('1.0', ['pycrypto'], ['badlib-1.0-py3-none-any.whl']),
+}
+
+
+@pytest.fixture
+def index(monkeypatch):
+    def project_info(name):
+        version, requires, files = _PROJECTS[name.lower()]
+        return {'info': {'name': name, 'version': version,
+                         'requires_dist': requires},
+                'releases': {version: [{'filename': f} for f in files]}}
+    monkeypatch.setattr(wheelindex.pypi, 'project_info', project_info)
+    return WheelIndex()
+
+
+def test_release_and_dependencies_with_wheels(index):
+    assert index.has_wheels('Flask', '2.0.0', 'python3.6') is True
+
+
+def test_dependency_without_a_wheel_for_the_runtime(index):
+    assert index.has_wheels('Flask', '2.0.0', 'python3.7') is None
+
+
+def test_dependency_with_only_an_sdist(index):
+    assert index.has_wheels('badlib', '1.0', 'python3.6') is None
+
+
+def test_verdicts_leave_failed_lookups_undecided(index):
+    assert index.verdicts([('Flask', '2.0.0', 'python3.6'),
+                           ('nosuchpackage', '1.0', 'python3.6')]) == [
+        True, None]
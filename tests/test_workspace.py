@@ -0,0 +1,68 @@
+import os
+import threading
+
+import pytest
+
+from chalicelib.workspace import AdmissionTimeout
+from chalicelib.workspace import Workspace
+from chalicelib.workspace import default_budget
+
+
+def test_check_larger_than_the_budget_runs_alone(tmp_path):
+    workspace = Workspace(str(tmp_path), budget=100, usage={'big': 1000})
+    path = workspace.acquire('big', timeout=0)
+    assert os.path.isdir(path)
+    with pytest.raises(AdmissionTimeout):
+        workspace.acquire('small', timeout=0.1)
+    workspace.release('big', path)
+    workspace.release('small', workspace.acquire('small', timeout=0))
+
+
+def test_checks_that_fit_run_together(tmp_path):
+    workspace = Workspace(str(tmp_path), budget=100,
+                          usage={'a': 40, 'b': 40, 'c': 40})
+    a = workspace.acquire('a', timeout=0)
+    b = workspace.acquire('b', timeout=0)
+    with pytest.raises(AdmissionTimeout):
+        workspace.acquire('c', timeout=0.1)
+    workspace.release('a', a)
+    workspace.release('c', workspace.acquire('c', timeout=0))
+    workspace.release('b', b)
+
+
+def test_release_removes_the_project_and_learns_its_usage(tmp_path):
+    usage = {}
+    workspace = Workspace(str(tmp_path / 'projects'), budget=10 ** 9,
+                          usage=usage)
+    with workspace.project('requests') as path:
+        with open(os.path.join(path, 'file'), 'wb') as f:
+            f.write(b'x' * 5000)
+    assert not os.path.exists(path)
+    assert usage['requests'] >= 5000
+    assert workspace.expected_usage('requests') == usage['requests']
+
+
+def test_release_admits_a_waiting_check(tmp_path):
+    workspace = Workspace(str(tmp_path), budget=100,
+                          usage={'a': 80, 'b': 80})
+    a = workspace.acquire('a', timeout=0)
+    admitted = []
+
+    def wait_for_b():
+        path = workspace.acquire('b', timeout=10)
+        admitted.append(path)
+        workspace.release('b', path)
+    waiter = threading.Thread(target=wait_for_b)
+    waiter.start()
+    waiter.join(0.2)
+    assert admitted == []
+    workspace.release('a', a)
+    waiter.join(10)
+    assert len(admitted) == 1
+
+
+def test_configured_budget(tmp_path, monkeypatch):
+    monkeypatch.setenv('CANARY_DISK_BUDGET_MB', '3')
+    assert default_budget(str(tmp_path)) == 3 * 1024 * 1024
+    monkeypatch.delenv('CANARY_DISK_BUDGET_MB')
+    assert 0 < default_budget(str(tmp_path))